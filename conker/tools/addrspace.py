@@ -0,0 +1,255 @@
+# Address translation for a ROM version.
+#
+# There are three address spaces:
+#  - rom:   offset into baserom.<version>.z64
+#  - image: offset into the decompressed, combined conker.<version>.bin
+#           (header + boot + init + game + debugger)
+#  - vram:  where the code/data runs (0x15000000 game, 0x16000000 debugger, ...)
+#
+# image <-> vram comes from the code segments in conker.<version>.yaml.
+# image <-> rom comes from the root conker.<version>.yaml; where the game is
+# rzip-compressed, each 4096-byte chunk of code (and the single data entry)
+# only maps as a whole, to the start of its compressed bytes.
+#
+# Every function takes a scalar or an array of addresses and looks them all
+# up with one np.searchsorted; unmapped addresses come back as UNMAPPED.
+
+import os
+import struct
+
+import numpy as np
+import yaml
+
+from mapfile import parse_map
+
+UNMAPPED = -1
+
+CHUNK_SIZE = 4096
+XOR_KEY = 0x8039CCCA
+
+
+def segment_start(entry):
+    return entry["start"] if type(entry) is dict else entry[0]
+
+
+def code_segments(config):
+    # name, start, end, vram & bss_size of every code segment in the conker/ yaml
+    ret = []
+    entries = config["segments"]
+    for i, entry in enumerate(entries):
+        if type(entry) is dict and entry.get("type") == "code" and "vram" in entry:
+            ret.append({
+                "name": entry["name"],
+                "start": entry["start"],
+                "end": segment_start(entries[i + 1]),
+                "vram": entry["vram"],
+                "bss_size": entry.get("bss_size", 0),
+            })
+    return ret
+
+
+def read_symbol_addrs(path):
+    names = {}
+    if os.path.isfile(path):
+        with open(path, "r") as f:
+            for line in f:
+                if "=" not in line:
+                    continue
+                name, value = line.split("=", 1)
+                try:
+                    names[name.strip()] = int(value.split(";")[0].strip(), 0)
+                except ValueError:
+                    continue
+    return names
+
+
+def game_rzip_regions(rom_start, rzip, rzip_config, game_start, code_size, game_size):
+    # (rom_start, rom_end, image_start, image_end) for each compressed entry
+    entries = rzip_config["segments"]
+    data_index = next(i for i, entry in enumerate(entries) if type(entry) is dict and entry.get("name") == "data")
+    data_start, data_end = segment_start(entries[data_index]), segment_start(entries[data_index + 1])
+
+    chunks = (code_size + CHUNK_SIZE - 1) // CHUNK_SIZE
+    offsets = [XOR_KEY ^ x for x in struct.unpack(f">{chunks + 1}I", rzip[4:4 + (chunks + 1) * 4])]
+    regions = []
+    for i in range(chunks):
+        regions.append((rom_start + offsets[i], rom_start + offsets[i + 1],
+                        game_start + i * CHUNK_SIZE, game_start + min((i + 1) * CHUNK_SIZE, code_size)))
+    regions.append((rom_start + data_start, rom_start + data_end, game_start + code_size, game_start + game_size))
+    return regions
+
+
+class AddressSpace:
+    def __init__(self, segments, regions=None, symbols=None):
+        # image <-> vram
+        segments = sorted(segments, key=lambda s: s["start"])
+        self.segments = segments
+        self.image_starts = np.array([s["start"] for s in segments], dtype=np.int64)
+        self.image_ends = np.array([s["end"] for s in segments], dtype=np.int64)
+        self.vrams = np.array([s["vram"] for s in segments], dtype=np.int64)
+        by_vram = np.argsort(self.vrams, kind="stable")
+        self.vram_order = by_vram
+        self.vram_starts = self.vrams[by_vram]
+        self.vram_ends = (self.vrams + self.image_ends - self.image_starts)[by_vram]
+        self.vram_limits = self.vram_ends + np.array([s["bss_size"] for s in segments], dtype=np.int64)[by_vram]
+
+        # image <-> rom; regions are (rom_start, rom_end, image_start, image_end, compressed)
+        self.regions = sorted(regions, key=lambda r: r[2]) if regions else None
+        if self.regions:
+            table = np.array([r[:4] for r in self.regions], dtype=np.int64)
+            self.compressed = np.array([r[4] for r in self.regions], dtype=bool)
+            self.region_image = table[:, 2:4]
+            self.region_image_rom = table[:, 0]
+            rom_order = np.argsort(table[:, 0], kind="stable")
+            self.region_rom = table[rom_order, 0:2]
+            self.region_rom_image = table[rom_order, 2]
+            self.region_rom_compressed = self.compressed[rom_order]
+
+        # vram -> name
+        symbols = symbols or {}
+        names = sorted(symbols.items(), key=lambda x: x[1])
+        self.symbol_names = [name for name, _ in names]
+        self.symbol_vrams = np.array([vram for _, vram in names], dtype=np.int64)
+        self.symbols = symbols
+
+    @staticmethod
+    def _lookup(starts, ends, values):
+        # index of the [start, end) range containing each value, or -1
+        values = np.asarray(values, dtype=np.int64)
+        index = np.searchsorted(starts, values, side="right") - 1
+        safe = np.clip(index, 0, None)
+        found = (index >= 0) & (values < ends[safe]) if len(starts) else np.zeros(values.shape, dtype=bool)
+        return values, np.where(found, index, -1)
+
+    @staticmethod
+    def _result(values):
+        return int(values) if values.ndim == 0 else values
+
+    def image_to_vram(self, offsets):
+        offsets, index = self._lookup(self.image_starts, self.image_ends, offsets)
+        safe = np.clip(index, 0, None)
+        return self._result(np.where(index >= 0, offsets - self.image_starts[safe] + self.vrams[safe], UNMAPPED))
+
+    def vram_to_image(self, vrams):
+        # bss has no image offset
+        vrams, index = self._lookup(self.vram_starts, self.vram_ends, vrams)
+        segment = self.vram_order[np.clip(index, 0, None)]
+        return self._result(np.where(index >= 0, vrams - self.vrams[segment] + self.image_starts[segment], UNMAPPED))
+
+    def segment_of_image(self, offsets):
+        _, index = self._lookup(self.image_starts, self.image_ends, offsets)
+        return [self.segments[i]["name"] if i >= 0 else None for i in np.atleast_1d(index)]
+
+    def image_to_rom(self, offsets):
+        # offsets within a compressed entry give the start of the entry
+        if self.regions is None:
+            raise ValueError("rom layout not loaded")
+        offsets, index = self._lookup(self.region_image[:, 0], self.region_image[:, 1], offsets)
+        safe = np.clip(index, 0, None)
+        delta = np.where(self.compressed[safe], 0, offsets - self.region_image[safe, 0])
+        return self._result(np.where(index >= 0, self.region_image_rom[safe] + delta, UNMAPPED))
+
+    def rom_to_image(self, offsets):
+        # offsets within a compressed entry give the start of its decompressed bytes
+        if self.regions is None:
+            raise ValueError("rom layout not loaded")
+        offsets, index = self._lookup(self.region_rom[:, 0], self.region_rom[:, 1], offsets)
+        safe = np.clip(index, 0, None)
+        delta = np.where(self.region_rom_compressed[safe], 0, offsets - self.region_rom[safe, 0])
+        return self._result(np.where(index >= 0, self.region_rom_image[safe] + delta, UNMAPPED))
+
+    def rom_is_compressed(self, offsets):
+        # True where the rom offset is inside a compressed entry
+        if self.regions is None:
+            raise ValueError("rom layout not loaded")
+        offsets, index = self._lookup(self.region_rom[:, 0], self.region_rom[:, 1], offsets)
+        found = (index >= 0) & self.region_rom_compressed[np.clip(index, 0, None)]
+        return bool(found) if found.ndim == 0 else found
+
+    def rom_to_vram(self, offsets):
+        image = np.asarray(self.rom_to_image(offsets))
+        return self._result(np.where(image >= 0, np.asarray(self.image_to_vram(image)), UNMAPPED))
+
+    def vram_to_rom(self, vrams):
+        image = np.asarray(self.vram_to_image(vrams))
+        return self._result(np.where(image >= 0, np.asarray(self.image_to_rom(image)), UNMAPPED))
+
+    def vram_to_symbol(self, vrams):
+        # [(name, offset)] of the closest symbol at or before each address, in the same segment
+        vrams, segment = self._lookup(self.vram_starts, self.vram_limits, np.atleast_1d(vrams))
+        index = np.searchsorted(self.symbol_vrams, vrams, side="right") - 1
+        if len(self.symbol_vrams):
+            _, symbol_segment = self._lookup(self.vram_starts, self.vram_limits, self.symbol_vrams[np.clip(index, 0, None)])
+            index = np.where((index >= 0) & (segment >= 0) & (segment == symbol_segment), index, -1)
+        ret = []
+        for vram, i in zip(vrams.tolist(), index.tolist()):
+            ret.append((self.symbol_names[i], vram - int(self.symbol_vrams[i])) if i >= 0 else (None, None))
+        return ret
+
+    def symbol_to_vram(self, name):
+        return self.symbols.get(name)
+
+
+def load_segments(version, base_dir="."):
+    with open(os.path.join(base_dir, f"conker.{version}.yaml"), "r") as f:
+        return code_segments(yaml.safe_load(f.read()))
+
+
+def load_regions(version, segments, root_dir=".."):
+    # None if the root yaml/rzip are not available
+    config_path = os.path.join(root_dir, f"conker.{version}.yaml")
+    if not os.path.isfile(config_path):
+        return None
+    with open(config_path, "r") as f:
+        entries = yaml.safe_load(f.read())["segments"]
+    pieces = {}
+    for i, entry in enumerate(entries):
+        if type(entry) is dict and "name" in entry:
+            pieces[entry["name"].split(".")[0]] = (entry["start"], segment_start(entries[i + 1]), entry["name"])
+
+    starts = {s["name"]: s["start"] for s in segments}
+    game_start, game_end = starts["game"], starts["debugger"]
+    regions = []
+    for name in ("header", "boot", "init", "debugger"):
+        rom_start, rom_end, _ = pieces[name]
+        image_start = {"header": 0, "boot": 0x40, "init": 0x1000, "debugger": game_end}[name]
+        regions.append((rom_start, rom_end, image_start, image_start + rom_end - rom_start, False))
+
+    rom_start, rom_end, game_name = pieces["game"]
+    if not game_name.endswith(".rzip"):
+        regions.append((rom_start, rom_end, game_start, game_end, False))
+        return regions
+
+    rzip_path = os.path.join(root_dir, "assets", f"{game_name}.bin")
+    if os.path.isfile(rzip_path):
+        with open(rzip_path, "rb") as f:
+            rzip = f.read(0x1000)
+    else:
+        rom_path = os.path.join(root_dir, f"baserom.{version}.z64")
+        if not os.path.isfile(rom_path):
+            return None
+        with open(rom_path, "rb") as f:
+            f.seek(rom_start)
+            rzip = f.read(0x1000)
+    with open(os.path.join(root_dir, f"{game_name}.yaml"), "r") as f:
+        rzip_config = yaml.safe_load(f.read())
+    code_size = starts["game_data"] - game_start
+    for region in game_rzip_regions(rom_start, rzip, rzip_config, game_start, code_size, game_end - game_start):
+        regions.append(region + (True,))
+    return regions
+
+
+def load_symbols(version, base_dir=".", mapfile=None):
+    symbols = read_symbol_addrs(os.path.join(base_dir, f"symbol_addrs.{version}.txt"))
+    mapfile = mapfile or os.path.join(base_dir, "build", f"conker.{version}.map")
+    if os.path.isfile(mapfile):
+        for name, symbol in parse_map(mapfile)[0].items():
+            symbols[name] = symbol["ram"]
+    return symbols
+
+
+def load(version, base_dir=".", root_dir="..", mapfile=None, rom=True):
+    # base_dir is conker/, root_dir the repo root (for the rom layout)
+    segments = load_segments(version, base_dir)
+    regions = load_regions(version, segments, root_dir) if rom else None
+    return AddressSpace(segments, regions, load_symbols(version, base_dir, mapfile))
@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+import fcntl
+import io
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+# Drop-in replacement for `python3 asm_processor.py ...` in the Makefile.
+#
+# The first call of a build starts a server that imports asm-processor once
+# and stays up until the build has been idle for a few seconds; every call
+# (this thin client) forwards its arguments over a unix socket and gets back
+# asm-processor's output. The functions parsed while pre-processing a file
+# are kept and handed to its --post-process step, so the source is not parsed
+# twice. If the server cannot be reached, asm-processor is run in-process.
+#
+# Whatever asm-processor prints is passed back to the client that asked, so
+# make shows the same output as when it runs asm_processor.py directly; only
+# what the programs it runs (the assembler) print goes to build/asmproc.log.
+
+ASM_PROCESSOR_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.realpath(__file__)))),
+                                 "tools", "asm-processor")
+SOCKET = "build/asmproc.sock"
+LOCK = "build/asmproc.lock"
+LOG = "build/asmproc.log"
+IDLE_TIMEOUT = 5
+START_TIMEOUT = 10
+
+
+def load_asm_processor():
+    sys.path.insert(0, ASM_PROCESSOR_DIR)
+    import asm_processor
+    return asm_processor
+
+
+class Output:
+    # stdout of one request, text or bytes
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(data if isinstance(data, bytes) else data.encode("latin1"))
+
+    def flush(self):
+        pass
+
+    @property
+    def buffer(self):
+        return self
+
+    def getvalue(self):
+        return b"".join(self.chunks)
+
+
+class ThreadStream:
+    # stands in for sys.stdout/sys.stderr in the server, sending what each
+    # request thread writes to that request rather than to the log
+    def __init__(self, fallback):
+        self.fallback = fallback
+        self.local = threading.local()
+
+    def set(self, target):
+        self.local.target = target
+
+    def target(self):
+        return getattr(self.local, "target", None) or self.fallback
+
+    def write(self, data):
+        return self.target().write(data)
+
+    def flush(self):
+        self.target().flush()
+
+    @property
+    def buffer(self):
+        target = self.target()
+        return getattr(target, "buffer", target)
+
+
+def run_asm_processor(asm_processor, argv, functions=None, out=None):
+    # (functions, stdout bytes) of one asm_processor.py invocation
+    out = out or Output()
+    if "--post-process" in argv:
+        asm_processor.run(argv, functions=functions)
+        return None, out.getvalue()
+    result = asm_processor.run(argv, outfile=out)
+    # newer asm-processor returns (functions, deps)
+    if isinstance(result, tuple):
+        result = result[0]
+    return result, out.getvalue()
+
+
+def source_key(argv):
+    # [flags..., source] of a pre-processing call, or the same prefix of a post-processing one
+    if "--post-process" in argv:
+        argv = argv[:argv.index("--post-process")]
+    return tuple(argv)
+
+
+def serve():
+    import socketserver
+
+    asm_processor = load_asm_processor()
+    stdout = sys.stdout = ThreadStream(sys.stdout)
+    stderr = sys.stderr = ThreadStream(sys.stderr)
+    parsed = {}
+    lock = threading.Lock()
+    state = {"active": 0, "last": time.time()}
+
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            argv = json.loads(self.rfile.readline())["argv"]
+            key = source_key(argv)
+            source = key[-1] if key else None
+            functions = None
+            # either way the parse is used at most once: a pre-process replaces whatever a
+            # previous one left behind (e.g. its cc step failed) & a post-process takes it
+            with lock:
+                entry = parsed.pop(key, None)
+            if "--post-process" in argv and entry and source and os.path.getmtime(source) == entry[0]:
+                functions = entry[1]
+            out = Output()
+            err = io.StringIO()
+            stdout.set(out)
+            stderr.set(err)
+            try:
+                mtime = os.path.getmtime(source) if source and os.path.isfile(source) else None
+                functions, _ = run_asm_processor(asm_processor, argv, functions, out)
+                if functions is not None:
+                    with lock:
+                        parsed[key] = (mtime, functions)
+                status = 0
+            except SystemExit as e:
+                if isinstance(e.code, str):
+                    # sys.exit("message") prints it
+                    err.write(e.code + "\n")
+                status = e.code if isinstance(e.code, int) else 1
+            except Exception as e:
+                err.write(f"Error: {e}\n")
+                status = 1
+            finally:
+                stdout.set(None)
+                stderr.set(None)
+            # like a failed process, nothing of a failed run goes to stdout
+            output = out.getvalue() if status == 0 else b""
+            reply = {"status": status, "stderr": err.getvalue(), "length": len(output)}
+            self.wfile.write(json.dumps(reply).encode() + b"\n" + output)
+
+    class Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+        # server_close() waits for the requests in flight, a post-process
+        # must not be cut off while it rewrites the .o
+        daemon_threads = False
+        block_on_close = True
+
+        def verify_request(self, request, client_address):
+            # counted as soon as it is accepted, before its thread starts, so
+            # the idle check cannot miss it
+            with lock:
+                state["active"] += 1
+            return True
+
+        def shutdown_request(self, request):
+            # once for every accepted request, after its handler returned
+            with lock:
+                state["active"] -= 1
+                state["last"] = time.time()
+            super().shutdown_request(request)
+
+    if os.path.exists(SOCKET):
+        os.unlink(SOCKET)
+    server = Server(SOCKET, Handler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+    try:
+        while True:
+            time.sleep(0.5)
+            with lock:
+                if state["active"] == 0 and time.time() - state["last"] > IDLE_TIMEOUT:
+                    # new clients start another server from here on
+                    if os.path.exists(SOCKET):
+                        os.unlink(SOCKET)
+                    break
+    finally:
+        server.shutdown()
+        server.server_close()
+    return 0
+
+
+def request(argv):
+    # reply & stdout from the server, None if there is no server
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(SOCKET)
+    except OSError:
+        sock.close()
+        return None
+    try:
+        with sock, sock.makefile("rwb") as f:
+            f.write(json.dumps({"argv": argv}).encode() + b"\n")
+            f.flush()
+            reply = json.loads(f.readline())
+            return reply, f.read(reply["length"])
+    except (OSError, ValueError):
+        # server went away before replying
+        return None
+
+
+def start_server():
+    # one server per build directory, whichever client gets here first starts it
+    os.makedirs(os.path.dirname(SOCKET), exist_ok=True)
+    with open(LOCK, "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(SOCKET)
+            return True
+        except OSError:
+            # left behind by a server that did not shut down cleanly
+            if os.path.exists(SOCKET):
+                os.unlink(SOCKET)
+        finally:
+            sock.close()
+        with open(LOG, "a") as log:
+            subprocess.Popen([sys.executable, os.path.realpath(__file__), "--serve"],
+                             stdin=subprocess.DEVNULL, stdout=log, stderr=log, start_new_session=True)
+        deadline = time.time() + START_TIMEOUT
+        while time.time() < deadline:
+            if os.path.exists(SOCKET):
+                return True
+            time.sleep(0.01)
+    return False
+
+
+def main(argv):
+    result = request(argv)
+    if result is None and start_server():
+        result = request(argv)
+    if result is None:
+        # no server, do it here
+        asm_processor = load_asm_processor()
+        try:
+            _, output = run_asm_processor(asm_processor, argv)
+        except Exception as e:
+            print(f"Error: {e}", file=sys.stderr)
+            return 1
+        sys.stdout.buffer.write(output)
+        return 0
+    reply, output = result
+    sys.stdout.buffer.write(output)
+    sys.stderr.write(reply["stderr"])
+    return reply["status"]
+
+
+if __name__ == '__main__':
+    if sys.argv[1:] == ["--serve"]:
+        sys.exit(serve())
+    sys.exit(main(sys.argv[1:]))
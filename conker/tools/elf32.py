@@ -0,0 +1,145 @@
+import struct
+
+# Minimal big-endian ELF32 reader, enough to pull sections, symbols and
+# relocations out of the MIPS objects IDO/as produce.
+
+SHT_SYMTAB = 2
+SHT_RELA = 4
+SHT_REL = 9
+
+STT_FUNC = 2
+STT_SECTION = 3
+
+R_MIPS_32 = 2
+R_MIPS_26 = 4
+R_MIPS_HI16 = 5
+R_MIPS_LO16 = 6
+R_MIPS_GPREL16 = 7
+
+# bits of an instruction/word filled in by the linker for each relocation
+RELOC_MASKS = {
+    R_MIPS_32: 0xFFFFFFFF,
+    R_MIPS_26: 0x03FFFFFF,
+    R_MIPS_HI16: 0x0000FFFF,
+    R_MIPS_LO16: 0x0000FFFF,
+    R_MIPS_GPREL16: 0x0000FFFF,
+}
+
+
+class Section:
+    def __init__(self, index, name, type, offset, size, link, info, entsize, data):
+        self.index = index
+        self.name = name
+        self.type = type
+        self.offset = offset
+        self.size = size
+        self.link = link
+        self.info = info
+        self.entsize = entsize
+        self.data = data
+
+
+class Symbol:
+    def __init__(self, name, value, size, info, shndx):
+        self.name = name
+        self.value = value
+        self.size = size
+        self.type = info & 0xF
+        self.bind = info >> 4
+        self.shndx = shndx
+
+
+class ElfFile:
+    def __init__(self, data):
+        if data[:4] != b"\x7fELF" or data[4] != 1 or data[5] != 2:
+            raise ValueError("not a big-endian ELF32 file")
+        (_, _, _, _, _, shoff, _, _, _, _, shentsize, shnum, shstrndx) = struct.unpack(">HHIIIIIHHHHHH", data[16:52])
+
+        headers = [struct.unpack(">IIIIIIIIII", data[shoff + i * shentsize:shoff + i * shentsize + 40]) for i in range(shnum)]
+        shstrtab = headers[shstrndx]
+        strings = data[shstrtab[4]:shstrtab[4] + shstrtab[5]]
+
+        self.sections = []
+        for i, (name, type, _, _, offset, size, link, info, _, entsize) in enumerate(headers):
+            section_data = b"" if type == 8 else data[offset:offset + size] # SHT_NOBITS
+            self.sections.append(Section(i, get_string(strings, name), type, offset, size, link, info, entsize, section_data))
+
+        self.symbols = []
+        for section in self.sections:
+            if section.type == SHT_SYMTAB:
+                self.symbols = parse_symbols(section, self.sections[section.link].data)
+                break
+
+    def section(self, name):
+        for section in self.sections:
+            if section.name == name:
+                return section
+        return None
+
+    def relocations(self, name):
+        # (offset, type, symbol) for every relocation applied to section 'name'
+        target = self.section(name)
+        if target is None:
+            return []
+        ret = []
+        for section in self.sections:
+            if section.type not in (SHT_REL, SHT_RELA) or section.info != target.index:
+                continue
+            entsize = 8 if section.type == SHT_REL else 12
+            for i in range(0, section.size, entsize):
+                offset, info = struct.unpack(">II", section.data[i:i + 8])
+                ret.append((offset, info & 0xFF, info >> 8))
+        return ret
+
+    def functions(self, name=".text"):
+        # (name, offset, size) of each function in section 'name', sizes
+        # derived from the following symbol when the assembler left them 0
+        target = self.section(name)
+        if target is None:
+            return []
+        symbols = sorted((s for s in self.symbols
+                          if s.shndx == target.index and s.name and s.type != STT_SECTION
+                          and not s.name.startswith(".")
+                          # skip local labels
+                          and (s.type == STT_FUNC or s.bind != 0)),
+                         key=lambda s: s.value)
+        ret = []
+        for i, symbol in enumerate(symbols):
+            size = symbol.size
+            if size == 0:
+                end = target.size
+                for following in symbols[i + 1:]:
+                    if following.value > symbol.value:
+                        end = following.value
+                        break
+                size = end - symbol.value
+            ret.append((symbol.name, symbol.value, size))
+        return ret
+
+
+def get_string(strings, offset):
+    end = strings.find(b"\0", offset)
+    return strings[offset:end].decode("latin1")
+
+
+def parse_symbols(section, strings):
+    ret = []
+    for i in range(0, section.size, 16):
+        name, value, size, info, _, shndx = struct.unpack(">IIIBBH", section.data[i:i + 16])
+        ret.append(Symbol(get_string(strings, name), value, size, info, shndx))
+    return ret
+
+
+def read_elf(path):
+    with open(path, "rb") as f:
+        return ElfFile(f.read())
+
+
+def mask_relocations(data, relocations, base=0):
+    # zero the linker-filled bits of 'data', which starts at 'base' within the section
+    words = list(struct.unpack(f">{len(data) // 4}I", data[:len(data) // 4 * 4]))
+    for offset, type, _ in relocations:
+        i = (offset - base) // 4
+        if 0 <= i < len(words):
+            words[i] &= ~RELOC_MASKS.get(type, 0) & 0xFFFFFFFF
+    return words
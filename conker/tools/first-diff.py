@@ -3,6 +3,9 @@ import os.path
 import argparse
 from subprocess import check_call
 
+import addrspace
+from mapfile import parse_map
+
 # TODO: -S argument for shifted ROMs
 
 parser = argparse.ArgumentParser(
@@ -96,99 +99,42 @@ if mybin == basebin:
     exit(0)
 
 
-def search_map(rom_addr):
-    ram_offset = None
-    last_ram = 0
-    last_rom = 0
-    last_fn = "<start of rom>"
-    last_file = "<no file>"
-    prev_line = ""
-    with open(mymap) as f:
-        for line in f:
-            if "load address" in line:
-                # Example: ".boot           0x0000000004000000     0x1000 load address 0x0000000000000000"
-                if "noload" in line or "noload" in prev_line:
-                    ram_offset = None
-                    continue
-                ram = int(line[16 : 16 + 18], 0)
-                rom = int(line[59 : 59 + 18], 0)
-                ram_offset = ram - rom
-                continue
-            prev_line = line
+space = None
+map_symbols = None
 
-            if (
-                ram_offset is None
-                or "=" in line
-                or "*fill*" in line
-                or " 0x" not in line
-            ):
-                continue
-            ram = int(line[16 : 16 + 18], 0)
-            rom = ram - ram_offset
-            fn = line.split()[-1]
-            if "0x" in fn:
-                ram_offset = None
-                continue
-            if rom > rom_addr or (rom_addr & 0x80000000 and ram > rom_addr):
-                return f"in {last_fn} (ram 0x{last_ram:08x}, rom 0x{last_rom:06x}, {last_file})"
-            last_ram = ram
-            last_rom = rom
-            last_fn = fn
-            if "/" in fn:
-                last_file = fn
-    return "at end of rom?"
 
+def load_map():
+    global space, map_symbols
+    if space is None:
+        space = addrspace.load(version, mapfile=mymap, rom=False)
+        map_symbols = parse_map(mymap)[0]
 
-def parse_map(fname):
-    ram_offset = None
-    cur_file = "<no file>"
-    syms = {}
-    prev_sym = None
-    prev_line = ""
-    with open(fname) as f:
-        for line in f:
-            if "load address" in line:
-                if "noload" in line or "noload" in prev_line:
-                    ram_offset = None
-                    continue
-                ram = int(line[16 : 16 + 18], 0)
-                rom = int(line[59 : 59 + 18], 0)
-                ram_offset = ram - rom
-                continue
-            prev_line = line
 
-            if (
-                ram_offset is None
-                or "=" in line
-                or "*fill*" in line
-                or " 0x" not in line
-            ):
-                continue
-            ram = int(line[16 : 16 + 18], 0)
-            rom = ram - ram_offset
-            fn = line.split()[-1]
-            if "0x" in fn:
-                ram_offset = None
-            elif "/" in fn:
-                cur_file = fn
-            else:
-                syms[fn] = (rom, cur_file, prev_sym, ram)
-                prev_sym = fn
-    return syms
+def search_map(rom_addr):
+    # rom_addr is an offset into conker.<version>.bin, or a ram address
+    load_map()
+    ram = rom_addr if rom_addr >= 0x10000000 else space.image_to_vram(rom_addr)
+    fn, offset = space.vram_to_symbol(ram)[0]
+    if fn is None:
+        return "at end of rom?"
+    ram -= offset
+    rom = space.vram_to_image(ram)
+    file = map_symbols[fn]["object"] if fn in map_symbols else "<no file>"
+    return f"in {fn} (ram 0x{ram:08x}, rom 0x{rom:06x}, {file})"
 
 
 def map_diff():
-    map1 = parse_map(mymap)
-    map2 = parse_map(basemap)
+    map1 = parse_map(mymap)[0]
+    map2 = parse_map(basemap)[0]
     min_ram = None
     found = None
+    prev_sym = None
     for sym, addr in map1.items():
-        if sym not in map2:
-            continue
-        if addr[0] != map2[sym][0]:
-            if min_ram is None or addr[0] < min_ram:
-                min_ram = addr[0]
-                found = (sym, addr[1], addr[2])
+        if sym in map2 and addr["rom"] != map2[sym]["rom"]:
+            if min_ram is None or addr["rom"] < min_ram:
+                min_ram = addr["rom"]
+                found = (sym, addr["object"], prev_sym)
+        prev_sym = sym
     if min_ram is None:
         return False
     else:
@@ -216,14 +162,14 @@ if args.by_name:
         addr = int(args.by_name, 0)
         print(args.by_name, "is", search_map(addr))
     except ValueError:
-        m = parse_map(mymap)
+        m = parse_map(mymap)[0]
         try:
             print(
                 args.by_name,
                 "is at position",
-                hex(m[args.by_name][0]),
+                hex(m[args.by_name]["rom"]),
                 "in ROM,",
-                hex(m[args.by_name][3]),
+                hex(m[args.by_name]["ram"]),
                 "in RAM",
             )
         except KeyError:
@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+import argparse
+import hashlib
+import os
+import re
+import sys
+import time
+
+from concurrent.futures import ProcessPoolExecutor
+
+# Matches functions between versions by hashing each function's instruction
+# words from the split asm, with the address-dependent bits masked out
+# (jump targets, %hi/%lo immediates), then joining the hashes across versions.
+# Names found in one version can then be copied to the others' symbol_addrs.
+
+VERSIONS = ["us", "eu", "debug", "ects"]
+
+# /* 2D4B0 15000000 27BDFFE8 */  addiu     $sp, $sp, -0x18
+INSTRUCTION = re.compile(r"^\s*/\*\s*[0-9A-Fa-f]+\s+([0-9A-Fa-f]+)\s+([0-9A-Fa-f]{8})\s*\*/\s*(\S*)\s*(.*)$")
+GLABEL = re.compile(r"^glabel\s+(\S+)")
+DEFAULT_NAME = re.compile(r"^func_[0-9A-Fa-f]{8}$")
+REGISTER = re.compile(r"\$\w+")
+# identifiers other than registers & local (.L) branch labels
+SYMBOL = re.compile(r"(?<![.\w])[A-Za-z_]\w*")
+
+
+def mask_instruction(word, operands):
+    opcode = word >> 26
+    if opcode in (2, 3):
+        # j / jal
+        return word & 0xFC000000
+    if opcode == 0x0F:
+        # lui, almost always an address
+        return word & 0xFFFF0000
+    if "%" in operands or SYMBOL.search(REGISTER.sub("", operands)):
+        # immediate refers to a symbol
+        return word & 0xFFFF0000
+    return word
+
+
+def parse_asm_file(path):
+    functions = []
+    current = None
+    with open(path, "r") as f:
+        for line in f:
+            match = GLABEL.match(line)
+            if match:
+                current = {"name": match.group(1), "vram": None, "words": []}
+                functions.append(current)
+                continue
+            if current is None:
+                continue
+            match = INSTRUCTION.match(line)
+            if match:
+                vram, word, _, operands = match.groups()
+                if current["vram"] is None:
+                    current["vram"] = int(vram, 16)
+                current["words"].append(mask_instruction(int(word, 16), operands))
+    return [f for f in functions if f["words"]]
+
+
+def index_version(asm_dir):
+    index = {}
+    for root, dirs, files in os.walk(asm_dir):
+        for file in files:
+            if not file.endswith(".s"):
+                continue
+            for function in parse_asm_file(os.path.join(root, file)):
+                words = function["words"]
+                digest = hashlib.sha1(b"".join(w.to_bytes(4, "big") for w in words)).hexdigest()
+                # a function may appear twice (split asm + nonmatchings)
+                index.setdefault(digest, {})[function["vram"]] = function["name"]
+    return index
+
+
+def join_indexes(indexes):
+    # digest -> {version: [(vram, name), ...]}
+    joined = {}
+    for version, index in indexes.items():
+        for digest, functions in index.items():
+            joined.setdefault(digest, {})[version] = sorted(functions.items())
+    return joined
+
+
+def read_symbol_addrs(path):
+    names = {}
+    if not os.path.isfile(path):
+        return names
+    with open(path, "r") as f:
+        for line in f:
+            match = re.match(r"^\s*(\S+)\s*=\s*(0x[0-9A-Fa-f]+)\s*;", line)
+            if match:
+                names[match.group(1)] = int(match.group(2), 16)
+    return names
+
+
+def seed_symbols(joined, versions, write):
+    # copy non-default names to versions where the twin is still func_XXXXXXXX
+    additions = {version: [] for version in versions}
+    for functions in joined.values():
+        if any(len(entries) != 1 for entries in functions.values()):
+            # ambiguous, e.g. several identical stubs
+            continue
+        names = {entries[0][1] for entries in functions.values() if not DEFAULT_NAME.match(entries[0][1])}
+        if len(names) != 1:
+            continue
+        name = names.pop()
+        for version, entries in functions.items():
+            if DEFAULT_NAME.match(entries[0][1]):
+                additions[version].append((name, entries[0][0]))
+
+    for version, symbols in additions.items():
+        path = f"symbol_addrs.{version}.txt"
+        existing = read_symbol_addrs(path)
+        known_addrs = set(existing.values())
+        new = [(name, vram) for name, vram in sorted(symbols, key=lambda x: x[1])
+               if name not in existing and vram not in known_addrs]
+        for name, vram in new:
+            print(f"{version}: {name} = 0x{vram:08X}")
+        if write and new:
+            with open(path, "a") as f:
+                for name, vram in new:
+                    f.write(f"{name:<32}= 0x{vram:08X};\n")
+    return additions
+
+
+def main(asm_dirs, write, show_all):
+    start = time.perf_counter()
+    versions = list(asm_dirs.keys())
+    with ProcessPoolExecutor() as executor:
+        indexes = dict(zip(versions, executor.map(index_version, asm_dirs.values())))
+    joined = join_indexes(indexes)
+
+    shared = 0
+    for digest, functions in sorted(joined.items(), key=lambda x: min(v for e in x[1].values() for v, _ in e)):
+        if len(functions) < 2:
+            continue
+        shared += 1
+        if show_all:
+            print("  ".join(f"{version}:{name}@0x{vram:08X}" for version in versions
+                            for vram, name in functions.get(version, [])))
+
+    for version, index in indexes.items():
+        print(f"{version}: {sum(len(f) for f in index.values())} function(s)")
+    print(f"{shared} function(s) found in more than one version ({time.perf_counter() - start:.2f}s)")
+
+    seed_symbols(joined, versions, write)
+
+
+def parse_asm_dirs(values):
+    ret = {}
+    for version in VERSIONS:
+        path = f"../build/versions/{version}/conker/asm"
+        if os.path.isdir(path):
+            ret[version] = path
+    for value in values:
+        version, path = value.split("=", 1)
+        ret[version] = path
+    return ret
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Find equivalent functions across ROM versions',
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--asm', type=str, action='append', default=[],
+                        help='VERSION=DIR of split asm, e.g. us=asm (default: ../build/versions/*/conker/asm)')
+    parser.add_argument('--all', action='store_true',
+                        help='list every function found in more than one version')
+    parser.add_argument('--write', action='store_true',
+                        help='append the names found to symbol_addrs.<version>.txt')
+    args = parser.parse_args()
+
+    asm_dirs = parse_asm_dirs(args.asm)
+    if len(asm_dirs) < 2:
+        print("Need split asm for at least two versions, see --asm")
+        sys.exit(1)
+
+    main(asm_dirs, args.write, args.all)
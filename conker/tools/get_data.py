@@ -2,26 +2,7 @@ import struct
 import sys
 import argparse
 
-game_data_start = {
-    'us':    0x002275E0,
-    'eu':    0x00228130,
-    'debug': 0x002190F0,
-    'ects':  0x001F65C0,
-}
-
-game_data_vram = {
-    'us':    0x80082B20,
-    'eu':    0x80082EB0,
-    'debug': 0x8005B0F0,
-    'ects':  0x8018C0E0,
-}
-
-debugger_start = {
-    'us':    0x00255880,
-    'eu':    0x00256450,
-    'debug': 0x00248510,
-    'ects':  0x00224500
-}
+import addrspace
 
 def pretty_print(data, offset, is_variable=True, is_string=False):
     data_length = len(data)
@@ -58,15 +39,13 @@ def variable_to_offset(variable, version):
         print('Unsupport variable name: %s' % variable)
         return 0
     offset = int(variable[2:], 16)
-    if offset < 0x80000000:
-        print('debugger data')
-        return debugger_start[version] + offset - 0x16000000
-    elif offset < game_data_vram[version]:
-        print('init data')
-        return offset - 0x80000000
-    else:
-        print('game data')
-        return game_data_start[version] + offset - game_data_vram[version]
+    space = addrspace.load(version, rom=False)
+    start = space.vram_to_image(offset)
+    if start == addrspace.UNMAPPED:
+        print('%s is not in any segment (bss?)' % variable)
+        return 0
+    print('%s data' % space.segment_of_image(start)[0])
+    return start
 
 def main(infile, user_input, length=64, version='us', is_string=False):
     data = infile.read()
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+import argparse
+import json
+import os
+import struct
+import sys
+import time
+
+import addrspace
+from elf32 import read_elf, RELOC_MASKS
+
+# Signature database for identifying libultra/libc functions.
+#
+# 'build' takes the objects built from src/libultra & asm/libultra (whose relocations say
+# exactly which bits the linker fills in) and stores each function's words
+# and mask. 'scan' looks for them in conker.<version>.bin: every signature
+# is indexed by a run of fully unmasked words (its anchor), so one pass of
+# dict lookups over the image finds all candidates, which are then checked
+# in full under the mask.
+
+ANCHOR_WORDS = 4
+MIN_WORDS = 4
+
+
+def signature_from_object(name, data, offset, size, relocations):
+    count = size // 4
+    words = list(struct.unpack(f">{count}I", data[offset:offset + count * 4]))
+    masks = [0xFFFFFFFF] * count
+    for reloc_offset, type, _ in relocations:
+        i = (reloc_offset - offset) // 4
+        if 0 <= i < count:
+            masks[i] &= ~RELOC_MASKS.get(type, 0) & 0xFFFFFFFF
+    # trailing nops are alignment padding, not part of the function
+    while count > 0 and words[count - 1] == 0:
+        count -= 1
+    words, masks = words[:count], masks[:count]
+    if count < MIN_WORDS:
+        return None
+
+    # longest run of fully fixed words, up to ANCHOR_WORDS
+    best_start, best_length, run_start = 0, 0, 0
+    for i in range(count + 1):
+        if i == count or masks[i] != 0xFFFFFFFF:
+            if min(i - run_start, ANCHOR_WORDS) > best_length:
+                best_start, best_length = run_start, min(i - run_start, ANCHOR_WORDS)
+            run_start = i + 1
+    if best_length < 2:
+        return None
+
+    return {
+        "name": name,
+        "words": [f"{w & m:08X}" for w, m in zip(words, masks)],
+        "masks": [f"{m:08X}" for m in masks],
+        "anchor": best_start,
+        "anchor_length": best_length,
+    }
+
+
+def build(object_dirs, outfile):
+    signatures = {}
+    for object_dir in object_dirs:
+        for root, dirs, files in os.walk(object_dir):
+            for file in sorted(files):
+                if not file.endswith(".o"):
+                    continue
+                elf = read_elf(os.path.join(root, file))
+                text = elf.section(".text")
+                if text is None:
+                    continue
+                relocations = elf.relocations(".text")
+                for name, offset, size in elf.functions(".text"):
+                    if name.startswith("func_"):
+                        # not identified
+                        continue
+                    signature = signature_from_object(name, text.data, offset, size, relocations)
+                    if signature:
+                        signatures[name] = signature
+    with open(outfile, "w") as f:
+        json.dump(sorted(signatures.values(), key=lambda s: s["name"]), f, indent=1)
+    print(f"Wrote {len(signatures)} signature(s) to {outfile}")
+
+
+def load_signatures(path):
+    with open(path, "r") as f:
+        signatures = json.load(f)
+    for signature in signatures:
+        signature["words"] = [int(w, 16) for w in signature["words"]]
+        signature["masks"] = [int(m, 16) for m in signature["masks"]]
+    return signatures
+
+
+def index_signatures(signatures):
+    index = {}
+    for signature in signatures:
+        anchor, length = signature["anchor"], signature["anchor_length"]
+        key = struct.pack(f">{length}I", *signature["words"][anchor:anchor + length])
+        index.setdefault((length, key), []).append(signature)
+    return index
+
+
+def scan(data, signatures):
+    index = index_signatures(signatures)
+    lengths = sorted({length for length, _ in index})
+    hits = {}
+    for pos in range(0, len(data) - 4, 4):
+        for length in lengths:
+            candidates = index.get((length, data[pos:pos + length * 4]))
+            if not candidates:
+                continue
+            for signature in candidates:
+                start = pos - signature["anchor"] * 4
+                count = len(signature["words"])
+                if start < 0 or start + count * 4 > len(data):
+                    continue
+                words = struct.unpack(f">{count}I", data[start:start + count * 4])
+                if all(w & m == s for w, m, s in zip(words, signature["masks"], signature["words"])):
+                    hits.setdefault(signature["name"], set()).add(start)
+    return hits
+
+
+def read_symbol_addrs(path):
+    names = {}
+    if os.path.isfile(path):
+        with open(path, "r") as f:
+            for line in f:
+                if "=" in line:
+                    names[line.split("=")[0].strip()] = line
+    return names
+
+
+def main_scan(db, version, outfile):
+    start_time = time.perf_counter()
+    with open(f"conker.{version}.bin", "rb") as f:
+        data = f.read()
+    space = addrspace.AddressSpace(addrspace.load_segments(version))
+    signatures = load_signatures(db)
+    hits = scan(data, signatures)
+    known = read_symbol_addrs(f"symbol_addrs.{version}.txt")
+
+    lines = []
+    for name, offsets in sorted(hits.items(), key=lambda x: min(x[1])):
+        if len(offsets) > 1:
+            print(f"// {name}: ambiguous, {len(offsets)} matches")
+            continue
+        vram = space.image_to_vram(min(offsets))
+        if vram == addrspace.UNMAPPED or name in known:
+            continue
+        lines.append(f"{name:<32}= 0x{vram:08X};")
+    print("\n".join(lines))
+    print(f"// {len(hits)}/{len(signatures)} signature(s) found, {len(lines)} new, {time.perf_counter() - start_time:.2f}s")
+
+    if outfile:
+        with open(outfile, "w") as f:
+            f.write("\n".join(lines) + "\n")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Build/scan libultra function signatures',
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    build_parser = subparsers.add_parser('build', help='create signatures from built libultra objects')
+    build_parser.add_argument('objects', type=str, nargs='*', default=['build/src/libultra', 'build/asm/libultra'],
+                              help='directories of .o files (default: build/src/libultra build/asm/libultra)')
+    build_parser.add_argument('--db', type=str, default='build/libultra_sigs.json',
+                              help='signature database to write')
+
+    scan_parser = subparsers.add_parser('scan', help='search conker.<version>.bin for known functions')
+    scan_parser.add_argument('--db', type=str, default='build/libultra_sigs.json',
+                             help='signature database to read')
+    scan_parser.add_argument('--version', type=str, default='us',
+                             help='ROM version, us/eu/debug/ects')
+    scan_parser.add_argument('--output', type=str,
+                             help='write candidate symbol_addrs entries to this file')
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        build(args.objects, args.db)
+    else:
+        if not os.path.isfile(args.db):
+            print(f"{args.db} not found, run '{sys.argv[0]} build' first")
+            sys.exit(1)
+        main_scan(args.db, args.version, args.output)
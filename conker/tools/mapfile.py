@@ -0,0 +1,111 @@
+# Parser for the GNU ld .map files written to build/conker.<version>.map
+#
+# Returns every symbol with its ram & rom address and every input section
+# (i.e. ".text 0x15000000 0x3d0 build/src/game_xxx.c.o") with its placement.
+# rom addresses are offsets into conker.<version>.bin.
+
+def parse_map(path):
+    symbols = {}
+    sections = []
+
+    ram_offset = None
+    current = None
+    pending = None
+    prev_line = ""
+    with open(path, "r") as f:
+        for line in f:
+            tokens = line.split()
+            if "load address" in line:
+                # ".boot  0x0000000004000000  0x1000 load address 0x0000000000000000"
+                if "noload" in line or "noload" in prev_line:
+                    ram_offset = None
+                    continue
+                ram = next(int(token, 16) for token in tokens if token.startswith("0x"))
+                rom = int(tokens[tokens.index("load") + 2], 16)
+                ram_offset = ram - rom
+                prev_line = line
+                continue
+            prev_line = line
+
+            if ram_offset is None or "=" in line or "*fill*" in line:
+                pending = None
+                continue
+
+            if pending and tokens and tokens[0].startswith("0x"):
+                # section name was too long and wrapped onto its own line
+                tokens = [pending] + tokens
+            pending = None
+
+            if len(tokens) == 1 and line.startswith(" ."):
+                pending = tokens[0]
+                continue
+
+            if len(tokens) >= 4 and tokens[0].startswith(".") and tokens[1].startswith("0x") and tokens[2].startswith("0x"):
+                ram = int(tokens[1], 16)
+                current = {
+                    "section": tokens[0],
+                    "ram": ram,
+                    "rom": ram - ram_offset,
+                    "size": int(tokens[2], 16),
+                    "object": tokens[3],
+                }
+                sections.append(current)
+            elif len(tokens) == 2 and tokens[0].startswith("0x") and not tokens[1].startswith("0x"):
+                ram = int(tokens[0], 16)
+                symbols[tokens[1]] = {
+                    "ram": ram,
+                    "rom": ram - ram_offset,
+                    "object": current["object"] if current else None,
+                    "section": current["section"] if current else None,
+                }
+    return symbols, sections
+
+
+def object_sections(sections):
+    # object -> {section name: section}
+    ret = {}
+    for section in sections:
+        ret.setdefault(section["object"], {})[section["section"]] = section
+    return ret
+
+
+def parse_layout(path):
+    # every input section, noload (.bss) ones included, in map order, with the
+    # output section it was placed in and the symbols defined in it:
+    # {"segment": ".init", "section": ".text", "object": ..., "ram": ..., "size": ...,
+    #  "symbols": [(name, ram), ...]}
+    ret = []
+    segment = None
+    current = None
+    pending = None
+    with open(path, "r") as f:
+        for line in f:
+            tokens = line.split()
+            if not tokens:
+                continue
+            if line[0] == ".":
+                segment = tokens[0]
+                current = None
+                pending = None
+                continue
+
+            if pending and tokens[0].startswith("0x"):
+                tokens = [pending] + tokens
+            pending = None
+
+            if len(tokens) == 1 and line.startswith(" ."):
+                pending = tokens[0]
+            elif len(tokens) >= 4 and tokens[0].startswith(".") and tokens[1].startswith("0x") and tokens[2].startswith("0x"):
+                current = {
+                    "segment": segment,
+                    "section": tokens[0],
+                    "object": tokens[3],
+                    "ram": int(tokens[1], 16),
+                    "size": int(tokens[2], 16),
+                    "symbols": [],
+                }
+                ret.append(current)
+            elif (current is not None and len(tokens) == 2 and tokens[0].startswith("0x")
+                  and not tokens[1].startswith("0x") and "=" not in line):
+                current["symbols"].append((tokens[1], int(tokens[0], 16)))
+    return ret
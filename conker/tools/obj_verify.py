@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+import argparse
+import mmap
+import os
+import sys
+import time
+
+from concurrent.futures import ProcessPoolExecutor
+
+from elf32 import read_elf, mask_relocations
+from mapfile import parse_map, object_sections
+
+# Checks freshly built objects function by function against the extracted
+# (uncompressed) code in conker.<version>.bin, using the addresses from the
+# last link's map. Relocated bits are masked on both sides, so no link,
+# compression or full ROM checksum is needed.
+
+def find_changed_objects(build_dir, since):
+    ret = []
+    for root, dirs, files in os.walk(build_dir):
+        for file in files:
+            if file.endswith(".c.o"):
+                path = os.path.join(root, file)
+                if os.path.getmtime(path) > since:
+                    ret.append(path)
+    return sorted(ret)
+
+
+def verify_object(obj_path, text_rom, symbol_roms, baseimg):
+    with open(baseimg, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as base:
+        return compare_functions(read_elf(obj_path), text_rom, symbol_roms, base)
+
+
+def compare_functions(elf, text_rom, symbol_roms, base):
+    # per-function status of elf's .text against 'base' (conker.<version>.bin)
+    text = elf.section(".text")
+    if text is None:
+        return []
+    relocations = elf.relocations(".text")
+
+    ret = []
+    for name, offset, size in elf.functions(".text"):
+        rom = symbol_roms.get(name, None if text_rom is None else text_rom + offset)
+        if rom is None:
+            ret.append({"function": name, "status": "MISSING", "size": size})
+            continue
+        built = mask_relocations(text.data[offset:offset + size], relocations, offset)
+        target = mask_relocations(base[rom:rom + size], relocations, offset)
+        diffs = [i for i, (a, b) in enumerate(zip(built, target)) if a != b]
+        if len(built) != len(target):
+            diffs.append(min(len(built), len(target)))
+        result = {"function": name, "status": "OK" if len(diffs) == 0 else "DIFF", "size": size, "rom": rom}
+        if diffs:
+            result["first"] = diffs[0] * 4
+            result["count"] = len(diffs)
+        ret.append(result)
+    return ret
+
+
+def object_symbols(symbols):
+    # object -> {symbol: rom} from parse_map's symbols
+    ret = {}
+    for name, symbol in symbols.items():
+        ret.setdefault(symbol["object"], {})[name] = symbol["rom"]
+    return ret
+
+
+def main(objects, version, baseimg, mapfile, jobs, quiet):
+    start = time.perf_counter()
+    symbols, sections = parse_map(mapfile)
+    placements = object_sections(sections)
+
+    roms = object_symbols(symbols)
+
+    tasks = []
+    for obj in objects:
+        key = os.path.normpath(obj)
+        text = placements.get(key, {}).get(".text")
+        tasks.append((obj, None if text is None else text["rom"], roms.get(key, {})))
+
+    failed = 0
+    total = 0
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = [executor.submit(verify_object, obj, text_rom, symbol_roms, baseimg) for obj, text_rom, symbol_roms in tasks]
+        for (obj, _, _), future in zip(tasks, futures):
+            for result in future.result():
+                total += 1
+                if result["status"] != "OK":
+                    failed += 1
+                elif quiet:
+                    continue
+                line = f"{result['status']:<8}{result['function']:<40}{obj}"
+                if result["status"] == "DIFF":
+                    line += f"  first difference at +0x{result['first']:X}, {result['count']} word(s)"
+                print(line)
+
+    elapsed = time.perf_counter() - start
+    print(f"{total - failed}/{total} function(s) match in {len(objects)} object(s) ({elapsed:.2f}s)")
+    return 0 if failed == 0 else 1
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Verify built objects function by function without linking',
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('objects', type=str, nargs='*',
+                        help='.c.o files to check (default: those newer than the last link)')
+    parser.add_argument('--version', type=str, default='us',
+                        help='ROM version, us/eu/debug/ects')
+    parser.add_argument('--jobs', type=int,
+                        help='number of worker processes')
+    parser.add_argument('--quiet', action='store_true',
+                        help='only list functions that do not match')
+    args = parser.parse_args()
+
+    baseimg = f"conker.{args.version}.bin"
+    mapfile = f"build/conker.{args.version}.map"
+    if os.path.isfile("expected/" + mapfile):
+        mapfile = "expected/" + mapfile
+    for path in (baseimg, mapfile):
+        if not os.path.isfile(path):
+            print(f"{path} must exist, run 'make extract' and 'make' first")
+            sys.exit(1)
+
+    objects = args.objects
+    if not objects:
+        elf = f"build/conker.{args.version}.elf"
+        objects = find_changed_objects("build", os.path.getmtime(elf) if os.path.isfile(elf) else 0)
+        if not objects:
+            print("No objects changed since the last link")
+            sys.exit(0)
+
+    sys.exit(main(objects, args.version, baseimg, mapfile, args.jobs, args.quiet))
@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+import argparse
+import difflib
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+import time
+
+from concurrent.futures import ProcessPoolExecutor
+
+from elf32 import read_elf, mask_relocations
+from mapfile import parse_map
+from obj_verify import object_symbols
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+import diff_settings
+
+# Scores every commented-out C attempt left under a GLOBAL_ASM pragma, i.e.
+#
+#   #pragma GLOBAL_ASM("asm/nonmatchings/<file>/<function>.s")
+#   // NON-MATCHING: <note>
+#   // <C>
+#
+# Each source file is recompiled once with all of its attempts swapped in
+# (with make's own recipe, so asm-processor and per-file flags still apply),
+# and every attempt is compared instruction by instruction against the target
+# bytes in conker.<version>.bin, with asm-differ's penalties, on a process
+# pool. The ranked output puts the near misses first.
+
+PENALTY_STACKDIFF = 1
+PENALTY_REGALLOC = 5
+PENALTY_REORDERING = 60
+PENALTY_INSERTION = 100
+PENALTY_DELETION = 100
+
+PRAGMA = re.compile(r'^#pragma\s+GLOBAL_ASM\("([^"]+/([^/"]+)\.s)"\)')
+NOTE = re.compile(r"^//\s*NON[-_ ]MATCHING:?\s*(.*)$", re.IGNORECASE)
+
+SCORE_DIR = "build/score"
+
+
+def find_attempts(path):
+    # {function: (pragma line index, last line index, C, note)}
+    with open(path, "r", encoding="latin1") as f:
+        lines = f.read().split("\n")
+    ret = {}
+    for i, line in enumerate(lines):
+        match = PRAGMA.match(line)
+        if not match or i + 1 >= len(lines):
+            continue
+        note = NOTE.match(lines[i + 1])
+        if not note:
+            continue
+        body = []
+        j = i + 2
+        while j < len(lines) and lines[j].startswith("//"):
+            body.append(re.sub(r"^// ?", "", lines[j]))
+            j += 1
+        function = match.group(2)
+        if any(function + "(" in line for line in body):
+            ret[function] = (i, j - 1, "\n".join(body), note.group(1).strip())
+    return ret, lines
+
+
+def make_variant(lines, attempts, functions):
+    # the source with the given functions' pragmas replaced by their attempts
+    out = list(lines)
+    for function in sorted(functions, key=lambda x: -attempts[x][0]):
+        start, end, body, _ = attempts[function]
+        out[start:end + 1] = body.split("\n")
+    return "\n".join(out)
+
+
+def compile_commands(version, source, obj):
+    # make's recipe for obj, e.g. asm-processor, cc, asm-processor --post-process
+    proc = subprocess.run(["make", "-n", "-B", f"VERSION={version}", obj],
+                          stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, universal_newlines=True)
+    if proc.returncode != 0:
+        return None
+    return [line for line in proc.stdout.split("\n") if line.strip() and not line.startswith("make")]
+
+
+def retarget(commands, source, obj, variant, variant_obj):
+    # point the recipe at the variant source, its intermediate & object
+    replacements = {obj: variant_obj, obj[:-2]: variant[:-2] + ".pre.c", source: variant}
+    pattern = re.compile(r"(?<![\w./])(" + "|".join(re.escape(x) for x in sorted(replacements, key=len, reverse=True)) + r")(?![\w.])")
+    return [pattern.sub(lambda m: replacements[m.group(1)], command) for command in commands]
+
+
+def instruction_key(word):
+    # what must be equal for two instructions to be the same instruction
+    op = word >> 26
+    if op == 0:
+        return (op, word & 0x3F)
+    if op == 1:
+        return (op, (word >> 16) & 0x1F)
+    if op == 0x11:
+        return (op, (word >> 21) & 0x1F, word & 0x3F)
+    return (op,)
+
+
+def instruction_penalty(a, b):
+    if a == b:
+        return 0
+    op = a >> 26
+    if op not in (0, 1, 0x11) and (a ^ b) & 0xFFFF0000 == 0 and (a >> 21) & 0x1F == 29:
+        # different stack offset
+        return PENALTY_STACKDIFF
+    return PENALTY_REGALLOC
+
+
+def score(target, built):
+    # asm-differ style: 0 is a match
+    target_keys = [instruction_key(w) for w in target]
+    built_keys = [instruction_key(w) for w in built]
+    total = 0
+    missing = []
+    extra = []
+    matcher = difflib.SequenceMatcher(None, target_keys, built_keys, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            total += sum(instruction_penalty(a, b) for a, b in zip(target[i1:i2], built[j1:j2]))
+        else:
+            missing += target[i1:i2]
+            extra += built[j1:j2]
+    # instructions present on both sides, but elsewhere
+    pool = {}
+    for word in extra:
+        pool[word] = pool.get(word, 0) + 1
+    reordered = 0
+    for word in missing:
+        if pool.get(word, 0):
+            pool[word] -= 1
+            reordered += 1
+    total += reordered * PENALTY_REORDERING
+    total += (len(missing) - reordered) * PENALTY_DELETION
+    total += (len(extra) - reordered) * PENALTY_INSERTION
+    return total
+
+
+def function_words(elf, name):
+    text = elf.section(".text")
+    for function, offset, size in elf.functions(".text"):
+        if function == name:
+            return mask_relocations(text.data[offset:offset + size], elf.relocations(".text"), offset), size
+    return None, 0
+
+
+def build_variant(commands, source, obj, lines, attempts, functions, index):
+    name = os.path.splitext(source)[0] + (f".{index}" if index is not None else "")
+    variant = os.path.join(SCORE_DIR, name + ".c")
+    variant_obj = os.path.join(SCORE_DIR, name + ".c.o")
+    os.makedirs(os.path.dirname(variant), exist_ok=True)
+    with open(variant, "w", encoding="latin1") as f:
+        f.write(make_variant(lines, attempts, functions))
+    for command in retarget(commands, source, obj, variant, variant_obj):
+        if subprocess.run(command, shell=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL).returncode != 0:
+            return None
+    return variant_obj
+
+
+def score_file(version, source, symbol_roms, baseimg):
+    obj = os.path.join("build", source[:-2] + ".c.o")
+    attempts, lines = find_attempts(source)
+    if not attempts or not os.path.isfile(obj):
+        return []
+    original = read_elf(obj)
+    with open(baseimg, "rb") as f:
+        base = f.read()
+
+    # all attempts in one go, then one at a time if that does not compile
+    built = {}
+    commands = compile_commands(version, source, obj)
+    variant_obj = commands and build_variant(commands, source, obj, lines, attempts, list(attempts), None)
+    if variant_obj:
+        elf = read_elf(variant_obj)
+        built = {function: elf for function in attempts}
+    elif commands:
+        for index, function in enumerate(sorted(attempts)):
+            variant_obj = build_variant(commands, source, obj, lines, attempts, [function], index)
+            if variant_obj:
+                built[function] = read_elf(variant_obj)
+
+    results = []
+    for function, (_, _, body, note) in sorted(attempts.items()):
+        result = {"function": function, "source": source, "note": note}
+        target_words, size = function_words(original, function)
+        rom = symbol_roms.get(function)
+        if target_words is None or rom is None:
+            result["status"] = "no target"
+        elif function not in built:
+            result["status"] = "compile error"
+        else:
+            # target bytes masked with the original (GLOBAL_ASM) object's relocations
+            relocations = original.relocations(".text")
+            offset = next(offset for name, offset, _ in original.functions(".text") if name == function)
+            target = mask_relocations(base[rom:rom + size], relocations, offset)
+            attempt, _ = function_words(built[function], function)
+            if attempt is None:
+                result["status"] = "not built"
+            else:
+                result["score"] = score(target, attempt)
+                result["max"] = len(target) * PENALTY_DELETION
+                result["size"] = size
+                result["status"] = "OK" if result["score"] == 0 else "DIFF"
+        results.append(result)
+    return results
+
+
+def find_sources(source_dirs):
+    ret = []
+    for source_dir in source_dirs:
+        for root, dirs, files in os.walk(source_dir):
+            dirs.sort()
+            for name in sorted(files):
+                if name.endswith(".c"):
+                    ret.append(os.path.normpath(os.path.join(root, name)))
+    return ret
+
+
+def main(version, baseimg, mapfile, sources, jobs, top, outfile):
+    start = time.perf_counter()
+    symbols, _ = parse_map(mapfile)
+    roms = object_symbols(symbols)
+    shutil.rmtree(SCORE_DIR, ignore_errors=True)
+
+    sources = [source for source in sources if find_attempts(source)[0]]
+    with ProcessPoolExecutor(jobs) as executor:
+        futures = [executor.submit(score_file, version, source,
+                                   roms.get(os.path.join("build", source[:-2] + ".c.o"), {}), baseimg)
+                   for source in sources]
+        results = [result for future in futures for result in future.result()]
+
+    scored = sorted((r for r in results if "score" in r), key=lambda r: (r["score"] / max(r["max"], 1), r["score"]))
+    print(f"{'score':>7}{'match':>8}{'size':>7}  {'function':<32}{'source':<32}note")
+    for result in scored[:top]:
+        match = 1 - result["score"] / result["max"] if result["max"] else 0
+        print(f"{result['score']:>7}{match:>8.1%}{result['size']:>7}  {result['function']:<32}{result['source']:<32}{result['note']}")
+    for result in results:
+        if "score" not in result:
+            print(f"{result['status']:>22}  {result['function']:<32}{result['source']:<32}{result['note']}")
+
+    matched = sum(1 for r in scored if r["score"] == 0)
+    print(f"{len(results)} attempt(s) in {len(sources)} file(s), {len(scored)} scored, {matched} matching "
+          f"({time.perf_counter() - start:.2f}s)")
+
+    if outfile:
+        with open(outfile, "w") as f:
+            json.dump(scored + [r for r in results if "score" not in r], f, indent=1)
+    return 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Score every NON-MATCHING C attempt against its target',
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('sources', type=str, nargs='*',
+                        help='.c files to score (default: every file in the source directories)')
+    parser.add_argument('--version', type=str, default=diff_settings.VERSION,
+                        help='ROM version, us/eu/debug/ects')
+    parser.add_argument('--jobs', type=int,
+                        help='number of worker processes')
+    parser.add_argument('--top', type=int, default=1000,
+                        help='number of ranked attempts to list')
+    parser.add_argument('--output', type=str,
+                        help='write all results as json')
+    args = parser.parse_args()
+
+    diff_settings.VERSION = args.version
+    config = {}
+    diff_settings.apply(config, args)
+    for path in (config['baseimg'], config['mapfile']):
+        if not os.path.isfile(path):
+            print(f"{path} must exist, run 'make extract' and 'make' first")
+            sys.exit(1)
+
+    src_dir = "src" if args.version == "us" else f"src_{args.version}"
+    sources = args.sources or find_sources([src_dir])
+    sys.exit(main(args.version, config['baseimg'], config['mapfile'], sources, args.jobs, args.top, args.output))
@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+import argparse
+import os
+import sys
+import time
+
+from mapfile import parse_layout
+
+# Compares two link maps (by default the expected one against the last build)
+# and reports what grew or shrank: totals per segment & section kind, then per
+# object and per function, followed by every point where the addresses of the
+# following symbols start to shift, and by how much in total.
+
+SECTIONS = [".text", ".data", ".rodata", ".bss"]
+
+
+def segment_name(output_section):
+    # .init/.init_data/.init_bss -> init
+    return output_section.lstrip(".").split("_")[0]
+
+
+def summarise(layout):
+    # (segment, section) -> size, (segment, section, object) -> size,
+    # (segment, section, function) -> (size, object), symbol -> (ram, segment, object)
+    totals = {}
+    objects = {}
+    functions = {}
+    symbols = {}
+    for placement in layout:
+        if placement["section"] not in SECTIONS:
+            continue
+        segment = segment_name(placement["segment"])
+        key = (segment, placement["section"])
+        totals[key] = totals.get(key, 0) + placement["size"]
+        key = (segment, placement["section"], placement["object"])
+        objects[key] = objects.get(key, 0) + placement["size"]
+        end = placement["ram"] + placement["size"]
+        entries = placement["symbols"]
+        for i, (name, ram) in enumerate(entries):
+            following = entries[i + 1][1] if i + 1 < len(entries) else end
+            functions[(segment, placement["section"], name)] = (following - ram, placement["object"])
+            symbols[name] = (ram, segment, placement["object"])
+    return totals, objects, functions, symbols
+
+
+def deltas(old, new, value=lambda x: x):
+    ret = []
+    for key in list(old.keys()) + [key for key in new.keys() if key not in old]:
+        before = value(old[key]) if key in old else None
+        after = value(new[key]) if key in new else None
+        if before != after:
+            ret.append((key, before, after))
+    return ret
+
+
+def shift_points(old_symbols, new_symbols):
+    # symbols (in new address order) at which the shift relative to old changes
+    ret = []
+    shifts = {}
+    previous = None
+    for name, (ram, segment, obj) in sorted(new_symbols.items(), key=lambda x: x[1][0]):
+        if name not in old_symbols or old_symbols[name][1] != segment:
+            continue
+        shift = ram - old_symbols[name][0]
+        if shift != shifts.get(segment, 0):
+            ret.append((segment, name, obj, previous, shifts.get(segment, 0), shift))
+            shifts[segment] = shift
+        previous = name
+    return ret
+
+
+def size(value):
+    return "-" if value is None else f"0x{value:X}"
+
+
+def change(before, after):
+    return f"{(after or 0) - (before or 0):+d}"
+
+
+def main(old_map, new_map, top, brief):
+    start = time.perf_counter()
+    old_totals, old_objects, old_functions, old_symbols = summarise(parse_layout(old_map))
+    new_totals, new_objects, new_functions, new_symbols = summarise(parse_layout(new_map))
+
+    keys = list(new_totals) + [key for key in old_totals if key not in new_totals]
+    segments = list(dict.fromkeys(segment for segment, _ in keys))
+    if brief:
+        keys = [key for key in keys if old_totals.get(key) != new_totals.get(key)]
+    if keys:
+        print(f"{'segment':<10}{'section':<9}{'old':>10}{'new':>10}{'delta':>9}")
+    for segment, section in sorted(keys, key=lambda x: (segments.index(x[0]), SECTIONS.index(x[1]))):
+        before, after = old_totals.get((segment, section)), new_totals.get((segment, section))
+        print(f"{segment:<10}{section:<9}{size(before):>10}{size(after):>10}{change(before, after):>9}")
+
+    if not brief:
+        objects = deltas(old_objects, new_objects)
+        if objects:
+            print(f"\nObjects ({len(objects)} changed):")
+            for (segment, section, obj), before, after in objects[:top]:
+                print(f"  {change(before, after):>7}  {segment}{section:<9}{obj}  ({size(before)} -> {size(after)})")
+
+        functions = deltas(old_functions, new_functions, lambda x: x[0])
+        if functions:
+            print(f"\nSymbols ({len(functions)} changed):")
+            for (segment, section, name), before, after in functions[:top]:
+                obj = (new_functions.get((segment, section, name)) or old_functions[(segment, section, name)])[1]
+                status = " (new)" if before is None else " (removed)" if after is None else ""
+                print(f"  {change(before, after):>7}  {segment}{section:<9}{name:<40}{obj}{status}")
+
+    points = shift_points(old_symbols, new_symbols)
+    if points:
+        print(f"\nShifts ({len(points)}):")
+        for segment, name, obj, previous, before, after in points[:top]:
+            print(f"  {segment:<10}{after:+#x} (was {before:+#x}) from {name} ({obj}), after {previous}")
+    elif not brief:
+        print("\nNo symbols shifted")
+
+    print(f"{old_map} -> {new_map} ({time.perf_counter() - start:.2f}s)")
+    return 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Report section size changes and symbol shifts between two maps',
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('maps', type=str, nargs='*',
+                        help='OLD NEW maps (default: expected/build/conker.<version>.map build/conker.<version>.map)')
+    parser.add_argument('--version', type=str, default='us',
+                        help='ROM version, us/eu/debug/ects')
+    parser.add_argument('--top', type=int, default=50,
+                        help='number of objects/symbols/shifts to list')
+    parser.add_argument('--brief', action='store_true',
+                        help='only changed totals & the shift points')
+    args = parser.parse_args()
+
+    if len(args.maps) == 2:
+        old_map, new_map = args.maps
+    elif not args.maps:
+        new_map = f"build/conker.{args.version}.map"
+        old_map = f"expected/{new_map}"
+    else:
+        parser.error("expected OLD NEW maps")
+
+    for path in (old_map, new_map):
+        if not os.path.isfile(path):
+            print(f"{path} not found")
+            sys.exit(1)
+
+    sys.exit(main(old_map, new_map, args.top, args.brief))
@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+import argparse
+import os
+import queue
+import re
+import subprocess
+import sys
+import time
+
+from watchdog.events import FileSystemEventHandler
+from watchdog.observers import Observer
+
+from elf32 import ElfFile, mask_relocations
+from mapfile import parse_map, object_sections
+from obj_verify import compare_functions, object_symbols
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+import diff_settings
+
+# Watches the source directories from diff_settings.py and, whenever a .c or
+# .h file is saved, rebuilds only the objects that include it (via make, so
+# asm-processor and the per-file OPT_FLAGS still apply) and checks them
+# function by function against conker.<version>.bin.
+#
+# The baserom, the parsed map and the masked words of every function from the
+# previous build stay in memory, so each save costs one compile plus a few
+# comparisons, and the output says what changed since the last save.
+
+SRC_DIRS = {
+    "us": "src",
+    "eu": "src_eu",
+    "ects": "src_ects",
+    "debug": "src_debug",
+}
+
+# matches -I in the Makefile's INCLUDE_CFLAGS
+INCLUDE_DIRS = [".", "include", "include/2.0L", "include/2.0L/PR", "include/libc",
+                "src/libultra/os", "src/libultra/audio", "src/libultra/io"]
+
+INCLUDE = re.compile(r'^\s*#\s*include\s*[<"]([^>"]+)[>"]', re.MULTILINE)
+
+SETTLE_TIME = 0.05
+
+
+class IncludeGraph:
+    # header -> .c files that (transitively) include it, rescanned per file on change
+
+    def __init__(self, source_dirs):
+        self.includes = {}
+        for source_dir in source_dirs:
+            for root, dirs, files in os.walk(source_dir):
+                for name in files:
+                    if name.endswith((".c", ".h")):
+                        self.update(os.path.normpath(os.path.join(root, name)))
+
+    def update(self, path):
+        try:
+            with open(path, "r", encoding="latin1") as f:
+                text = f.read()
+        except OSError:
+            self.includes.pop(path, None)
+            return
+        found = set()
+        for name in INCLUDE.findall(text):
+            for directory in [os.path.dirname(path)] + INCLUDE_DIRS:
+                candidate = os.path.normpath(os.path.join(directory, name))
+                if os.path.isfile(candidate):
+                    found.add(candidate)
+                    break
+        self.includes[path] = found
+
+    def sources_for(self, path):
+        if path.endswith(".c"):
+            return {path}
+        users = {}
+        for source, headers in self.includes.items():
+            for header in headers:
+                users.setdefault(header, set()).add(source)
+        ret = set()
+        seen = {path}
+        pending = [path]
+        while pending:
+            for user in users.get(pending.pop(), ()):
+                if user in seen:
+                    continue
+                seen.add(user)
+                if user.endswith(".c"):
+                    ret.add(user)
+                else:
+                    pending.append(user)
+        return ret
+
+
+class Handler(FileSystemEventHandler):
+    def __init__(self, events):
+        self.events = events
+
+    def on_any_event(self, event):
+        # inotify also reports opens & reads, including our own and make's
+        if event.is_directory or event.event_type not in ("modified", "created", "moved", "deleted"):
+            return
+        for path in (event.src_path, getattr(event, "dest_path", "")):
+            if path and path.endswith((".c", ".h")):
+                self.events.put(os.path.normpath(os.path.relpath(path)))
+
+
+class Watcher:
+    def __init__(self, version, baseimg, mapfile, source_dirs, jobs, make_args):
+        self.version = version
+        self.mapfile = mapfile
+        self.jobs = jobs
+        self.make_args = make_args
+        with open(baseimg, "rb") as f:
+            self.base = f.read()
+        self.map_mtime = None
+        self.load_map()
+        self.graph = IncludeGraph(source_dirs)
+        # object -> {function: (masked words, result)}
+        self.previous = {}
+
+    def load_map(self):
+        mtime = os.path.getmtime(self.mapfile)
+        if mtime == self.map_mtime:
+            return
+        symbols, sections = parse_map(self.mapfile)
+        self.placements = object_sections(sections)
+        self.symbol_roms = object_symbols(symbols)
+        self.map_mtime = mtime
+
+    def objects_for(self, paths):
+        sources = set()
+        for path in paths:
+            self.graph.update(path)
+            sources |= self.graph.sources_for(path)
+        return sorted(os.path.join("build", source[:-2] + ".c.o") for source in sources if os.path.isfile(source))
+
+    def build(self, objects):
+        # -B as plain .c.o rules don't list their headers
+        cmd = ["make", "-B", f"VERSION={self.version}", f"-j{self.jobs}"] + self.make_args + objects
+        proc = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        if proc.returncode != 0:
+            sys.stdout.write(proc.stdout.decode("utf-8", "replace"))
+            return False
+        return True
+
+    def check(self, obj):
+        with open(obj, "rb") as f:
+            elf = ElfFile(f.read())
+        text = elf.section(".text")
+        placement = self.placements.get(obj, {}).get(".text")
+        results = compare_functions(elf, None if placement is None else placement["rom"],
+                                    self.symbol_roms.get(obj, {}), self.base)
+
+        previous = self.previous.get(obj, {})
+        current = {}
+        relocations = elf.relocations(".text")
+        offsets = {function: offset for function, offset, _ in elf.functions(".text")}
+        lines = []
+        for result in results:
+            name = result["function"]
+            offset = offsets[name]
+            words = mask_relocations(text.data[offset:offset + result["size"]], relocations, offset)
+            current[name] = (words, result)
+            old_words, old_result = previous.get(name, (None, None))
+            if old_words == words and result["status"] == "OK":
+                continue
+            line = f"{result['status']:<8}{name:<40}"
+            if result["status"] == "DIFF":
+                line += f"first difference at +0x{result['first']:X}, {result['count']} word(s)"
+            if old_result is None:
+                pass
+            elif old_words == words:
+                line += "  (unchanged)"
+            elif old_result.get("count", 0) != result.get("count", 0):
+                line += f"  (was {old_result.get('count', 0)})"
+            else:
+                line += "  (changed)"
+            lines.append(line)
+        self.previous[obj] = current
+        return results, lines
+
+    def rebuild(self, paths):
+        start = time.perf_counter()
+        objects = self.objects_for(paths)
+        if not objects:
+            return
+        print(f"--- {', '.join(sorted(paths))}")
+        if not self.build(objects):
+            print(f"build failed ({time.perf_counter() - start:.2f}s)")
+            return
+        self.load_map()
+        total = 0
+        matched = 0
+        for obj in objects:
+            results, lines = self.check(obj)
+            for line in lines:
+                print(line)
+            total += len(results)
+            matched += sum(1 for result in results if result["status"] == "OK")
+        print(f"{matched}/{total} function(s) match in {len(objects)} object(s) ({time.perf_counter() - start:.2f}s)")
+        sys.stdout.flush()
+
+    def prime(self, objects):
+        # remember the current build so the first save reports changes
+        for obj in objects:
+            if os.path.isfile(obj):
+                self.check(obj)
+
+
+def main(version, baseimg, mapfile, source_dirs, jobs, make_args):
+    watcher = Watcher(version, baseimg, mapfile, source_dirs, jobs, make_args)
+    watcher.prime([obj for obj in watcher.placements if obj.endswith(".c.o")])
+
+    events = queue.Queue()
+    observer = Observer()
+    for source_dir in source_dirs:
+        observer.schedule(Handler(events), source_dir, recursive=True)
+    observer.start()
+    print(f"Watching {', '.join(source_dirs)} (ctrl-c to stop)")
+    sys.stdout.flush()
+
+    try:
+        while True:
+            paths = {events.get()}
+            # editors tend to write a file in several steps
+            time.sleep(SETTLE_TIME)
+            while not events.empty():
+                paths.add(events.get())
+            watcher.rebuild(paths)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        observer.stop()
+        observer.join()
+    return 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Rebuild and verify objects as their sources are saved',
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--version', type=str, default=diff_settings.VERSION,
+                        help='ROM version, us/eu/debug/ects')
+    parser.add_argument('--jobs', type=int, default=os.cpu_count(),
+                        help='make -j for rebuilding several objects')
+    parser.add_argument('make_args', type=str, nargs='*',
+                        help='extra make arguments, e.g. NON_MATCHING=1')
+    args = parser.parse_args()
+
+    diff_settings.VERSION = args.version
+    config = {}
+    diff_settings.apply(config, args)
+    source_dirs = [SRC_DIRS[args.version] if d == "src" else d for d in config['source_directories']]
+
+    mapfile = config['mapfile']
+    if os.path.isfile("expected/" + mapfile):
+        mapfile = "expected/" + mapfile
+    for path in (config['baseimg'], mapfile):
+        if not os.path.isfile(path):
+            print(f"{path} must exist, run 'make extract' and 'make' first")
+            sys.exit(1)
+
+    sys.exit(main(args.version, config['baseimg'], mapfile, source_dirs, args.jobs, args.make_args))
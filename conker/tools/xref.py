@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import yaml
+
+import addrspace
+
+# Cross-reference index of pointers stored in .data/.rodata.
+#
+# Every aligned word of every data/rodata subsegment in conker.<version>.yaml
+# is range-checked (with numpy, all at once) against the vram ranges of the
+# code segments (text, data and bss). Hits are stored twice, sorted by
+# target and by referrer, so both directions are a binary search away.
+
+DATA_TYPES = ("data", "rodata", ".data", ".rodata")
+
+
+def parse_segments(config):
+    # code segments, each with the (start, end) of its data/rodata subsegments
+    segments = addrspace.code_segments(config)
+    entries = {entry["name"]: entry for entry in config["segments"] if type(entry) is dict and "name" in entry}
+    for segment in segments:
+        subsegments = entries[segment["name"]].get("subsegments", [])
+        starts = [addrspace.segment_start(subsegment) for subsegment in subsegments] + [segment["end"]]
+        segment["data"] = []
+        for i, subsegment in enumerate(subsegments):
+            sub_type = subsegment["type"] if type(subsegment) is dict else subsegment[1]
+            if sub_type in DATA_TYPES:
+                segment["data"].append((starts[i], starts[i + 1]))
+    return segments
+
+
+def build_index(data, segments):
+    words = []
+    referrers = []
+    for segment in segments:
+        for start, end in segment["data"]:
+            start = (start + 3) & ~3
+            chunk = np.frombuffer(data, dtype=">u4", count=(end - start) // 4, offset=start).astype(np.uint32)
+            words.append(chunk)
+            referrers.append(np.arange(chunk.size, dtype=np.uint32) * 4 + (segment["vram"] + start - segment["start"]))
+    if not words:
+        return np.zeros(0, dtype=np.uint32), np.zeros(0, dtype=np.uint32)
+    words = np.concatenate(words)
+    referrers = np.concatenate(referrers)
+
+    hit = np.zeros(words.size, dtype=bool)
+    for segment in segments:
+        low = segment["vram"]
+        high = segment["vram"] + segment["end"] - segment["start"] + segment["bss_size"]
+        hit |= (words >= low) & (words < high)
+    return referrers[hit], words[hit]
+
+
+def save_index(path, referrers, targets):
+    by_target = np.lexsort((referrers, targets))
+    by_referrer = np.argsort(referrers, kind="stable")
+    np.savez_compressed(path,
+                        target_sorted_targets=targets[by_target], target_sorted_referrers=referrers[by_target],
+                        referrer_sorted_referrers=referrers[by_referrer], referrer_sorted_targets=targets[by_referrer])
+
+
+def load_index(path):
+    return dict(np.load(path))
+
+
+def lookup(keys, values, low, high):
+    # values for all keys in [low, high)
+    start = np.searchsorted(keys, low, side="left")
+    end = np.searchsorted(keys, high, side="left")
+    return keys[start:end], values[start:end]
+
+
+def find_tables(index, min_length):
+    # runs of consecutive words that all point somewhere, e.g. jump tables
+    referrers = index["referrer_sorted_referrers"].astype(np.int64)
+    targets = index["referrer_sorted_targets"]
+    if referrers.size == 0:
+        return []
+    breaks = np.flatnonzero(np.diff(referrers) != 4) + 1
+    ret = []
+    for run in np.split(np.arange(referrers.size), breaks):
+        if run.size >= min_length:
+            ret.append((int(referrers[run[0]]), [int(t) for t in targets[run]]))
+    return ret
+
+
+def describe(addresses, space):
+    ret = []
+    for address, (name, offset) in zip(addresses, space.vram_to_symbol(addresses)):
+        if name is None:
+            ret.append(f"0x{address:08X}")
+        else:
+            ret.append(f"0x{address:08X} ({name}{f' + 0x{offset:X}' if offset else ''})")
+    return ret
+
+
+def main_build(version, outfile):
+    start = time.perf_counter()
+    with open(f"conker.{version}.bin", "rb") as f:
+        data = f.read()
+    with open(f"conker.{version}.yaml", "r") as f:
+        segments = parse_segments(yaml.safe_load(f.read()))
+    referrers, targets = build_index(data, segments)
+    save_index(outfile, referrers, targets)
+    scanned = sum(end - start for segment in segments for start, end in segment["data"])
+    print(f"Found {referrers.size} pointer(s) in {scanned} bytes of data, wrote {outfile} ({time.perf_counter() - start:.2f}s)")
+
+
+def main_query(index_file, version, address, size, outgoing):
+    index = load_index(index_file)
+    space = addrspace.load(version, rom=False)
+    if outgoing:
+        keys, values = lookup(index["referrer_sorted_referrers"], index["referrer_sorted_targets"], address, address + size)
+        arrow = "->"
+    else:
+        keys, values = lookup(index["target_sorted_targets"], index["target_sorted_referrers"], address, address + size)
+        arrow = "<-"
+    for key, value in zip(describe(keys.tolist(), space), describe(values.tolist(), space)):
+        print(f"{key} {arrow} {value}")
+
+
+def main_tables(index_file, version, min_length):
+    index = load_index(index_file)
+    space = addrspace.load(version, rom=False)
+    for referrer, targets in find_tables(index, min_length):
+        referrer, first, last = describe([referrer, targets[0], targets[-1]], space)
+        print(f"{referrer}: {len(targets)} entries, {first} .. {last}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Index pointers stored in data/rodata',
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--version', type=str, default='us',
+                        help='ROM version, us/eu/debug/ects')
+    parser.add_argument('--index', type=str,
+                        help='index file (default: build/xref.<version>.npz)')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    subparsers.add_parser('build', help='scan conker.<version>.bin and write the index')
+
+    query_parser = subparsers.add_parser('query', help='list pointers to (or from) an address')
+    query_parser.add_argument('address', type=lambda x: int(x[2:] if x.startswith("D_") else x, 16),
+                              help='address, e.g. 0x15001234 or D_80082B20')
+    query_parser.add_argument('--size', type=lambda x: int(x, 0), default=1,
+                              help='size of the range starting at address')
+    query_parser.add_argument('--from', dest='outgoing', action='store_true',
+                              help='list what the words at address point to, rather than what points at address')
+
+    tables_parser = subparsers.add_parser('tables', help='list runs of consecutive pointers (jump tables etc.)')
+    tables_parser.add_argument('--min-length', type=int, default=3,
+                               help='minimum number of consecutive pointers')
+    args = parser.parse_args()
+
+    index_file = args.index or f"build/xref.{args.version}.npz"
+    if args.command == 'build':
+        main_build(args.version, index_file)
+    else:
+        if not os.path.isfile(index_file):
+            print(f"{index_file} not found, run '{sys.argv[0]} build' first")
+            sys.exit(1)
+        if args.command == 'query':
+            main_query(index_file, args.version, args.address, args.size, args.outgoing)
+        else:
+            main_tables(index_file, args.version, args.min_length)
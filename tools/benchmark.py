@@ -0,0 +1,423 @@
+import argparse
+import io
+import json
+import os
+import shutil
+import struct
+import subprocess
+import sys
+import time
+import zlib
+
+import numpy as np
+import yaml
+
+TOOLS_DIR = os.path.dirname(os.path.realpath(__file__))
+ROOT_DIR = os.path.dirname(TOOLS_DIR)
+sys.path.append(os.path.join(ROOT_DIR, "conker", "tools"))
+
+import mapfile
+import n64crc
+import progress
+import rareunzip as ru
+import rarezip as rz
+import rompatch
+import rzip_pack
+import addrspace
+
+# Benchmarks for the python tooling, run against generated data so that no
+# baserom is needed: a 64MB ROM, a blob of rzip entries (+ yaml config) as
+# extracted by extract_compressed.py, game code for rzip_pack, and a conker/
+# tree (conker.us.bin, a modified build/conker.us.bin and a map with ~30k
+# symbols) for first-diff/progress/get_data, and a game rzip segment (xor'd
+# offsets table, 4k code chunks, code padding & data) packed from that tree.
+#
+# Each run is appended to a history file; timings more than --threshold
+# slower than the previous run at the same scale are flagged.
+
+VERSION = "us"
+ROM_SIZE = 64 * 1024 * 1024
+NUM_ENTRIES = 4000
+FUNCTION_SIZE = 0x40
+FUNCTIONS_PER_FILE = 64
+XOR_KEY = 0x8039CCCA
+# between the code chunks & the data, as in game.us.rzip.yaml
+CODE_PADDING = 0x17D8
+
+
+def synthetic(rng, size):
+    # vaguely asset-like: a small vocabulary of 8-byte tokens with zeroed runs
+    tokens = rng.integers(0, 256, (64, 8), dtype=np.uint8)
+    data = tokens[rng.integers(0, 64, size // 8 + 1)].ravel()[:size].copy()
+    blocks = data[:size // 64 * 64].reshape(-1, 64)
+    blocks[rng.random(len(blocks)) < 0.25] = 0
+    return data.tobytes()
+
+
+def raw_rzip(data):
+    compressor = zlib.compressobj(9, zlib.DEFLATED, -15)
+    return struct.pack(">I", len(data)) + compressor.compress(data) + compressor.flush()
+
+
+def write_map(path, segments, functions_per_segment):
+    with open(path, "w") as f:
+        for segment in segments:
+            name, start, end, vram = segment["name"], segment["start"], segment["end"], segment["vram"]
+            size = end - start
+            f.write(f".{name:<15} 0x{vram:016x} {size:#10x} load address 0x{start:016x}\n")
+            count = min(functions_per_segment, size // FUNCTION_SIZE)
+            for i in range(0, count, FUNCTIONS_PER_FILE):
+                obj = f"build/src/{name}_{i // FUNCTIONS_PER_FILE}.c.o"
+                length = min(FUNCTIONS_PER_FILE, count - i) * FUNCTION_SIZE
+                f.write(f" {obj}(.text)\n")
+                f.write(f" .text          0x{vram + i * FUNCTION_SIZE:016x} {length:#10x} {obj}\n")
+                for j in range(i, min(i + FUNCTIONS_PER_FILE, count)):
+                    address = vram + j * FUNCTION_SIZE
+                    f.write(f"                0x{address:016x}                func_{address:08X}\n")
+            f.write("\n")
+
+
+def generate(outdir, scale, seed):
+    rng = np.random.default_rng(seed)
+    os.makedirs(outdir, exist_ok=True)
+
+    # rzip entries, as extracted by extract_compressed.py
+    sizes = np.clip(rng.lognormal(8.3, 1.0, int(NUM_ENTRIES * scale)), 16, 0x10000).astype(int)
+    entries_dir = os.path.join(outdir, "entries")
+    os.makedirs(entries_dir, exist_ok=True)
+    blob = bytearray()
+    files = []
+    for i, size in enumerate(sizes.tolist()):
+        data = synthetic(rng, size)
+        compressed = raw_rzip(data)
+        files.append({"start": len(blob), "compressed": len(compressed), "uncompressed": size})
+        blob += compressed
+        with open(os.path.join(entries_dir, f"{i:04X}.bin"), "wb") as f:
+            f.write(data)
+    with open(os.path.join(outdir, "compressed.bin"), "wb") as f:
+        f.write(blob)
+    with open(os.path.join(outdir, "compressed.yaml"), "w") as f:
+        yaml.dump({"files": files}, f)
+
+    # the ROM itself; only the size & the CRC area matter to the tools
+    rom_size = int(ROM_SIZE * scale) // 0x100000 * 0x100000 or 0x200000
+    rom = bytearray(synthetic(rng, rom_size))
+    rom[:4] = b"\x80\x37\x12\x40"
+    blob_start = min(0x1000000, rom_size - len(blob)) if len(blob) < rom_size - 0x1000 else 0x1000
+    rom[blob_start:blob_start + len(blob)] = blob[:rom_size - blob_start]
+    with open(os.path.join(outdir, "rom.z64"), "wb") as f:
+        f.write(rom)
+
+    # conker/ tree
+    conker_dir = os.path.join(outdir, "conker")
+    os.makedirs(os.path.join(conker_dir, "build"), exist_ok=True)
+    config_path = os.path.join(ROOT_DIR, "conker", f"conker.{VERSION}.yaml")
+    shutil.copy(config_path, conker_dir)
+    segments = addrspace.load_segments(VERSION, os.path.join(ROOT_DIR, "conker"))
+    image_size = max(segment["end"] for segment in segments)
+    image = bytearray(synthetic(rng, image_size))
+    with open(os.path.join(conker_dir, f"conker.{VERSION}.bin"), "wb") as f:
+        f.write(image)
+    for offset in sorted(rng.integers(0x2D4B0, image_size - 4, 16).tolist()):
+        image[offset & ~3] ^= 0xFF
+    with open(os.path.join(conker_dir, "build", f"conker.{VERSION}.bin"), "wb") as f:
+        f.write(image)
+    game = next(segment for segment in segments if segment["name"] == "game")
+    code = bytes(image[game["start"]:game["end"]])
+    with open(os.path.join(outdir, "game.code.bin"), "wb") as f:
+        f.write(code)
+
+    # the game rzip segment, laid out as the conker/ Makefile builds it
+    game_data = next(segment for segment in segments if segment["name"] == "game_data")
+    out = io.BytesIO()
+    rzip_pack.pack_segment(code, out, total_size=len(code), xor_key=XOR_KEY)
+    code_end = out.tell()
+    out.write(bytes(CODE_PADDING))
+    data_start = out.tell()
+    out.write(raw_rzip(bytes(image[game_data["start"]:game_data["end"]])))
+    out.write(bytes(-out.tell() % 16))
+    with open(os.path.join(outdir, "game.rzip.bin"), "wb") as f:
+        f.write(out.getvalue())
+    layout = {"code": {"start": 0, "end": code_end}, "data": {"start": data_start, "end": out.tell()}, "xor": XOR_KEY}
+    write_map(os.path.join(conker_dir, "build", f"conker.{VERSION}.map"),
+              [s for s in segments if s["name"] in ("init", "game", "debugger")], int(40000 * scale))
+
+    with open(os.path.join(outdir, "meta.json"), "w") as f:
+        json.dump({"scale": scale, "seed": seed, "entries": len(files), "rom_size": rom_size,
+                   "game_rzip": layout}, f)
+
+
+def run_script(args, cwd):
+    subprocess.run([sys.executable] + args, cwd=cwd, check=True, stdout=subprocess.DEVNULL)
+
+
+def bench_unzip(outdir):
+    with open(os.path.join(outdir, "compressed.bin"), "rb") as f:
+        blob = f.read()
+    with open(os.path.join(outdir, "compressed.yaml"), "r") as f:
+        files = yaml.safe_load(f)["files"]
+    def run():
+        return sum(len(ru.runzip(blob[e["start"]:e["start"] + e["compressed"]])) for e in files)
+    return run
+
+
+def bench_extract_compressed(outdir):
+    dest = os.path.join(outdir, "extracted")
+    def run():
+        shutil.rmtree(dest, ignore_errors=True)
+        os.makedirs(dest)
+        run_script([os.path.join(TOOLS_DIR, "extract_compressed.py"), "compressed.yaml", "compressed.bin", dest], outdir)
+        return os.path.getsize(os.path.join(outdir, "compressed.bin"))
+    return run
+
+
+def bench_rarezip(outdir):
+    entries_dir = os.path.join(outdir, "entries")
+    names = sorted(os.listdir(entries_dir))[:200]
+    def run():
+        return sum(len(rz.compress_file(os.path.join(entries_dir, name))) for name in names)
+    return run
+
+
+def bench_compress_dir(outdir):
+    dest = os.path.join(outdir, "compressed")
+    def run():
+        shutil.rmtree(dest, ignore_errors=True)
+        os.makedirs(dest)
+        run_script([os.path.join(TOOLS_DIR, "compress_dir.py"), "entries", dest], outdir)
+        return sum(os.path.getsize(os.path.join(outdir, "entries", name)) for name in os.listdir(os.path.join(outdir, "entries")))
+    return run
+
+
+def read_game_rzip(outdir):
+    with open(os.path.join(outdir, "game.rzip.bin"), "rb") as f:
+        segment = f.read()
+    with open(os.path.join(outdir, "meta.json"), "r") as f:
+        return segment, json.load(f)["game_rzip"]
+
+
+def bench_rzip_pack(outdir):
+    with open(os.path.join(outdir, "game.code.bin"), "rb") as f:
+        data = f.read()
+    segment, layout = read_game_rzip(outdir)
+    def run():
+        out = io.BytesIO()
+        rzip_pack.pack_segment(data, out, total_size=len(data), xor_key=layout["xor"])
+        if out.getvalue() != segment[:layout["code"]["end"]]:
+            raise RuntimeError("rzip_pack output differs from the generated game rzip")
+        return len(data)
+    return run
+
+
+def load_splat_rzip():
+    # N64SegRzip, None if the n64splat submodule is not checked out
+    for path in (os.path.join(TOOLS_DIR, "n64splat"), os.path.join(TOOLS_DIR, "splat_ext")):
+        if path not in sys.path:
+            sys.path.append(path)
+    try:
+        from rzip import N64SegRzip
+    except ImportError:
+        return None
+    return N64SegRzip
+
+
+def bench_splat_rzip(outdir):
+    # the extension's path for the game code: parse the xor'd offsets table, then inflate chunk by chunk
+    N64SegRzip = load_splat_rzip()
+    if N64SegRzip is None:
+        return None
+    segment, layout = read_game_rzip(outdir)
+    code = segment[layout["code"]["start"]:layout["code"]["end"]]
+    # only the attributes get_game_offsets reads, splat's options are not set up here
+    seg = N64SegRzip.__new__(N64SegRzip)
+    seg.name, seg.rom_start, seg.xor = "code", layout["code"]["start"], layout["xor"]
+    def run():
+        total = 0
+        for split_file in seg.get_game_offsets(code):
+            result, _ = ru.runzip_with_leftovers(code[split_file["start"]:split_file["end"]])
+            total += len(result)
+        return total
+    return run
+
+
+def bench_unpack_game(outdir):
+    # rompatch/digests: offsets table, every code chunk & the data
+    segment, layout = read_game_rzip(outdir)
+    def run():
+        code, data, _, _, _ = rompatch.unpack_game(segment, layout)
+        return len(code) + len(data)
+    return run
+
+
+def bench_n64crc(outdir):
+    with open(os.path.join(outdir, "rom.z64"), "rb") as f:
+        data = f.read(n64crc.CHECKSUM_START + n64crc.CHECKSUM_LENGTH)
+    def run():
+        n64crc.calculate_crc(data, 6102)
+        return n64crc.CHECKSUM_LENGTH
+    return run
+
+
+def bench_mapfile(outdir):
+    path = os.path.join(outdir, "conker", "build", f"conker.{VERSION}.map")
+    def run():
+        mapfile.parse_map(path)
+        return os.path.getsize(path)
+    return run
+
+
+def bench_progress(outdir):
+    path = os.path.join(outdir, "conker", "build", f"conker.{VERSION}.map")
+    def run():
+        with open(path, "r") as f:
+            files, functions = progress.parse_map(f, ".game")
+        progress.generate_csv(files, functions, VERSION, "game")
+        return os.path.getsize(path)
+    return run
+
+
+def bench_addrspace(outdir):
+    conker_dir = os.path.join(outdir, "conker")
+    space = addrspace.load(VERSION, conker_dir, mapfile=os.path.join(conker_dir, "build", f"conker.{VERSION}.map"), rom=False)
+    offsets = np.random.default_rng(0).integers(0x1000, 0x25A5D8, 1000000)
+    def run():
+        space.vram_to_symbol(space.image_to_vram(offsets[:100000]))
+        space.vram_to_image(space.image_to_vram(offsets))
+        return len(offsets)
+    return run
+
+
+def bench_get_data(outdir):
+    conker_dir = os.path.join(outdir, "conker")
+    def run():
+        run_script([os.path.join(ROOT_DIR, "conker", "tools", "get_data.py"), "D_80082B20", "--length", "256"], conker_dir)
+        return None
+    return run
+
+
+def bench_first_diff(outdir):
+    conker_dir = os.path.join(outdir, "conker")
+    def run():
+        run_script([os.path.join(ROOT_DIR, "conker", "tools", "first-diff.py"), "-u", "-c", "8"], conker_dir)
+        return os.path.getsize(os.path.join(conker_dir, f"conker.{VERSION}.bin"))
+    return run
+
+
+BENCHMARKS = {
+    "unzip": bench_unzip,
+    "extract_compressed": bench_extract_compressed,
+    "rarezip": bench_rarezip,
+    "compress_dir": bench_compress_dir,
+    "rzip_pack": bench_rzip_pack,
+    "splat_rzip": bench_splat_rzip,
+    "unpack_game": bench_unpack_game,
+    "n64crc": bench_n64crc,
+    "mapfile": bench_mapfile,
+    "progress": bench_progress,
+    "addrspace": bench_addrspace,
+    "get_data": bench_get_data,
+    "first_diff": bench_first_diff,
+}
+
+
+def time_benchmark(run, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        processed = run()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, processed
+
+
+def load_previous(history, scale):
+    if not os.path.isfile(history):
+        return None
+    previous = None
+    with open(history, "r") as f:
+        for line in f:
+            entry = json.loads(line)
+            if entry["scale"] == scale:
+                previous = entry
+    return previous
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT_DIR,
+                              capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return None
+
+
+def main(outdir, scale, seed, names, repeat, history, threshold, regenerate):
+    meta_path = os.path.join(outdir, "meta.json")
+    meta = None
+    if os.path.isfile(meta_path):
+        with open(meta_path, "r") as f:
+            meta = json.load(f)
+    if regenerate or meta is None or meta["scale"] != scale or meta["seed"] != seed or "game_rzip" not in meta:
+        start = time.perf_counter()
+        shutil.rmtree(outdir, ignore_errors=True)
+        generate(outdir, scale, seed)
+        print(f"Generated synthetic data in {outdir} ({time.perf_counter() - start:.1f}s)")
+
+    previous = load_previous(history, scale)
+    results = {}
+    regressions = []
+    print(f"{'benchmark':<20} {'time':>10} {'MB/s':>10} {'previous':>10}")
+    for name in names:
+        run = BENCHMARKS[name](outdir)
+        if run is None:
+            print(f"{name:<20} {'skipped':>10}")
+            continue
+        elapsed, processed = time_benchmark(run, repeat)
+        results[name] = elapsed
+        rate = f"{processed / elapsed / 1e6:.2f}" if processed else "-"
+        line = f"{name:<20} {elapsed * 1000:>8.1f}ms {rate:>10}"
+        if previous and name in previous["results"]:
+            ratio = elapsed / previous["results"][name]
+            line += f" {ratio:>9.2f}x"
+            if ratio > 1 + threshold:
+                line += "  REGRESSION"
+                regressions.append(name)
+        print(line)
+
+    if history:
+        os.makedirs(os.path.dirname(history) or ".", exist_ok=True)
+        with open(history, "a") as f:
+            f.write(json.dumps({"time": time.time(), "revision": git_revision(), "scale": scale,
+                                "results": results}) + "\n")
+    if regressions:
+        print(f"{len(regressions)} regression(s) against {previous['revision']}: {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the python tools against generated data',
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('benchmarks', type=str, nargs='*', default=list(BENCHMARKS.keys()),
+                        help=f"benchmarks to run (default: all of {', '.join(BENCHMARKS.keys())})")
+    parser.add_argument('--data', type=str, default=os.path.join(ROOT_DIR, "build", "bench"),
+                        help="directory for the generated data")
+    parser.add_argument('--scale', type=float, default=1.0,
+                        help="size of the generated data relative to a real ROM")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--regenerate', action='store_true',
+                        help="regenerate the data even if it exists")
+    parser.add_argument('--repeat', type=int, default=3,
+                        help="take the best of this many runs")
+    parser.add_argument('--history', type=str, default=os.path.join(ROOT_DIR, "build", "bench_history.jsonl"),
+                        help="file to record results in, compared against the previous run")
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help="slowdown (fraction) reported as a regression")
+    args = parser.parse_args()
+
+    for name in args.benchmarks:
+        if name not in BENCHMARKS:
+            print(f"Unknown benchmark '{name}'")
+            sys.exit(2)
+
+    sys.exit(main(args.data, args.scale, args.seed, args.benchmarks, args.repeat, args.history,
+                  args.threshold, args.regenerate))
@@ -0,0 +1,142 @@
+import argparse
+import hashlib
+import os
+import subprocess
+import sys
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+# Builds several ROM versions side by side. Each version gets its own tree
+# under build/versions/<version> which symlinks the sources and tools from
+# the repo and keeps everything generated (assets/, asm/, build/, *.ld, ...)
+# to itself, so the Makefiles can run concurrently without stepping on each
+# other. Compressed rzip blocks are shared between versions via RZIP_CACHE.
+
+VERSIONS = ["us", "eu", "debug", "ects"]
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(os.path.realpath(__file__)), ".."))
+
+# generated by make/splat, must not be shared between versions
+ROOT_GENERATED = {".git", "build", "assets", "extracted", "conker.ld"}
+CONKER_GENERATED = {"build", "asm", "assets", "conker.ld"}
+
+STEPS = [
+    ("extract", ".", ["extract"]),
+    ("code-extract", "conker", ["extract"]),
+    ("code", "conker", ["--jobs={jobs}", "NON_MATCHING=1"]),
+    ("replace", "conker", ["replace", "NON_MATCHING=1"]),
+    ("rom", ".", ["--jobs={jobs}", "NON_MATCHING=1"]),
+]
+
+
+def is_generated(name, generated):
+    return (name in generated
+            or name.endswith(".ok")
+            or name.endswith("_auto.txt")
+            or name.endswith(".csv")
+            or (name.startswith("conker.") and name.endswith(".bin")))
+
+
+def link_tree(src, dst, generated):
+    os.makedirs(dst, exist_ok=True)
+    for name in os.listdir(src):
+        if is_generated(name, generated):
+            continue
+        target = os.path.join(dst, name)
+        if not os.path.lexists(target):
+            os.symlink(os.path.join(src, name), target)
+
+
+def prepare(version, outdir):
+    workdir = os.path.join(outdir, version)
+    link_tree(ROOT_DIR, workdir, ROOT_GENERATED | {"conker"})
+    link_tree(os.path.join(ROOT_DIR, "conker"), os.path.join(workdir, "conker"), CONKER_GENERATED)
+    return workdir
+
+
+def sha1_matches(path, sha1_path):
+    if not os.path.isfile(path):
+        return False
+    with open(sha1_path, "r") as f:
+        expected = f.read().split()[0]
+    with open(path, "rb") as f:
+        return hashlib.sha1(f.read()).hexdigest() == expected
+
+
+def build_version(version, outdir, jobs, env):
+    result = {"version": version, "steps": {}, "code": False, "rom": False}
+    start = time.perf_counter()
+
+    if not os.path.isfile(os.path.join(ROOT_DIR, f"baserom.{version}.z64")):
+        result["error"] = f"baserom.{version}.z64 not found"
+        return result
+
+    workdir = prepare(version, outdir)
+    log_path = os.path.join(workdir, "build.log")
+    with open(log_path, "w") as log:
+        for name, subdir, args in STEPS:
+            args = ["make", "-C", subdir, f"VERSION={version}"] + [arg.format(jobs=jobs) for arg in args]
+            log.write(f"### {' '.join(args)}\n"); log.flush()
+            step_start = time.perf_counter()
+            res = subprocess.run(args, cwd=workdir, env=env, stdout=log, stderr=subprocess.STDOUT)
+            result["steps"][name] = (res.returncode == 0, time.perf_counter() - step_start)
+            print(f"[{version}] {name}: {'done' if res.returncode == 0 else 'FAILED'} ({result['steps'][name][1]:.1f}s)")
+            sys.stdout.flush()
+            if res.returncode != 0:
+                result["error"] = f"'{name}' failed, see {os.path.relpath(log_path)}"
+                break
+
+    result["code"] = sha1_matches(os.path.join(workdir, "conker", "build", f"conker.{version}.bin"),
+                                  os.path.join(workdir, "conker", f"conker.{version}.sha1"))
+    result["rom"] = sha1_matches(os.path.join(workdir, "build", f"conker.{version}.z64"),
+                                 os.path.join(workdir, f"conker.{version}.sha1"))
+    result["elapsed"] = time.perf_counter() - start
+    return result
+
+
+def print_matrix(results):
+    print("")
+    header = f"{'version':<8}" + "".join(f"{name:>14}" for name, _, _ in STEPS) + f"{'code':>8}{'rom':>8}{'time':>9}"
+    print(header)
+    print("-" * len(header))
+    for result in results:
+        row = f"{result['version']:<8}"
+        for name, _, _ in STEPS:
+            ok, elapsed = result["steps"].get(name, (None, 0))
+            row += f"{'-' if ok is None else ('ok' if ok else 'FAIL') + f' {elapsed:5.1f}s':>14}"
+        row += f"{'OK' if result['code'] else 'x':>8}{'OK' if result['rom'] else 'x':>8}"
+        row += f"{result.get('elapsed', 0):8.1f}s"
+        print(row)
+        if "error" in result:
+            print(f"  {result['error']}")
+
+
+def main(versions, outdir, jobs, cache_dir):
+    outdir = os.path.abspath(outdir)
+    env = dict(os.environ)
+    env["RZIP_CACHE"] = os.path.abspath(cache_dir)
+    # split the cores between the versions building concurrently
+    jobs = jobs or max(1, (os.cpu_count() or 1) // len(versions))
+
+    with ThreadPoolExecutor(max_workers=len(versions)) as executor:
+        results = list(executor.map(lambda version: build_version(version, outdir, jobs, env), versions))
+
+    print_matrix(results)
+    return 0 if all(result["rom"] for result in results) else 1
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Build several ROM versions concurrently and report which match',
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('versions', type=str, nargs='*', default=VERSIONS,
+                        help="versions to build (default: %s)" % " ".join(VERSIONS))
+    parser.add_argument('--outdir', type=str, default=os.path.join(ROOT_DIR, "build", "versions"),
+                        help="directory to create per-version build trees in")
+    parser.add_argument('--jobs', type=int,
+                        help='make --jobs per version (default: cpu count / number of versions)')
+    parser.add_argument('--cache-dir', type=str, default=os.path.join(ROOT_DIR, "build", "cache", "rzip"),
+                        help='shared rzip compression cache')
+    args = parser.parse_args()
+
+    sys.exit(main(args.versions, args.outdir, args.jobs, args.cache_dir))
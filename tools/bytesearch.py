@@ -0,0 +1,240 @@
+import argparse
+import json
+import os
+import re
+import sqlite3
+import struct
+import sys
+import time
+
+import numpy as np
+
+import catalog
+
+# Byte pattern search over the decompressed rzip entries (assets/rzip/*/NNNN.*)
+# and the uncompressed game code+data (assets/game.<version>.bin).
+#
+# Every file is cut into blocks and the index records which blocks contain
+# each 3-byte sequence, as sorted numpy arrays (saved as .npy and mmapped, so
+# opening the index costs nothing). A query looks up the fixed trigrams of the
+# pattern, intersects their blocks and only scans those with a regex.
+
+BLOCK_SIZE = 0x4000
+ENTRY = re.compile(r"^\d{4}\.(bin|mp3)$")
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+
+
+def find_files(asset_dir, version):
+    files = []
+    rzip_dir = os.path.join(asset_dir, "rzip")
+    for root, dirs, names in os.walk(rzip_dir):
+        dirs.sort()
+        for name in sorted(names):
+            if ENTRY.match(name):
+                files.append(os.path.join(root, name))
+    game = os.path.join(asset_dir, f"game.{version}.bin")
+    if os.path.isfile(game):
+        files.append(game)
+    return files
+
+
+def trigrams(data):
+    values = np.frombuffer(data, dtype=np.uint8).astype(np.uint32)
+    return (values[:-2] << 16) | (values[1:-1] << 8) | values[2:]
+
+
+def build(files, outdir):
+    keys = []
+    block_ids = []
+    blocks = []
+    for file_index, path in enumerate(files):
+        with open(path, "rb") as f:
+            data = f.read()
+        for start in range(0, len(data), BLOCK_SIZE):
+            # trigrams starting in this block
+            unique = np.unique(trigrams(data[start:start + BLOCK_SIZE + 2]))
+            keys.append(unique)
+            block_ids.append(np.full(len(unique), len(blocks), dtype=np.uint32))
+            blocks.append((file_index, start, min(start + BLOCK_SIZE, len(data))))
+
+    keys = np.concatenate(keys) if keys else np.zeros(0, dtype=np.uint32)
+    block_ids = np.concatenate(block_ids) if block_ids else np.zeros(0, dtype=np.uint32)
+    order = np.argsort(keys, kind="stable")
+    keys, block_ids = keys[order], block_ids[order]
+    unique_keys, starts = np.unique(keys, return_index=True)
+
+    os.makedirs(outdir, exist_ok=True)
+    np.save(os.path.join(outdir, "keys.npy"), unique_keys)
+    np.save(os.path.join(outdir, "starts.npy"), np.append(starts, len(keys)).astype(np.uint32))
+    np.save(os.path.join(outdir, "postings.npy"), block_ids.astype(np.uint16 if len(blocks) <= 0x10000 else np.uint32))
+    np.save(os.path.join(outdir, "blocks.npy"), np.array(blocks, dtype=np.uint32).reshape(-1, 3))
+    with open(os.path.join(outdir, "files.json"), "w") as f:
+        json.dump([os.path.abspath(path) for path in files], f)
+    return len(blocks), len(block_ids)
+
+
+class Index:
+    def __init__(self, path):
+        self.keys = np.load(os.path.join(path, "keys.npy"), mmap_mode="r")
+        self.starts = np.load(os.path.join(path, "starts.npy"), mmap_mode="r")
+        self.postings = np.load(os.path.join(path, "postings.npy"), mmap_mode="r")
+        self.blocks = np.load(os.path.join(path, "blocks.npy"))
+        with open(os.path.join(path, "files.json"), "r") as f:
+            self.files = json.load(f)
+
+    def blocks_with(self, key):
+        i = np.searchsorted(self.keys, key)
+        if i == len(self.keys) or self.keys[i] != key:
+            return np.zeros(0, dtype=np.uint32)
+        return np.asarray(self.postings[self.starts[i]:self.starts[i + 1]])
+
+    def candidates(self, pattern):
+        # blocks in which a match could start
+        if len(pattern) > BLOCK_SIZE:
+            raise ValueError("pattern longer than an index block")
+        result = None
+        for i in range(len(pattern) - 2):
+            if None in pattern[i:i + 3]:
+                continue
+            found = self.blocks_with((pattern[i] << 16) | (pattern[i + 1] << 8) | pattern[i + 2])
+            # the trigram may have spilled over into the next block of the file
+            found = found.astype(np.int64)
+            spill = found[found > 0] - 1
+            spill = spill[self.blocks[spill, 0] == self.blocks[spill + 1, 0]]
+            found = np.union1d(found, spill)
+            result = found if result is None else np.intersect1d(result, found, assume_unique=True)
+            if len(result) == 0:
+                break
+        if result is None:
+            return np.arange(len(self.blocks))
+        return result
+
+    def search(self, pattern, limit):
+        regex = re.compile(b"".join(b"." if b is None else re.escape(bytes([b])) for b in pattern), re.DOTALL)
+        hits = []
+        handles = {}
+        try:
+            for block in self.candidates(pattern).tolist():
+                file_index, start, end = self.blocks[block].tolist()
+                if file_index not in handles:
+                    handles[file_index] = open(self.files[file_index], "rb")
+                f = handles[file_index]
+                f.seek(start)
+                data = f.read(end - start + len(pattern) - 1)
+                # lookahead so overlapping matches are found too
+                for match in re.finditer(b"(?=(" + regex.pattern + b"))", data, re.DOTALL):
+                    if match.start() >= end - start:
+                        break
+                    hits.append((self.files[file_index], start + match.start()))
+                    if len(hits) >= limit:
+                        return hits
+        finally:
+            for f in handles.values():
+                f.close()
+        return hits
+
+
+def parse_pattern(args):
+    if args.string is not None:
+        return list(args.string.encode("ascii"))
+    if args.float is not None:
+        return list(struct.pack(">f", args.float))
+    if args.u32 is not None:
+        return list(struct.pack(">I", int(args.u32, 0)))
+    pattern = []
+    for token in re.findall(r"\?\?|[0-9A-Fa-f]{2}", "".join(args.hex.split())):
+        pattern.append(None if token == "??" else int(token, 16))
+    return pattern
+
+
+def locate(hits, asset_dir, version):
+    # (name, offset, rom, vram) for each hit
+    rows = {}
+    db_path = os.path.join(asset_dir, catalog.CATALOG)
+    if os.path.isfile(db_path):
+        db = sqlite3.connect(db_path)
+        # catalog segments are relative to the asset dir
+        base = os.path.abspath(asset_dir)
+        for segment, ordinal, rom_start in db.execute("SELECT segment, ordinal, rom_start FROM entries"):
+            rows[os.path.join(base, segment, f"{ordinal:04d}")] = rom_start
+        db.close()
+
+    space = None
+    game_start = None
+    conker_dir = os.path.join(ROOT_DIR, "conker")
+    if os.path.isfile(os.path.join(conker_dir, f"conker.{version}.yaml")):
+        sys.path.append(os.path.join(conker_dir, "tools"))
+        import addrspace
+        space = addrspace.load(version, conker_dir, ROOT_DIR, rom=True)
+        game_start = next(s["start"] for s in space.segments if s["name"] == "game")
+
+    ret = []
+    for path, offset in hits:
+        name = os.path.relpath(path, os.path.dirname(os.path.abspath(asset_dir)))
+        rom = vram = None
+        if os.path.basename(path) == f"game.{version}.bin" and space:
+            image = game_start + offset
+            vram = space.image_to_vram(image)
+            rom = space.image_to_rom(image) if space.regions else None
+        else:
+            rom = rows.get(os.path.splitext(path)[0])
+        ret.append((name, offset, rom, vram))
+    return ret
+
+
+def main_query(index_dir, asset_dir, version, pattern, limit):
+    start = time.perf_counter()
+    index = Index(index_dir)
+    hits = index.search(pattern, limit)
+    elapsed = time.perf_counter() - start
+    for name, offset, rom, vram in locate(hits, asset_dir, version):
+        line = f"{name} +0x{offset:X}"
+        if rom is not None and rom >= 0:
+            line += f"  rom 0x{rom:X}"
+        if vram is not None and vram >= 0:
+            line += f"  vram 0x{vram:08X}"
+        print(line)
+    print(f"{len(hits)} hit(s){' (limit reached)' if len(hits) >= limit else ''} in {elapsed * 1000:.1f}ms")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Index and search the decompressed assets & game code for byte patterns',
+                                     formatter_class=argparse.RawDescriptionHelpFormatter,
+                                     epilog="e.g. bytesearch.py query '3C 01 80 ?? 24 21'\n"
+                                            "     bytesearch.py query --float 0.5")
+    parser.add_argument('--index', type=str, default='build/search',
+                        help="index directory")
+    parser.add_argument('--assets', type=str, default='assets',
+                        help="extracted assets directory")
+    parser.add_argument('--version', type=str, default='us',
+                        help="ROM version, us/eu/debug/ects")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    subparsers.add_parser('build', help='(re)build the index')
+
+    query_parser = subparsers.add_parser('query', help='search for a pattern')
+    query_parser.add_argument('hex', type=str, nargs='?', default="",
+                              help="hex bytes, '??' for any byte")
+    query_parser.add_argument('--string', type=str, help="ascii string")
+    query_parser.add_argument('--float', type=float, help="big-endian f32")
+    query_parser.add_argument('--u32', type=str, help="big-endian u32")
+    query_parser.add_argument('--limit', type=int, default=100)
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        start = time.perf_counter()
+        files = find_files(args.assets, args.version)
+        if not files:
+            print(f"Nothing to index in {args.assets}, run 'make extract' first")
+            sys.exit(1)
+        blocks, postings = build(files, args.index)
+        print(f"Indexed {len(files)} file(s), {blocks} block(s), {postings} posting(s) in {time.perf_counter() - start:.2f}s")
+    else:
+        if not os.path.isfile(os.path.join(args.index, "keys.npy")):
+            print(f"No index in {args.index}, run '{sys.argv[0]} build' first")
+            sys.exit(1)
+        pattern = parse_pattern(args)
+        if not pattern:
+            print("Empty pattern")
+            sys.exit(1)
+        main_query(args.index, args.assets, args.version, pattern, args.limit)
@@ -0,0 +1,191 @@
+import argparse
+import fnmatch
+import math
+import os
+import sqlite3
+import sys
+
+import numpy as np
+
+# Catalog of every rzip entry, written by N64SegRzip.split (tools/splat_ext/rzip.py)
+# into assets/catalog.sqlite as the entries are extracted, so questions about
+# the assets can be answered without rescanning thousands of files. Segments
+# are keyed by their directory relative to the asset dir, e.g. rzip/assets00
+# (the game code & data entries go into assets/game/catalog.sqlite).
+
+CATALOG = "catalog.sqlite"
+
+COLUMNS = [
+    ("segment", "TEXT"),
+    ("ordinal", "INTEGER"),
+    ("name", "TEXT"),
+    ("rom_start", "INTEGER"),
+    ("rom_end", "INTEGER"),
+    ("pad", "INTEGER"),
+    ("subtype", "TEXT"),
+    ("compressed", "INTEGER"),
+    ("uncompressed", "INTEGER"),
+    ("ratio", "REAL"),
+    ("entropy", "REAL"),
+    ("magic", "TEXT"),
+    ("head", "TEXT"),
+]
+
+MAGICS = [
+    (b"ID3", "mp3"),
+    (b"\xff\xfb", "mp3"),
+    (b"\xff\xf3", "mp3"),
+    (b"\xff\xe3", "mp3"),
+    (b"RIFF", "riff"),
+    (b"FORM", "iff"),
+    (b"\x89PNG", "png"),
+    (b"\x1f\x8b", "gzip"),
+    (b"\x80\x37\x12\x40", "n64"),
+]
+
+
+def sniff(data):
+    for magic, name in MAGICS:
+        if data.startswith(magic):
+            return name
+    if data and data.count(0) == len(data):
+        return "zero"
+    return ""
+
+
+def entropy(data):
+    # shannon entropy in bits per byte
+    if not data:
+        return 0.0
+    counts = np.bincount(np.frombuffer(data, dtype=np.uint8), minlength=256)
+    p = counts[counts > 0] / len(data)
+    return float(-(p * np.log2(p)).sum())
+
+
+def entry_row(segment, ordinal, name, rom_start, rom_end, pad, subtype, compressed, data):
+    uncompressed = len(data) if data is not None else 0
+    return (segment, ordinal, name, rom_start, rom_end, pad, subtype, compressed, uncompressed,
+            compressed / uncompressed if uncompressed else math.nan,
+            entropy(data) if data else 0.0,
+            sniff(data or b""),
+            (data or b"")[:4].hex())
+
+
+def connect(path):
+    db = sqlite3.connect(path, timeout=60)
+    db.execute(f"CREATE TABLE IF NOT EXISTS entries ({', '.join(f'{n} {t}' for n, t in COLUMNS)}, "
+               "PRIMARY KEY (segment, ordinal)) WITHOUT ROWID")
+    db.execute("CREATE INDEX IF NOT EXISTS entries_uncompressed ON entries (uncompressed)")
+    db.execute("CREATE INDEX IF NOT EXISTS entries_ratio ON entries (ratio)")
+    return db
+
+
+def write_segment(path, segment, rows):
+    # replaces whatever a previous extraction recorded for this segment
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    db = connect(path)
+    with db:
+        db.execute("DELETE FROM entries WHERE segment = ?", (segment,))
+        db.executemany(f"INSERT INTO entries VALUES ({', '.join('?' * len(COLUMNS))})", rows)
+    db.close()
+
+
+def print_rows(cursor):
+    names = [d[0] for d in cursor.description]
+    rows = cursor.fetchall()
+    formatted = [[format_value(v) for v in row] for row in rows]
+    widths = [max([len(n)] + [len(r[i]) for r in formatted]) for i, n in enumerate(names)]
+    print("  ".join(n.ljust(w) for n, w in zip(names, widths)))
+    for row in formatted:
+        print("  ".join(v.rjust(w) if v[:1].isdigit() or v.startswith("0x") else v.ljust(w) for v, w in zip(row, widths)))
+    print(f"({len(rows)} row(s))")
+
+
+def format_value(value):
+    if isinstance(value, float):
+        return f"{value:.3f}"
+    if value is None:
+        return ""
+    return str(value)
+
+
+def list_entries(db, segment, subtype, magic, min_size, sort, limit):
+    where, args = [], []
+    if segment:
+        db.create_function("glob_match", 2, lambda value, pattern: fnmatch.fnmatch(value, pattern), deterministic=True)
+        where.append("glob_match(segment, ?)")
+        args.append(segment)
+    if subtype:
+        where.append("subtype = ?")
+        args.append(subtype)
+    if magic:
+        where.append("magic = ?")
+        args.append(magic)
+    if min_size:
+        where.append("uncompressed >= ?")
+        args.append(min_size)
+    column, _, direction = sort.partition(":")
+    if column not in dict(COLUMNS):
+        raise ValueError(f"unknown column '{column}'")
+    query = (f"SELECT segment, ordinal, printf('0x%X', rom_start) AS rom, compressed, uncompressed, ratio, entropy, "
+             f"subtype, magic, head FROM entries{' WHERE ' + ' AND '.join(where) if where else ''} "
+             f"ORDER BY {column} {'ASC' if direction == 'asc' else 'DESC'} LIMIT ?")
+    return db.execute(query, args + [limit])
+
+
+def segments(db, pattern=None):
+    names = [row[0] for row in db.execute("SELECT DISTINCT segment FROM entries ORDER BY segment")]
+    return [name for name in names if pattern is None or fnmatch.fnmatch(name, pattern)]
+
+
+def summary(db):
+    return db.execute("SELECT segment, COUNT(*) AS entries, SUM(compressed) AS compressed, "
+                      "SUM(uncompressed) AS uncompressed, SUM(compressed) * 1.0 / SUM(uncompressed) AS ratio, "
+                      "AVG(entropy) AS entropy FROM entries GROUP BY segment ORDER BY MIN(rom_start)")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Query the catalog of extracted rzip entries',
+                                     formatter_class=argparse.RawDescriptionHelpFormatter,
+                                     epilog="e.g. largest poorly compressed assets:\n"
+                                            "  catalog.py list --subtype compressed --min-size 65536 --sort ratio")
+    parser.add_argument('--db', type=str, default=os.path.join("assets", CATALOG),
+                        help="catalog written during extraction")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    list_parser = subparsers.add_parser('list', help='list entries')
+    list_parser.add_argument('--segment', type=str,
+                             help="glob on the segment directory, e.g. 'rzip/assets0*'")
+    list_parser.add_argument('--subtype', type=str, choices=["compressed", "uncompressed", "mp3"])
+    list_parser.add_argument('--magic', type=str,
+                             help="sniffed file type, e.g. mp3/zero")
+    list_parser.add_argument('--min-size', type=int, default=0,
+                             help="minimum uncompressed size")
+    list_parser.add_argument('--sort', type=str, default="uncompressed",
+                             help="column[:asc], default descending")
+    list_parser.add_argument('--limit', type=int, default=20)
+
+    subparsers.add_parser('summary', help='totals per segment')
+
+    sql_parser = subparsers.add_parser('sql', help='run a query against the entries table')
+    sql_parser.add_argument('query', type=str)
+    args = parser.parse_args()
+
+    if not os.path.isfile(args.db):
+        print(f"{args.db} not found, run 'make extract' first")
+        sys.exit(1)
+
+    db = sqlite3.connect(args.db)
+    try:
+        if args.command == 'list':
+            if args.segment and not segments(db, args.segment):
+                raise ValueError(f"no segment matches '{args.segment}', the segments are: {', '.join(segments(db))}")
+            cursor = list_entries(db, args.segment, args.subtype, args.magic, args.min_size, args.sort, args.limit)
+        elif args.command == 'summary':
+            cursor = summary(db)
+        else:
+            cursor = db.execute(args.query)
+        print_rows(cursor)
+    except (sqlite3.Error, ValueError) as e:
+        print(e)
+        sys.exit(1)
@@ -1,36 +1,31 @@
 import argparse
 import os
 import sys
-import struct
-import subprocess
 
+import profiling
 import rarezip as rz
+from rzip_pack import PaddingBuffer, pack_offsets
 
 def compress_files(files, indir, outdir, initial_offset, alignment, level):
     offsets = []
-    offset = initial_offset
-    output_buffer = bytearray(8192)
+    buffer = PaddingBuffer(initial_offset, alignment)
     for file in files:
-        # slow, but will suffice until we have a python library that matches
-        compressed = rz.compress_file(f"{indir}/{file}", level=level)
-        if compressed is None:
-            print("ERROR calling gzip", res)
-            break
+        with profiling.stage(f"compress:{file}", "compress_dir") as stage:
+            # slow, but will suffice until we have a python library that matches
+            compressed = rz.compress_file(f"{indir}/{file}", level=level)
+            if compressed is None:
+                print("ERROR calling gzip", file)
+                break
 
-        compressed_length = len(compressed)
-        # copy into buffer
-        for i in range(compressed_length):
-            output_buffer[i] = compressed[i]
-        # write gzip file
-        with open(f"{outdir}/{file}.gz", "wb") as o:
-            if alignment > 1:
-                compressed_length += compressed_length % alignment
-            o.write(output_buffer[:compressed_length])
-
-        offsets.append(offset)
-        offset += compressed_length
+            offsets.append(buffer.offset)
+            # write gzip file, padded such that the next file starts aligned
+            # (no reference to the padded view is kept, the next pad() may resize its buffer)
+            with open(f"{outdir}/{file}.gz", "wb") as o:
+                o.write(buffer.pad(compressed))
+            stage.bytes_in = os.path.getsize(f"{indir}/{file}")
+            stage.bytes_out = buffer.offset - offsets[-1]
         sys.stdout.write('.');sys.stdout.flush()
-    offsets.append(offset)
+    offsets.append(buffer.offset)
     # flush ...
     print("")
     return offsets
@@ -39,7 +34,8 @@ def main(indir, outdir, offsets_file, num_offsets, total_size, alignment, level,
     files = sorted(list(filter(lambda x: x.startswith('0') and x.endswith('.bin'), os.listdir(indir))))
 
     if offsets_file:
-        if len(files) > num_offsets:
+        # total size + one offset per file + end offset
+        if len(files) + 2 > num_offsets:
             old_num_offsets = num_offsets
             num_offsets = len(files) + 2
             print("WARN: --num-offsets (%i) too small for number of files found, setting to %i" % (old_num_offsets, num_offsets))
@@ -50,14 +46,7 @@ def main(indir, outdir, offsets_file, num_offsets, total_size, alignment, level,
     offsets = compress_files(files, indir, outdir, initial_offset, alignment, level)
 
     if offsets_file:
-        offsets_dump = [total_size]
-        for offset in offsets:
-            offsets_dump.append(offset ^ xor_key)
-
-        if len(offsets_dump) < num_offsets:
-            for i in range(num_offsets - len(offsets_dump)):
-                offsets_dump.append(0)
-        offsets_file.write(struct.pack(">" + num_offsets * "I", *offsets_dump))
+        offsets_file.write(pack_offsets(offsets, num_offsets, total_size, xor_key))
 
 
 
@@ -75,7 +64,7 @@ if __name__ == '__main__':
     parser.add_argument('--total-size', type=int, default=1335000,
                         help='.text section length')
     parser.add_argument('--alignment', type=int, default=2,
-                        help='alignment (padding)')
+                        help='pad each file so the next one starts on this boundary')
     parser.add_argument('--level', type=int, default=9,
                         help='gzip level (1-9)')
     parser.add_argument('--xor-key', type=str, default='0x8039CCCA',
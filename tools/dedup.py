@@ -0,0 +1,193 @@
+import argparse
+import glob
+import hashlib
+import json
+import os
+import sys
+import time
+
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+# Finds duplicated data across the extracted segments & rzip entries of one or
+# more asset trees (e.g. assets/ and build/versions/*/assets).
+#
+# Whole files are compared by sha1. Files are also cut into content-defined
+# chunks (gear hash, ~4KB average) so that near duplicates, e.g. the same
+# model with a few bytes patched or shifted, share most of their chunks.
+#
+# The gear hash only depends on the last 32 bytes (each byte's contribution is
+# shifted out after 32 steps), so the hash at every position is a sum of 32
+# shifted lookups and can be computed for the whole file with numpy.
+
+GEAR = np.random.default_rng(0x8039CCCA).integers(0, 1 << 32, 256, dtype=np.uint64).astype(np.uint32)
+WINDOW = 32
+MIN_CHUNK = 1024
+AVG_BITS = 12
+MAX_CHUNK = 16384
+
+
+def gear_hashes(data):
+    values = GEAR[np.frombuffer(data, dtype=np.uint8)]
+    hashes = np.zeros(len(values), dtype=np.uint32)
+    for k in range(min(WINDOW, len(values))):
+        hashes[k:] += values[:len(values) - k] << np.uint32(k)
+    return hashes
+
+
+def chunk_boundaries(data):
+    if len(data) <= MIN_CHUNK:
+        return [len(data)] if data else []
+    mask = np.uint32((1 << AVG_BITS) - 1)
+    candidates = (np.flatnonzero((gear_hashes(data) & mask) == 0) + 1).tolist()
+    boundaries = []
+    start = 0
+    i = 0
+    while start < len(data):
+        while i < len(candidates) and candidates[i] < start + MIN_CHUNK:
+            i += 1
+        end = candidates[i] if i < len(candidates) else len(data)
+        end = min(end, start + MAX_CHUNK, len(data))
+        boundaries.append(end)
+        start = end
+    return boundaries
+
+
+def hash_file(path):
+    with open(path, "rb") as f:
+        data = f.read()
+    chunks = []
+    start = 0
+    for end in chunk_boundaries(data):
+        chunks.append((hashlib.sha1(data[start:end]).hexdigest()[:16], end - start))
+        start = end
+    return path, len(data), hashlib.sha1(data).hexdigest(), chunks
+
+
+def find_files(roots):
+    files = []
+    for label, root in roots:
+        for dirpath, dirs, names in os.walk(root):
+            dirs.sort()
+            for name in sorted(names):
+                path = os.path.join(dirpath, name)
+                if os.path.isfile(path):
+                    files.append((label, os.path.relpath(path, root), path))
+    return files
+
+
+def exact_duplicates(results):
+    groups = {}
+    for name, size, digest, _ in results:
+        if size:
+            groups.setdefault(digest, []).append(name)
+    return {digest: names for digest, names in groups.items() if len(names) > 1}
+
+
+def near_duplicates(results, exact, threshold, max_fanout):
+    # pairs of distinct files that share at least threshold of the larger file
+    duplicate = {name for names in exact.values() for name in names[1:]}
+    chunk_files = {}
+    sizes = {}
+    for name, size, digest, chunks in results:
+        if name in duplicate:
+            continue
+        sizes[name] = size
+        for chunk, length in set(chunks):
+            chunk_files.setdefault(chunk, []).append((name, length))
+
+    shared = {}
+    for files in chunk_files.values():
+        if len(files) < 2 or len(files) > max_fanout:
+            # unique, or padding-like chunks found everywhere
+            continue
+        for i, (a, length) in enumerate(files):
+            for b, _ in files[i + 1:]:
+                shared[(a, b)] = shared.get((a, b), 0) + length
+
+    pairs = []
+    for (a, b), length in shared.items():
+        ratio = length / max(sizes[a], sizes[b])
+        if ratio >= threshold:
+            pairs.append((ratio, a, b))
+    return sorted(pairs, reverse=True)
+
+
+def default_roots():
+    roots = []
+    if os.path.isdir("assets"):
+        roots.append(("assets", "assets"))
+    for path in sorted(glob.glob("build/versions/*/assets")):
+        roots.append((path.split(os.sep)[-2], path))
+    return roots
+
+
+def parse_roots(values):
+    roots = []
+    for value in values:
+        label, path = value.split("=", 1) if "=" in value else (value, value)
+        roots.append((label, path))
+    return roots
+
+
+def main(roots, threshold, max_fanout, top, outfile, jobs):
+    start = time.perf_counter()
+    files = find_files(roots)
+    names = {path: f"{label}:{rel}" for label, rel, path in files}
+    with ProcessPoolExecutor(jobs) as executor:
+        results = [(names[path], size, digest, chunks)
+                   for path, size, digest, chunks in executor.map(hash_file, names.keys(), chunksize=64)]
+
+    total = sum(size for _, size, _, _ in results)
+    unique_files = {digest: size for _, size, digest, _ in results}
+    unique_chunks = {chunk: length for _, _, _, chunks in results for chunk, length in chunks}
+    exact = exact_duplicates(results)
+    near = near_duplicates(results, exact, threshold, max_fanout)
+
+    sizes = {name: size for name, size, _, _ in results}
+    print("Exact duplicates (by wasted bytes):")
+    groups = sorted(exact.values(), key=lambda names: -sizes[names[0]] * (len(names) - 1))
+    for names in groups[:top]:
+        print(f"  {sizes[names[0]]:>9} x{len(names)}  {'  '.join(names)}")
+    print(f"Near duplicates (>= {threshold:.0%} of chunk bytes shared):")
+    for ratio, a, b in near[:top]:
+        print(f"  {ratio:>6.1%}  {a} ({sizes[a]})  {b} ({sizes[b]})")
+
+    print(f"{len(results)} file(s), {total} bytes in {len(roots)} tree(s)")
+    print(f"  unique files:  {len(unique_files)}, {sum(unique_files.values())} bytes")
+    print(f"  unique chunks: {len(unique_chunks)}, {sum(unique_chunks.values())} bytes")
+    print(f"  {len(exact)} duplicate group(s), {len(near)} near-duplicate pair(s) ({time.perf_counter() - start:.2f}s)")
+
+    if outfile:
+        with open(outfile, "w") as f:
+            json.dump({
+                "files": {name: digest for name, _, digest, _ in results},
+                "duplicates": sorted(exact.values()),
+                "near": [[a, b, round(ratio, 4)] for ratio, a, b in near],
+            }, f, indent=1)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Find duplicated segments/rzip entries across extracted versions',
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('trees', type=str, nargs='*',
+                        help="[LABEL=]DIR of extracted files (default: assets and build/versions/*/assets)")
+    parser.add_argument('--threshold', type=float, default=0.5,
+                        help="minimum shared fraction for a near duplicate")
+    parser.add_argument('--max-fanout', type=int, default=32,
+                        help="ignore chunks found in more files than this (padding etc.)")
+    parser.add_argument('--top', type=int, default=20,
+                        help="number of groups/pairs to list")
+    parser.add_argument('--output', type=str,
+                        help="write the index (file digests, duplicate groups, near pairs) as json")
+    parser.add_argument('--jobs', type=int, default=None,
+                        help="number of processes (default: cpu count)")
+    args = parser.parse_args()
+
+    roots = parse_roots(args.trees) if args.trees else default_roots()
+    if not roots:
+        print("Nothing to index, run 'make extract' first")
+        sys.exit(1)
+
+    main(roots, args.threshold, args.max_fanout, args.top, args.output, args.jobs)
@@ -0,0 +1,275 @@
+import argparse
+import hashlib
+import json
+import os
+import pathlib
+import sqlite3
+import struct
+import sys
+import time
+import zlib
+
+import yaml
+
+import catalog
+import rareunzip as ru
+from rom_assemble import parse_segments
+from rompatch import rzip_layout, unpack_game
+
+# Digest manifest of the baserom, written at extract time, so that a ROM which
+# fails verification can be narrowed down to what differs instead of a single
+# sha1sum FAILED.
+#
+# Every segment of conker.<version>.yaml gets a SHA1 (the same as sha1sum of
+# its assets/<name>.bin), every rzip entry a BLAKE2b of its compressed bytes
+# and of its contents, and every (sub)segment of conker/conker.<version>.yaml a
+# BLAKE2b of its bytes in the uncompressed conker.<version>.bin. Verifying a
+# ROM hashes its segments and only decompresses & descends into those that
+# differ: a changed entry is reported as changed contents or as compression
+# alone, a changed code segment by the source files whose bytes changed.
+
+MANIFEST = "assets/digests.{version}.json"
+CODE_YAML = "conker/conker.{version}.yaml"
+CODE_SHA1 = "conker/conker.{version}.sha1"
+
+DECOMPRESSED = ("compressed", "gz")
+
+
+def sha1(data):
+    return hashlib.sha1(data).hexdigest()
+
+
+def blake2(data):
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def load_yaml(path):
+    with open(path, "r") as f:
+        return yaml.safe_load(f.read())
+
+
+def code_sections(config):
+    # [(name, start, end)] of the (sub)segments of conker/conker.<version>.yaml
+    segments, _ = parse_segments(config)
+    ret = []
+    for segment, entry in zip(segments, config["segments"]):
+        subsegments = entry.get("subsegments", []) if type(entry) is dict else []
+        starts = []
+        for sub in subsegments:
+            if type(sub) is dict:
+                start, type_, name = sub["start"], sub.get("type"), sub.get("name")
+            else:
+                start = sub[0]
+                type_ = sub[1] if len(sub) > 1 else None
+                name = sub[2] if len(sub) > 2 else None
+            starts.append((start, name or f"{type_ or 'bin'}_{start:X}"))
+        if not starts or starts[0][0] > segment["start"]:
+            starts.insert(0, (segment["start"], segment["name"]))
+        for i, (start, name) in enumerate(starts):
+            end = starts[i + 1][0] if i + 1 < len(starts) else segment["end"]
+            if end > start:
+                ret.append((f"{segment['name']}/{name}" if name != segment["name"] else name, start, end))
+    return ret
+
+
+def code_image(rom, segments, layout, version):
+    # conker.<version>.bin as `make extract` puts it together: header, boot, init, game & debugger
+    regions = {segment["name"]: segment for segment in segments}
+    parts = []
+    for name in (f"header.{version}", f"boot.{version}", f"init.{version}"):
+        parts.append(rom[regions[name]["start"]:regions[name]["end"]])
+    game = regions.get(f"game.{version}.rzip")
+    if game is not None and layout is not None:
+        code, data, _, _, _ = unpack_game(rom[game["start"]:game["end"]], layout)
+        parts += [code, data]
+    else:
+        parts.append(rom[regions[f"game.{version}"]["start"]:regions[f"game.{version}"]["end"]])
+    name = f"debugger.{version}"
+    parts.append(rom[regions[name]["start"]:regions[name]["end"]])
+    return b"".join(parts)
+
+
+def code_segment_names(version):
+    # ROM segments that end up in conker.<version>.bin
+    return {f"{name}.{version}" for name in ("header", "boot", "init", "game", "debugger")} | {f"game.{version}.rzip"}
+
+
+def entry_digests(rom, start, end, pad, subtype):
+    data = rom[start:end]
+    if subtype in DECOMPRESSED:
+        return blake2(data), blake2(ru.runzip(bytes(rom[start:end + pad])))
+    digest = blake2(data)
+    return digest, digest
+
+
+def rzip_entries(db_path, segments):
+    # {yaml segment: [(ordinal, start, end, pad, subtype)]} from the catalog, None without one
+    if not os.path.isfile(db_path):
+        return None
+    names = {segment["name"] for segment in segments if segment["type"] == "rzip"}
+    ret = {}
+    # read-only, so a missing table does not leave an empty database behind
+    db = sqlite3.connect(pathlib.Path(db_path).resolve().as_uri() + "?mode=ro", uri=True)
+    try:
+        if db.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'entries'").fetchone() is None:
+            return None
+        for segment, ordinal, start, end, pad, subtype in db.execute(
+                "SELECT segment, ordinal, rom_start, rom_end, pad, subtype FROM entries ORDER BY segment, ordinal"):
+            # only the segments of conker.<version>.yaml, the game code is covered by the code sections
+            name = os.path.basename(segment)
+            if name in names:
+                ret.setdefault(name, []).append((ordinal, start, end, pad or 0, subtype))
+    finally:
+        db.close()
+    return ret
+
+
+def create(rom, version, db_path, code_yaml):
+    view = memoryview(rom)
+    segments, rom_end = parse_segments(load_yaml(f"conker.{version}.yaml"))
+    entries = rzip_entries(db_path, segments)
+    if entries is None:
+        # extracted before the catalog existed
+        print(f"warning: no rzip entries in {db_path}, re-run extraction (rm -rf assets) for per-entry digests")
+        entries = {}
+    records = []
+    for segment in segments:
+        record = {"name": segment["name"], "type": segment["type"], "start": segment["start"], "end": segment["end"],
+                  "sha1": sha1(view[segment["start"]:segment["end"]])}
+        if segment["name"] in entries:
+            record["entries"] = [[ordinal, start, end, pad, subtype, *entry_digests(view, start, end, pad, subtype)]
+                                 for ordinal, start, end, pad, subtype in entries[segment["name"]]]
+        records.append(record)
+
+    image = memoryview(code_image(view, segments, rzip_layout(version), version))
+    sections = [[name, start, end, blake2(image[start:end])] for name, start, end in code_sections(load_yaml(code_yaml))]
+    return {"version": version, "size": len(rom), "sha1": sha1(rom),
+            "tail": sha1(view[rom_end:]), "segments": records,
+            "code": {"size": len(image), "sha1": sha1(image), "sections": sections}}
+
+
+def compare_entries(view, record):
+    # [(ordinal, start, end, reason)] of the differing entries of an rzip segment
+    ret = []
+    for ordinal, start, end, pad, subtype, compressed, contents in record["entries"]:
+        if blake2(view[start:end]) == compressed:
+            continue
+        try:
+            _, now = entry_digests(view, start, end, pad, subtype)
+        except zlib.error:
+            now = None
+        if now is None:
+            reason = "does not decompress"
+        elif now == contents:
+            reason = "same contents, compressed differently"
+        else:
+            reason = "contents differ"
+        ret.append((ordinal, start, end, reason))
+    return ret
+
+
+def compare_sections(image, code):
+    # [(name, start, end)] of the differing code sections
+    view = memoryview(image)
+    return [(name, start, end) for name, start, end, digest in code["sections"]
+            if end > len(image) or blake2(view[start:end]) != digest]
+
+
+def print_sections(image, code, indent):
+    if len(image) != code["size"]:
+        print(f"{indent}conker.bin is 0x{len(image):X} bytes, expected 0x{code['size']:X}")
+    for name, start, end in compare_sections(image, code):
+        print(f"{indent}{name:<40}0x{start:06X}-0x{end:06X}")
+
+
+def verify(rom, manifest, layout):
+    # True if the ROM matches, otherwise prints where it does not
+    view = memoryview(rom)
+    differing = [record for record in manifest["segments"]
+                 if sha1(view[record["start"]:record["end"]]) != record["sha1"]]
+    tail_start = manifest["segments"][-1]["end"] if manifest["segments"] else 0
+    tail = sha1(view[tail_start:]) != manifest["tail"]
+    if not differing and not tail and len(rom) == manifest["size"]:
+        return True
+
+    if len(rom) != manifest["size"]:
+        print(f"  size 0x{len(rom):X}, expected 0x{manifest['size']:X}")
+    code_names = code_segment_names(manifest["version"])
+    for record in differing:
+        print(f"  {record['name']:<24}0x{record['start']:08X}-0x{record['end']:08X}")
+        if "entries" in record:
+            for ordinal, start, end, reason in compare_entries(view, record):
+                print(f"    {ordinal:04d}  0x{start:08X}-0x{end:08X}  {reason}")
+    if tail:
+        print(f"  {'(after the last segment)':<24}0x{tail_start:08X}-")
+
+    if any(record["name"] in code_names for record in differing):
+        segments = [{"name": r["name"], "start": r["start"], "end": r["end"]} for r in manifest["segments"]]
+        try:
+            image = code_image(view, segments, layout, manifest["version"])
+        except (zlib.error, struct.error, ValueError, IndexError) as e:
+            print(f"  game code does not decompress: {e}")
+        else:
+            print("  code sections:")
+            print_sections(image, manifest["code"], "    ")
+    return False
+
+
+def main(version, command, path, manifest_path):
+    start = time.perf_counter()
+    if command == "create":
+        db_path = os.path.join("assets", catalog.CATALOG)
+        with open(path, "rb") as f:
+            manifest = create(f.read(), version, db_path, CODE_YAML.format(version=version))
+        if os.path.isfile(CODE_SHA1.format(version=version)):
+            with open(CODE_SHA1.format(version=version), "r") as f:
+                if f.read().split()[0] != manifest["code"]["sha1"]:
+                    print(f"warning: code sections do not add up to {CODE_SHA1.format(version=version)}")
+        with open(manifest_path, "w") as f:
+            json.dump(manifest, f, separators=(",", ":"))
+        entries = sum(len(record.get("entries", [])) for record in manifest["segments"])
+        print(f"Wrote {manifest_path}: {len(manifest['segments'])} segment(s), {entries} entries, "
+              f"{len(manifest['code']['sections'])} code section(s) ({time.perf_counter() - start:.2f}s)")
+        return 0
+
+    with open(manifest_path, "r") as f:
+        manifest = json.load(f)
+    with open(path, "rb") as f:
+        data = f.read()
+    if command == "sections":
+        # an uncompressed conker.<version>.bin
+        ok = sha1(data) == manifest["code"]["sha1"]
+        print(f"{path}: {'OK' if ok else 'FAILED'}")
+        if not ok:
+            print_sections(data, manifest["code"], "  ")
+    else:
+        ok = verify(data, manifest, rzip_layout(version))
+        print(f"{path}: {'OK' if ok else 'FAILED'} ({time.perf_counter() - start:.3f}s)")
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Create/check the per-segment digest manifest of the baserom',
+                                     formatter_class=argparse.RawDescriptionHelpFormatter,
+                                     epilog="e.g. digests.py create\n"
+                                            "     digests.py verify build/conker.us.z64\n"
+                                            "     digests.py sections conker/build/conker.us.bin")
+    parser.add_argument('command', choices=['create', 'verify', 'sections'],
+                        help="create from the baserom, verify a ROM, or verify a conker.<version>.bin")
+    parser.add_argument('path', type=str, nargs='?',
+                        help="ROM or conker.<version>.bin (default for create: baserom.<version>.z64)")
+    parser.add_argument('--version', type=str, default='us',
+                        help="ROM version, us/eu/debug/ects")
+    parser.add_argument('--manifest', type=str,
+                        help=f"default: {MANIFEST.format(version='<version>')}")
+    args = parser.parse_args()
+
+    path = args.path or (f"baserom.{args.version}.z64" if args.command == 'create' else None)
+    if path is None:
+        parser.error(f"{args.command} needs a path")
+    manifest_path = args.manifest or MANIFEST.format(version=args.version)
+    for required in (path,) if args.command == 'create' else (path, manifest_path):
+        if not os.path.isfile(required):
+            print(f"{required} not found" + (", run 'make extract' first" if required == manifest_path else ""))
+            sys.exit(1)
+    sys.exit(main(args.version, args.command, path, manifest_path))
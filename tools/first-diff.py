@@ -1,8 +1,15 @@
 #!/usr/bin/env python3
 import os.path
 import argparse
+import bisect
+import sys
 from subprocess import check_call
 
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), "conker", "tools"))
+
+import addrspace
+from mapfile import parse_map
+
 # TODO: -S argument for shifted ROMs
 
 parser = argparse.ArgumentParser(
@@ -30,7 +37,7 @@ diff_count = args.count
 version = "us"
 
 if args.make:
-    check_call(["make", "-j4", "VERSION=" + version, "COMPARE=0"])
+    check_call(["make", "-j4", "VERSION=" + version, "COMPARE=0", "all", "map"])
 
 baseimg = f"baserom.{version}.z64"
 basemap = f"conker.{version}.map"
@@ -66,99 +73,66 @@ if mybin == basebin:
     exit(0)
 
 
-def search_map(rom_addr):
-    ram_offset = None
-    last_ram = 0
-    last_rom = 0
-    last_fn = "<start of rom>"
-    last_file = "<no file>"
-    prev_line = ""
-    with open(mapfile) as f:
-        for line in f:
-            if "load address" in line:
-                # Example: ".boot           0x0000000004000000     0x1000 load address 0x0000000000000000"
-                if "noload" in line or "noload" in prev_line:
-                    ram_offset = None
-                    continue
-                ram = int(line[16 : 16 + 18], 0)
-                rom = int(line[59 : 59 + 18], 0)
-                ram_offset = ram - rom
-                continue
-            prev_line = line
+space = None
+map_symbols = None
+map_objects = None
 
-            if (
-                ram_offset is None
-                or "=" in line
-                or "*fill*" in line
-                or " 0x" not in line
-            ):
-                continue
-            ram = int(line[16 : 16 + 18], 0)
-            rom = ram - ram_offset
-            fn = line.split()[-1]
-            if "0x" in fn:
-                ram_offset = None
-                continue
-            if rom > rom_addr or (rom_addr & 0x80000000 and ram > rom_addr):
-                return f"in {last_fn} (ram 0x{last_ram:08x}, rom 0x{last_rom:06x}, {last_file})"
-            last_ram = ram
-            last_rom = rom
-            last_fn = fn
-            if "/" in fn:
-                last_file = fn
-    return "at end of rom?"
 
+def load_map():
+    global space, map_symbols, map_objects
+    if space is None:
+        # the ROM map only places the assets, the code symbols come from conker/
+        space = addrspace.load(version, "conker", ".", rom=True)
+        map_symbols, sections = parse_map(mapfile)
+        map_objects = sorted((s["rom"], s["rom"] + s["size"], s["object"]) for s in sections if s["size"])
 
-def parse_map(fname):
-    ram_offset = None
-    cur_file = "<no file>"
-    syms = {}
-    prev_sym = None
-    prev_line = ""
-    with open(fname) as f:
-        for line in f:
-            if "load address" in line:
-                if "noload" in line or "noload" in prev_line:
-                    ram_offset = None
-                    continue
-                ram = int(line[16 : 16 + 18], 0)
-                rom = int(line[59 : 59 + 18], 0)
-                ram_offset = ram - rom
-                continue
-            prev_line = line
 
-            if (
-                ram_offset is None
-                or "=" in line
-                or "*fill*" in line
-                or " 0x" not in line
-            ):
-                continue
-            ram = int(line[16 : 16 + 18], 0)
-            rom = ram - ram_offset
-            fn = line.split()[-1]
-            if "0x" in fn:
-                ram_offset = None
-            elif "/" in fn:
-                cur_file = fn
-            else:
-                syms[fn] = (rom, cur_file, prev_sym, ram)
-                prev_sym = fn
-    return syms
+def search_object(rom):
+    # (start, object) of the asset containing a ROM offset
+    i = bisect.bisect_right(map_objects, (rom, float("inf"))) - 1
+    if i >= 0 and rom < map_objects[i][1]:
+        return map_objects[i][0], map_objects[i][2]
+    return None, None
+
+
+def search_map(rom_addr):
+    # rom_addr is a ROM offset, or a ram address in the code
+    load_map()
+    if rom_addr >= 0x10000000:
+        ram, rom = rom_addr, space.vram_to_rom(rom_addr)
+        exact = True
+    else:
+        ram, rom = space.rom_to_vram(rom_addr), rom_addr
+        # only whole 4096-byte chunks of the compressed game code map back to ram
+        exact = ram == addrspace.UNMAPPED or not space.rom_is_compressed(rom_addr)
+    fn, offset = space.vram_to_symbol(ram)[0] if ram != addrspace.UNMAPPED else (None, None)
+    start, obj = search_object(rom)
+    if fn is None:
+        if obj is None:
+            return "at end of rom?"
+        return f"in {obj} (rom 0x{start:06x})"
+    obj = obj or "<no file>"
+    if not exact:
+        return f"in {obj}, compressed chunk from {fn} (ram 0x{ram:08x})"
+    ram -= offset
+    rom = space.vram_to_rom(ram)
+    if rom == addrspace.UNMAPPED or space.rom_is_compressed(rom):
+        return f"in {fn} (ram 0x{ram:08x}, compressed, {obj})"
+    return f"in {fn} (ram 0x{ram:08x}, rom 0x{rom:06x}, {obj})"
 
 
 def map_diff():
-    map1 = parse_map(mapfile)
-    map2 = parse_map(basemap)
+    map1 = parse_map(mapfile)[0]
+    map2 = parse_map(basemap)[0]
     min_ram = None
     found = None
+    prev_sym = None
     for sym, addr in map1.items():
-        if sym not in map2:
-            continue
-        if addr[0] != map2[sym][0]:
-            if min_ram is None or addr[0] < min_ram:
-                min_ram = addr[0]
-                found = (sym, addr[1], addr[2])
+        if sym in map2 and addr["rom"] != map2[sym]["rom"]:
+            if min_ram is None or addr["rom"] < min_ram:
+                min_ram = addr["rom"]
+                found = (sym, addr["object"], prev_sym)
+        prev_sym = sym
     if min_ram is None:
         return False
     else:
@@ -186,18 +160,25 @@ if args.by_name:
         addr = int(args.by_name, 0)
         print(args.by_name, "is", search_map(addr))
     except ValueError:
-        m = parse_map(mapfile)
-        try:
+        load_map()
+        ram = space.symbol_to_vram(args.by_name)
+        if args.by_name in map_symbols:
+            rom = hex(map_symbols[args.by_name]["rom"])
+            ram = map_symbols[args.by_name]["ram"]
+        elif ram is not None:
+            rom = space.vram_to_rom(ram)
+            rom = "<compressed>" if rom == addrspace.UNMAPPED or space.rom_is_compressed(rom) else hex(rom)
+        if ram is None:
+            print("function", args.by_name, "not found")
+        else:
             print(
                 args.by_name,
                 "is at position",
-                hex(m[args.by_name][0]),
+                rom,
                 "in ROM,",
-                hex(m[args.by_name][3]),
+                hex(ram),
                 "in RAM",
             )
-        except KeyError:
-            print("function", args.by_name, "not found")
     exit()
 
 found_instr_diff = []
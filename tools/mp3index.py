@@ -0,0 +1,266 @@
+import argparse
+import mmap
+import os
+import sqlite3
+import struct
+import sys
+import time
+
+import numpy as np
+
+import catalog
+
+# Frame index of the MP3 rzip entries (assets16 in conker.us.yaml).
+#
+# The entries the catalog sniffed as mp3 are walked frame by frame straight
+# out of the mmapped baserom (or the decompressed file, for the odd compressed
+# entry), recording each frame's offset, size and bitrate so that audio can be
+# seeked into, sliced or validated without a decoder. Entries whose frames run
+# past the end, lose sync or change format midway are flagged.
+
+# kbps by layer (3 = I, 2 = II, 1 = III) and index, for MPEG1 & MPEG2/2.5
+BITRATES_V1 = {
+    3: [0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448],
+    2: [0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384],
+    1: [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+}
+BITRATES_V2 = {
+    3: [0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256],
+    2: [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+    1: [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+}
+# by version, 3 = MPEG1, 2 = MPEG2, 0 = MPEG2.5
+SAMPLE_RATES = {3: [44100, 48000, 32000], 2: [22050, 24000, 16000], 0: [11025, 12000, 8000]}
+
+# frame header bits that must stay the same throughout a stream
+CONSTANT_MASK = 0xFFFE0C00
+
+STATUS_OK = 0
+STATUS_TRUNCATED = 1
+STATUS_CORRUPT = 2
+STATUS_FORMAT = 3
+STATUS_EMPTY = 4
+STATUS_NAMES = ["ok", "truncated", "corrupt", "format change", "no frames"]
+
+INDEX = "build/mp3index.npz"
+
+
+def parse_header(header):
+    # (frame size, samples, sample rate, kbps) or None
+    if header >> 21 != 0x7FF:
+        return None
+    version = (header >> 19) & 3
+    layer = (header >> 17) & 3
+    bitrate_index = (header >> 12) & 0xF
+    rate_index = (header >> 10) & 3
+    padding = (header >> 9) & 1
+    if version == 1 or layer == 0 or bitrate_index in (0, 15) or rate_index == 3:
+        return None
+    kbps = (BITRATES_V1 if version == 3 else BITRATES_V2)[layer][bitrate_index]
+    rate = SAMPLE_RATES[version][rate_index]
+    if layer == 3:
+        return (12 * kbps * 1000 // rate + padding) * 4, 384, rate, kbps
+    samples = 1152 if layer == 2 or version == 3 else 576
+    return samples // 8 * kbps * 1000 // rate + padding, samples, rate, kbps
+
+
+def skip_id3(data, offset):
+    if data[offset:offset + 3] != b"ID3" or offset + 10 > len(data):
+        return offset
+    size = 0
+    for b in data[offset + 6:offset + 10]:
+        size = (size << 7) | (b & 0x7F)
+    return offset + 10 + size
+
+
+def scan(data, start, end):
+    # frames of data[start:end] as (offsets, sizes, kbps), plus rate, samples & status
+    offsets, sizes, kbps = [], [], []
+    offset = skip_id3(data, start)
+    rate = 0
+    samples = 0
+    reference = None
+    status = STATUS_OK
+    while offset + 4 <= end:
+        header = struct.unpack_from(">I", data, offset)[0]
+        parsed = parse_header(header)
+        if parsed is None:
+            # trailing ID3v1 tag or zero padding is fine, anything else is not
+            rest = data[offset:end]
+            if not (rest[:3] == b"TAG" and len(rest) <= 128 + 8) and rest.count(0) != len(rest):
+                status = STATUS_CORRUPT
+            break
+        if reference is None:
+            reference = header & CONSTANT_MASK
+        elif header & CONSTANT_MASK != reference:
+            status = STATUS_FORMAT
+            break
+        size, frame_samples, rate, bitrate = parsed
+        if offset + size > end:
+            status = STATUS_TRUNCATED
+            break
+        offsets.append(offset - start)
+        sizes.append(size)
+        kbps.append(bitrate)
+        samples += frame_samples
+        offset += size
+    if not offsets and status == STATUS_OK:
+        status = STATUS_EMPTY
+    return offsets, sizes, kbps, rate, samples, status
+
+
+def mp3_entries(db_path):
+    db = sqlite3.connect(db_path)
+    rows = db.execute("SELECT segment, ordinal, rom_start, rom_end, subtype FROM entries "
+                      "WHERE magic = 'mp3' OR subtype = 'mp3' ORDER BY rom_start").fetchall()
+    db.close()
+    return rows
+
+
+def build(rom_path, asset_dir, db_path):
+    entries = mp3_entries(db_path)
+    # catalog segments are relative to the asset dir
+    base = os.path.abspath(asset_dir)
+    frame_offsets, frame_sizes, frame_kbps = [], [], []
+    table = []
+    first = 0
+    with open(rom_path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as rom:
+        for segment, ordinal, rom_start, rom_end, subtype in entries:
+            if subtype == "compressed":
+                with open(os.path.join(base, segment, f"{ordinal:04d}.bin"), "rb") as g:
+                    data = g.read()
+                offsets, sizes, kbps, rate, samples, status = scan(data, 0, len(data))
+            else:
+                offsets, sizes, kbps, rate, samples, status = scan(rom, rom_start, min(rom_end, len(rom)))
+            table.append((segment, ordinal, rom_start, rom_end, first, len(offsets), rate, samples, status))
+            first += len(offsets)
+            frame_offsets.append(np.array(offsets, dtype=np.uint32))
+            frame_sizes.append(np.array(sizes, dtype=np.uint16))
+            frame_kbps.append(np.array(kbps, dtype=np.uint16))
+    return table, frame_offsets, frame_sizes, frame_kbps
+
+
+def save(path, table, frame_offsets, frame_sizes, frame_kbps):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    np.savez(path,
+             segment=np.array([row[0] for row in table], dtype=str),
+             entry=np.array([row[1:] for row in table], dtype=np.int64).reshape(-1, 8),
+             offset=np.concatenate(frame_offsets) if frame_offsets else np.zeros(0, dtype=np.uint32),
+             size=np.concatenate(frame_sizes) if frame_sizes else np.zeros(0, dtype=np.uint16),
+             kbps=np.concatenate(frame_kbps) if frame_kbps else np.zeros(0, dtype=np.uint16))
+
+
+class Mp3Index:
+    def __init__(self, path):
+        with np.load(path) as index:
+            self.segments = index["segment"]
+            # ordinal, rom_start, rom_end, first frame, frames, sample rate, samples, status
+            self.entries = index["entry"]
+            self.offsets = index["offset"]
+            self.sizes = index["size"]
+            self.kbps = index["kbps"]
+
+    def find(self, segment, ordinal):
+        for i, (name, row) in enumerate(zip(self.segments, self.entries)):
+            if (segment is None or name.endswith(segment)) and row[0] == ordinal:
+                return i
+        return None
+
+    def frames(self, i):
+        first, count = self.entries[i][3], self.entries[i][4]
+        return self.offsets[first:first + count], self.sizes[first:first + count], self.kbps[first:first + count]
+
+    def duration(self, i):
+        rate, samples = self.entries[i][5], self.entries[i][6]
+        return samples / rate if rate else 0.0
+
+    def byte_range(self, i, start_time, end_time):
+        # whole frames covering [start_time, end_time) seconds, relative to the entry
+        offsets, sizes, _ = self.frames(i)
+        if len(offsets) == 0:
+            return 0, 0
+        frame_time = self.duration(i) / len(offsets)
+        first = min(int(start_time / frame_time), len(offsets) - 1)
+        last = min(max(first + 1, int(np.ceil(end_time / frame_time))), len(offsets))
+        return int(offsets[first]), int(offsets[last - 1]) + int(sizes[last - 1])
+
+
+def print_entries(index, flagged_only):
+    print(f"{'segment':<24}{'entry':>6}{'rom':>12}{'frames':>8}{'rate':>7}{'kbps':>6}{'seconds':>9}  status")
+    for i, (segment, row) in enumerate(zip(index.segments, index.entries)):
+        ordinal, rom_start, _, _, count, rate, _, status = row.tolist()
+        if flagged_only and status == STATUS_OK:
+            continue
+        _, _, kbps = index.frames(i)
+        average = kbps.mean() if len(kbps) else 0
+        print(f"{segment:<24}{ordinal:>6}{f'0x{rom_start:X}':>12}{count:>8}{rate:>7}{average:>6.0f}"
+              f"{index.duration(i):>9.2f}  {STATUS_NAMES[status]}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Index & validate the frames of the MP3 rzip entries',
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--index', type=str, default=INDEX,
+                        help="index file")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    build_parser = subparsers.add_parser('build', help='(re)build the index from the baserom')
+    build_parser.add_argument('--version', type=str, default='us',
+                              help="ROM version, us/eu/debug/ects")
+    build_parser.add_argument('--assets', type=str, default='assets',
+                              help="extracted assets directory")
+
+    list_parser = subparsers.add_parser('list', help='list indexed entries')
+    list_parser.add_argument('--flagged', action='store_true',
+                             help="only truncated/corrupt entries")
+
+    slice_parser = subparsers.add_parser('slice', help='write the frames covering a time range')
+    slice_parser.add_argument('entry', type=str, help="[SEGMENT/]ORDINAL, e.g. assets16/12")
+    slice_parser.add_argument('start', type=float, help="seconds")
+    slice_parser.add_argument('end', type=float, help="seconds")
+    slice_parser.add_argument('output', type=str)
+    slice_parser.add_argument('--assets', type=str, default='assets',
+                              help="extracted assets directory")
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        rom_path = f"baserom.{args.version}.z64"
+        db_path = os.path.join(args.assets, catalog.CATALOG)
+        for path in (rom_path, db_path):
+            if not os.path.isfile(path):
+                print(f"{path} not found, run 'make extract' first")
+                sys.exit(1)
+        start = time.perf_counter()
+        table, frame_offsets, frame_sizes, frame_kbps = build(rom_path, args.assets, db_path)
+        save(args.index, table, frame_offsets, frame_sizes, frame_kbps)
+        elapsed = time.perf_counter() - start
+        index = Mp3Index(args.index)
+        flagged = sum(1 for row in table if row[-1] != STATUS_OK)
+        if flagged:
+            print_entries(index, True)
+        print(f"Indexed {len(table)} mp3 entries, {len(index.offsets)} frame(s), "
+              f"{sum(index.duration(i) for i in range(len(table))):.0f}s of audio, {flagged} flagged ({elapsed:.2f}s)")
+        sys.exit(1 if flagged else 0)
+
+    if not os.path.isfile(args.index):
+        print(f"No index at {args.index}, run '{sys.argv[0]} build' first")
+        sys.exit(1)
+    index = Mp3Index(args.index)
+
+    if args.command == 'list':
+        print_entries(index, args.flagged)
+    else:
+        segment, _, ordinal = args.entry.rpartition("/")
+        i = index.find(segment or None, int(ordinal))
+        if i is None:
+            print(f"No mp3 entry {args.entry}")
+            sys.exit(1)
+        start, end = index.byte_range(i, args.start, args.end)
+        path = os.path.join(os.path.abspath(args.assets), index.segments[i], f"{index.entries[i][0]:04d}")
+        path += ".mp3" if os.path.isfile(path + ".mp3") else ".bin"
+        with open(path, "rb") as f:
+            f.seek(start)
+            data = f.read(end - start)
+        with open(args.output, "wb") as f:
+            f.write(data)
+        print(f"Wrote 0x{start:X}-0x{end:X} of {path} to {args.output}")
@@ -0,0 +1,160 @@
+import argparse
+import contextlib
+import json
+import os
+import resource
+import subprocess
+import sys
+import threading
+import time
+
+# Opt-in timing for the build tools. When CONKER_TRACE points at a file, each
+# stage appends one JSON event (wall time, cpu time, bytes in/out, peak RSS)
+# to it; `merge` turns that into a trace Chrome's about://tracing, Perfetto
+# or speedscope can load. When CONKER_TRACE is unset, stages cost nothing.
+
+TRACE_ENV = "CONKER_TRACE"
+
+
+class Stage:
+    def __init__(self, name, category, args):
+        self.name = name
+        self.category = category
+        self.args = args
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+
+def write_event(event, path=None):
+    path = path or os.environ.get(TRACE_ENV)
+    if not path:
+        return
+    # one line per write so concurrent processes can append to the same file
+    with open(path, "a") as f:
+        f.write(json.dumps(event) + "\n")
+
+
+def make_event(stage, ts, wall, cpu, max_rss_kb):
+    args = dict(stage.args)
+    args.update({
+        "wall_ms": round(wall * 1000, 3),
+        "cpu_ms": round(cpu * 1000, 3),
+        "bytes_in": stage.bytes_in,
+        "bytes_out": stage.bytes_out,
+        "max_rss_kb": max_rss_kb,
+    })
+    return {
+        "name": stage.name,
+        "cat": stage.category,
+        "ph": "X",
+        "ts": ts,
+        "dur": round(wall * 1e6),
+        "pid": os.getpid(),
+        "tid": threading.get_ident() % 0x100000,
+        "args": args,
+    }
+
+
+@contextlib.contextmanager
+def stage(name, category="stage", **args):
+    s = Stage(name, category, args)
+    if not os.environ.get(TRACE_ENV):
+        yield s
+        return
+    ts = time.time_ns() // 1000
+    start = time.perf_counter()
+    cpu_start = time.process_time()
+    try:
+        yield s
+    finally:
+        wall = time.perf_counter() - start
+        cpu = time.process_time() - cpu_start
+        max_rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        write_event(make_event(s, ts, wall, cpu, max_rss_kb))
+
+
+def run(name, category, args, inputs, outputs):
+    # time an external command (asm-processor, cc, ld, splat, ...)
+    s = Stage(name, category, {"command": " ".join(args)})
+    before = resource.getrusage(resource.RUSAGE_CHILDREN)
+    ts = time.time_ns() // 1000
+    start = time.perf_counter()
+    res = subprocess.run(args)
+    wall = time.perf_counter() - start
+    after = resource.getrusage(resource.RUSAGE_CHILDREN)
+    cpu = (after.ru_utime - before.ru_utime) + (after.ru_stime - before.ru_stime)
+    s.bytes_in = sum(os.path.getsize(path) for path in inputs if os.path.isfile(path))
+    s.bytes_out = sum(os.path.getsize(path) for path in outputs if os.path.isfile(path))
+    s.args["returncode"] = res.returncode
+    write_event(make_event(s, ts, wall, cpu, after.ru_maxrss))
+    return res.returncode
+
+
+def load_events(trace_file):
+    events = []
+    with open(trace_file, "r") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                events.append(json.loads(line))
+    return events
+
+
+def merge(trace_file, outfile):
+    events = load_events(trace_file)
+    with open(outfile, "w") as o:
+        json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, o)
+    print(f"Wrote {len(events)} event(s) to {outfile}")
+
+
+def summary(trace_file, top):
+    totals = {}
+    for event in load_events(trace_file):
+        key = (event["cat"], event["name"].split(":")[0])
+        wall, cpu, count, bytes_in, bytes_out, max_rss = totals.get(key, (0, 0, 0, 0, 0, 0))
+        args = event["args"]
+        totals[key] = (wall + args["wall_ms"], cpu + args["cpu_ms"], count + 1,
+                       bytes_in + args["bytes_in"], bytes_out + args["bytes_out"],
+                       max(max_rss, args["max_rss_kb"]))
+    print(f"{'category':<14}{'stage':<28}{'count':>7}{'wall ms':>12}{'cpu ms':>12}{'in KiB':>10}{'out KiB':>10}{'rss KiB':>10}")
+    for (category, name), (wall, cpu, count, bytes_in, bytes_out, max_rss) in sorted(totals.items(), key=lambda x: -x[1][0])[:top]:
+        print(f"{category:<14}{name:<28}{count:>7}{wall:>12.1f}{cpu:>12.1f}{bytes_in // 1024:>10}{bytes_out // 1024:>10}{max_rss:>10}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Record and inspect build step timings',
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = subparsers.add_parser('run', help='time a command, e.g. profiling.py run --name cc -- cc ...')
+    run_parser.add_argument('--name', type=str, required=True,
+                            help='stage name')
+    run_parser.add_argument('--category', type=str, default='command',
+                            help='stage category')
+    run_parser.add_argument('--input', type=str, action='append', default=[],
+                            help='file(s) read by the command, for bytes in')
+    run_parser.add_argument('--output', type=str, action='append', default=[],
+                            help='file(s) written by the command, for bytes out')
+    run_parser.add_argument('args', nargs=argparse.REMAINDER,
+                            help='command to run')
+
+    merge_parser = subparsers.add_parser('merge', help='convert a trace into Chrome trace format')
+    merge_parser.add_argument('trace', type=str,
+                              help='trace file written via CONKER_TRACE')
+    merge_parser.add_argument('outfile', type=str,
+                              help='destination .json')
+
+    summary_parser = subparsers.add_parser('summary', help='print per-stage totals')
+    summary_parser.add_argument('trace', type=str,
+                                help='trace file written via CONKER_TRACE')
+    summary_parser.add_argument('--top', type=int, default=30,
+                                help='number of stages to list')
+    args = parser.parse_args()
+
+    if args.command == 'run':
+        command = args.args[1:] if args.args[:1] == ['--'] else args.args
+        sys.exit(run(args.name, args.category, command, args.input, args.output))
+    elif args.command == 'merge':
+        merge(args.trace, args.outfile)
+    else:
+        summary(args.trace, args.top)
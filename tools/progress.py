@@ -3,6 +3,8 @@ import os
 import re
 import sys
 
+import profiling
+
 
 def parse_map(mapfile, section, ending=None):
     functions = {}
@@ -113,11 +115,13 @@ def generate_csv(files, functions, version, section):
 
 
 def main(basedir, mapfile, section, ending, version):
-    files, functions = parse_map(mapfile, section, ending)
-    for filename, file_funcs in files.items():
-        c_functions = parse_file(basedir, filename, file_funcs)
-        for c_function in c_functions:
-            functions[c_function]["language"] = "c"
+    with profiling.stage(f"parse_map:{section}", "progress"):
+        files, functions = parse_map(mapfile, section, ending)
+    with profiling.stage(f"parse_files:{section}", "progress"):
+        for filename, file_funcs in files.items():
+            c_functions = parse_file(basedir, filename, file_funcs)
+            for c_function in c_functions:
+                functions[c_function]["language"] = "c"
     section_name = section[1:].split("_")[-1]  # .main_lib -> lib
     csv = generate_csv(files, functions, version, section_name)
     print(csv)
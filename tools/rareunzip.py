@@ -1,11 +1,11 @@
 import sys
-import zlib
+
+import rzipcodec
 
 
 def runzip_with_leftovers(data):
-    d = zlib.decompressobj(wbits=-15) # raw deflate bytestream
-    res = d.decompress(data[4:])      # drop 4 byte length header
-    return (res, d.unused_data)
+    # raw deflate bytestream, with whichever inflate backend rzipcodec picks
+    return rzipcodec.inflate(data)
 
 def runzip(data):
     res, leftovers = runzip_with_leftovers(data)
@@ -1,25 +1,43 @@
+import hashlib
 import os
-import struct
 import sys
-import subprocess
+import threading
 
-def compress_file(filepath, level=9):
-    # force use of the gzip that sits along this file
-    gzip = os.path.join(os.path.dirname(os.path.realpath(__file__)), "gzip")
-    args = [gzip, f"-{level}", "--no-name", "-c", filepath]
-    res = subprocess.run(args, capture_output=True)
-    if res.returncode != 0:
+import rzipcodec
+
+def cache_path(data, level):
+    # optional content-addressed cache, shared between builds/versions
+    cache_dir = os.environ.get("RZIP_CACHE")
+    if not cache_dir:
         return None
-    gzip_compressed = res.stdout
-    uncompressed_length = struct.unpack("<i", gzip_compressed[-4:])[0]
-    return struct.pack(">i", uncompressed_length) + gzip_compressed[10:-8]
+    # entries made by other backends than the matching gzip are kept apart
+    name = rzipcodec.backend("deflate").name
+    prefix = b"" if name == "gzip" else name.encode()
+    key = hashlib.sha1(prefix + bytes([level]) + data).hexdigest()
+    return os.path.join(cache_dir, key[:2], key)
 
-# def rzip(data, level=9):
-#     compressed = zlib.compress(data, level=level)
-#     compressed = compressed[2:]                             # drop header
-#     compressed = compressed[:-4]                            # drop crc32
-#     compressed = struct.pack('>I', len(data)) + compressed  # prepend uncompressed size
-#     return compressed
+def compress_file(filepath, level=9):
+    if os.environ.get("RZIP_CACHE"):
+        with open(filepath, "rb") as f:
+            return compress(f.read(), level=level)
+    return rzipcodec.deflate_file(filepath, level=level)
+
+def compress(data, level=9):
+    path = cache_path(data, level)
+    if path and os.path.isfile(path):
+        with open(path, "rb") as f:
+            return f.read()
+    compressed = rzipcodec.deflate(data, level=level)
+    if compressed is None:
+        return None
+    if path:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # write then rename so concurrent builds never see a partial entry
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(compressed)
+        os.replace(tmp_path, path)
+    return compressed
 
 def main(infile, outfile, level):
     with open(outfile, "wb") as o:
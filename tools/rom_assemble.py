@@ -0,0 +1,132 @@
+import argparse
+import json
+import os
+import sys
+
+import yaml
+
+# Assembles the ROM straight from the extracted/replaced segment files listed
+# in conker.<version>.yaml, instead of `ld -r -b binary` + link + objcopy.
+#
+# Segments are copied in-kernel (copy_file_range) and a small state file
+# next to the image records each segment's size/mtime, so a rebuild only
+# rewrites the segments whose source changed since the previous image.
+
+HEADER_SIZE = 0x40
+
+def parse_segments(config, asset_path="assets"):
+    segments = []
+    entries = config["segments"]
+    for i, entry in enumerate(entries):
+        if type(entry) is dict:
+            start, type_, name = entry["start"], entry.get("type"), entry.get("name")
+        else:
+            start = entry[0]
+            type_ = entry[1] if len(entry) > 1 else None
+            name = entry[2] if len(entry) > 2 else None
+        if type_ is None:
+            # end marker
+            break
+        end = entries[i + 1]["start"] if type(entries[i + 1]) is dict else entries[i + 1][0]
+        if name is None:
+            name = f"{start:X}"
+        if type_ == "rzip":
+            path = os.path.join(asset_path, "rzip", name, f"{name}.bin")
+        else:
+            path = os.path.join(asset_path, f"{name}.bin")
+        segments.append({"name": name, "type": type_, "start": start, "end": end, "path": path})
+    return segments, end
+
+
+def copy_segment(src_path, dst_fd, offset, length):
+    with open(src_path, "rb") as src:
+        src_fd = src.fileno()
+        copied = 0
+        while copied < length:
+            try:
+                n = os.copy_file_range(src_fd, dst_fd, length - copied, copied, offset + copied)
+            except (AttributeError, OSError):
+                # e.g. cross-filesystem on older kernels
+                os.lseek(dst_fd, offset + copied, os.SEEK_SET)
+                n = os.sendfile(dst_fd, src_fd, copied, length - copied)
+            if n == 0:
+                raise IOError(f"short copy from {src_path}")
+            copied += n
+
+
+def load_state(state_path):
+    if not os.path.isfile(state_path):
+        return {}
+    with open(state_path, "r") as f:
+        return json.load(f)
+
+
+def segment_key(segment):
+    stat = os.stat(segment["path"])
+    return [segment["start"], stat.st_size, stat.st_mtime_ns]
+
+
+def assemble(segments, rom_size, outfile, force=False):
+    errors = []
+    for segment in segments:
+        if not os.path.isfile(segment["path"]):
+            errors.append(f"missing {segment['path']}")
+        elif os.path.getsize(segment["path"]) != segment["end"] - segment["start"]:
+            errors.append(f"{segment['path']} is 0x{os.path.getsize(segment['path']):X} bytes, "
+                          f"expected 0x{segment['end'] - segment['start']:X}")
+    if errors:
+        raise ValueError("\n".join(errors))
+
+    state_path = outfile + ".segments.json"
+    previous = {} if force or not os.path.isfile(outfile) else load_state(state_path)
+    if os.path.isfile(outfile) and os.path.getsize(outfile) != rom_size:
+        previous = {}
+
+    state = {}
+    written = 0
+    fd = os.open(outfile, os.O_RDWR | os.O_CREAT)
+    try:
+        os.ftruncate(fd, rom_size)
+        for segment in segments:
+            key = segment_key(segment)
+            state[segment["name"]] = key
+            # the header is always rewritten as n64crc.py may have patched it
+            if previous.get(segment["name"]) == key and segment["start"] >= HEADER_SIZE:
+                continue
+            copy_segment(segment["path"], fd, segment["start"], segment["end"] - segment["start"])
+            written += 1
+    finally:
+        os.close(fd)
+
+    with open(state_path, "w") as f:
+        json.dump(state, f)
+    return written
+
+
+def main(config_file, outfile, asset_path, force):
+    with open(config_file, "r") as f:
+        config = yaml.safe_load(f.read())
+    segments, rom_size = parse_segments(config, asset_path)
+    try:
+        written = assemble(segments, rom_size, outfile, force)
+    except ValueError as e:
+        print(e)
+        return 1
+    print(f"Wrote {written}/{len(segments)} segment(s) to {outfile}")
+    return 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Assemble ROM from the segments listed in the splat yaml',
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('config', type=str,
+                        help="splat yaml, e.g. conker.us.yaml")
+    parser.add_argument('outfile', type=str,
+                        help="destination ROM, e.g. build/conker.us.z64")
+    parser.add_argument('--asset-path', type=str, default='assets',
+                        help="directory containing the segment files")
+    parser.add_argument('--force', action='store_true',
+                        help="rewrite every segment, ignoring the previous image")
+    args = parser.parse_args()
+
+    sys.exit(main(args.config, args.outfile, args.asset_path, args.force))
@@ -0,0 +1,307 @@
+import argparse
+import hashlib
+import io
+import json
+import lzma
+import os
+import struct
+import sys
+import time
+import zlib
+
+import numpy as np
+import yaml
+
+import rarezip as rz
+import rareunzip as ru
+import rzip_pack
+from rom_assemble import parse_segments
+
+# Patches between the baserom and a built (e.g. NON_MATCHING=1) ROM, so a
+# build can be shared without the 64MB .z64.
+#
+# The ROM is compared segment by segment, as laid out in conker.<version>.yaml,
+# and only differing byte runs are stored. The compressed game code segment is
+# diffed in its decompressed form instead (one changed function changes every
+# compressed byte after it in its 4k chunk): applying recompresses the patched
+# code & data the way rzip_pack/rarezip do, reusing the baserom's compressed
+# chunks where unchanged, then applies a small residual for whatever
+# recompression does not reproduce (offsets table, padding).
+
+MAGIC = b"CKRPATCH"
+XOR_KEY = 0x8039CCCA
+# runs of differing bytes closer than this are stored as one
+GAP = 8
+
+
+def diff_runs(old, new):
+    # [(offset, length)] covering every byte of new that differs from old (or lies beyond it)
+    length = min(len(old), len(new))
+    a = np.frombuffer(old, dtype=np.uint8, count=length)
+    b = np.frombuffer(new, dtype=np.uint8, count=length)
+    diffs = np.flatnonzero(a != b)
+    runs = []
+    if len(diffs):
+        breaks = np.flatnonzero(np.diff(diffs) > GAP)
+        starts = np.concatenate(([diffs[0]], diffs[breaks + 1]))
+        ends = np.concatenate((diffs[breaks], [diffs[-1]])) + 1
+        runs = [[int(start), int(end - start)] for start, end in zip(starts, ends)]
+    if len(new) > length:
+        runs.append([length, len(new) - length])
+    return runs
+
+
+def apply_runs(old, size, runs, blob, position):
+    ret = bytearray(old[:size])
+    ret += bytes(size - len(ret))
+    for offset, length in runs:
+        ret[offset:offset + length] = blob[position:position + length]
+        position += length
+    return ret, position
+
+
+def run_bytes(data, runs):
+    return b"".join(bytes(data[offset:offset + length]) for offset, length in runs)
+
+
+def rzip_layout(version):
+    # code & data regions of the compressed game segment, from game.<version>.rzip.yaml
+    path = f"game.{version}.rzip.yaml"
+    if not os.path.isfile(path):
+        return None
+    with open(path, "r") as f:
+        config = yaml.safe_load(f.read())
+    segments, _ = parse_segments(config)
+    regions = {segment["name"]: segment for segment in segments}
+    if "code" not in regions or "data" not in regions:
+        return None
+    code = next(entry for entry in config["segments"] if type(entry) is dict and entry.get("name") == "code")
+    return {"code": regions["code"], "data": regions["data"], "xor": code.get("xor", XOR_KEY)}
+
+
+def read_offsets(segment, xor_key):
+    # chunk offsets from the xor'd table, the last one is the end of the last chunk
+    offsets = []
+    i = 1
+    while True:
+        value = struct.unpack_from(">I", segment, i * 4)[0]
+        i += 1
+        if value == 0:
+            break
+        offsets.append(value ^ xor_key)
+    if len(offsets) < 2 or offsets != sorted(offsets) or offsets[-1] > len(segment):
+        raise ValueError("bad rzip offsets table")
+    return offsets
+
+
+def game_layout(segment, layout):
+    # code & data regions of this game segment: a rebuilt one has its code end
+    # wherever its last chunk ends, followed by code_padding.bin (as long as in
+    # the baserom) & the data, which then runs up to the zero padding
+    offsets = read_offsets(segment[layout["code"]["start"]:], layout["xor"])
+    code_end = layout["code"]["start"] + offsets[-1]
+    data_start = code_end + layout["data"]["start"] - layout["code"]["end"]
+    if data_start >= len(segment):
+        raise ValueError("rzip code runs past the end of the game segment")
+    return {"code": {"start": layout["code"]["start"], "end": code_end},
+            "data": {"start": data_start, "end": len(segment)}, "xor": layout["xor"]}
+
+
+def unpack_code(segment, xor_key):
+    # (uncompressed chunks, {chunk: rzip bytes}, num_offsets, total_size) of an offsets table + chunks
+    total_size = struct.unpack_from(">I", segment, 0)[0]
+    offsets = read_offsets(segment, xor_key)
+    chunks = []
+    known = {}
+    for start, end in zip(offsets, offsets[1:]):
+        data = bytes(segment[start:end])
+        chunk, leftovers = ru.runzip_with_leftovers(data)
+        chunks.append(chunk)
+        known[chunk] = data[:len(data) - len(leftovers)]
+    return chunks, known, offsets[0] // 4, total_size
+
+
+def unpack_game(segment, layout):
+    layout = game_layout(segment, layout)
+    code = segment[layout["code"]["start"]:layout["code"]["end"]]
+    chunks, known, num_offsets, total_size = unpack_code(code, layout["xor"])
+    data = bytes(segment[layout["data"]["start"]:layout["data"]["end"]])
+    data_plain, leftovers = ru.runzip_with_leftovers(data)
+    known[data_plain] = data[:len(data) - len(leftovers)]
+    return b"".join(chunks), data_plain, known, num_offsets, total_size
+
+
+def repack_game(base_segment, layout, code, data, known, num_offsets, total_size, data_start):
+    # what the build would produce for code & data: the packed code, the
+    # baserom's code padding, the data at data_start & zeroes up to the end
+    base = game_layout(base_segment, layout)
+    ret = bytearray(len(base_segment))
+    ret[:base["code"]["start"]] = base_segment[:base["code"]["start"]]
+    out = io.BytesIO()
+    rzip_pack.pack_segment(code, out, num_offsets=num_offsets, total_size=total_size,
+                           xor_key=layout["xor"], known=known)
+    packed = out.getvalue()
+    end = base["code"]["start"] + len(packed)
+    ret[base["code"]["start"]:end] = packed
+    padding = base_segment[base["code"]["end"]:base["data"]["start"]]
+    ret[end:data_start] = padding[:max(data_start - end, 0)]
+    compressed = known.get(data) or rz.compress(data)
+    ret[data_start:data_start + len(compressed)] = compressed
+    return bytes(ret[:len(base_segment)])
+
+
+def sha1(data):
+    return hashlib.sha1(data).hexdigest()
+
+
+def create(base, target, segments, layout):
+    records = []
+    blobs = []
+    for segment in segments:
+        start, end = segment["start"], segment["end"]
+        if base[start:end] == target[start:end]:
+            continue
+        old, new = base[start:end], target[start:end]
+        record = None
+        if layout and segment["name"].startswith("game.") and segment["name"].endswith(".rzip"):
+            try:
+                base_code, base_data, known, _, _ = unpack_game(old, layout)
+                code, data, _, num_offsets, total_size = unpack_game(new, layout)
+                placed = game_layout(new, layout)
+            except (zlib.error, struct.error, ValueError):
+                code = None
+            if code is not None:
+                # where the build put the code end & data, they move with the compressed code size
+                code_end, data_start = placed["code"]["end"], placed["data"]["start"]
+                candidate = repack_game(old, layout, code, data, known, num_offsets, total_size, data_start)
+                record = {"segment": segment["name"], "start": start, "end": end, "kind": "rzip",
+                          "num_offsets": num_offsets, "total_size": total_size,
+                          "code_end": code_end, "data_start": data_start,
+                          "code_size": len(code), "code": diff_runs(base_code, code),
+                          "data_size": len(data), "data": diff_runs(base_data, data),
+                          "residual": diff_runs(candidate, new)}
+                blobs += [run_bytes(code, record["code"]), run_bytes(data, record["data"]),
+                          run_bytes(new, record["residual"])]
+        if record is None:
+            record = {"segment": segment["name"], "start": start, "end": end, "kind": "raw",
+                      "runs": diff_runs(old, new)}
+            blobs.append(run_bytes(new, record["runs"]))
+        records.append(record)
+
+    # anything beyond the last yaml segment
+    rom_end = segments[-1]["end"] if segments else 0
+    tail = {"segment": "tail", "start": rom_end, "end": len(target), "kind": "raw",
+            "runs": diff_runs(base[rom_end:], target[rom_end:])}
+    if tail["runs"] or len(base) != len(target):
+        records.append(tail)
+        blobs.append(run_bytes(target[rom_end:], tail["runs"]))
+
+    header = json.dumps({"base_sha1": sha1(base), "target_sha1": sha1(target),
+                         "size": len(target), "records": records}).encode()
+    return MAGIC + lzma.compress(struct.pack(">I", len(header)) + header + b"".join(blobs), preset=9)
+
+
+def read_patch(data):
+    if not data.startswith(MAGIC):
+        raise ValueError("not a rom patch")
+    payload = lzma.decompress(data[len(MAGIC):])
+    length = struct.unpack_from(">I", payload, 0)[0]
+    return json.loads(payload[4:4 + length]), payload[4 + length:]
+
+
+def apply(base, patch, layout):
+    header, blob = read_patch(patch)
+    if sha1(base) != header["base_sha1"]:
+        raise ValueError("baserom does not match the one the patch was made against")
+    rom = bytearray(base[:header["size"]])
+    rom += bytes(header["size"] - len(rom))
+    position = 0
+    for record in header["records"]:
+        start, end = record["start"], record["end"]
+        old = base[start:end]
+        if record["kind"] == "rzip":
+            if layout is None:
+                raise ValueError(f"{record['segment']} needs the game rzip yaml")
+            base_code, base_data, known, _, _ = unpack_game(old, layout)
+            code, position = apply_runs(base_code, record["code_size"], record["code"], blob, position)
+            data, position = apply_runs(base_data, record["data_size"], record["data"], blob, position)
+            candidate = repack_game(old, layout, bytes(code), bytes(data), known,
+                                    record["num_offsets"], record["total_size"], record["data_start"])
+            new, position = apply_runs(candidate, end - start, record["residual"], blob, position)
+        else:
+            new, position = apply_runs(old, end - start, record["runs"], blob, position)
+        rom[start:end] = new
+    if sha1(rom) != header["target_sha1"]:
+        raise ValueError("patched ROM does not match the target, was the gzip in tools/ used?")
+    return rom
+
+
+def load_segments(version):
+    with open(f"conker.{version}.yaml", "r") as f:
+        config = yaml.safe_load(f.read())
+    segments, _ = parse_segments(config)
+    return segments
+
+
+def read_file(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def describe(patch):
+    header, blob = read_patch(patch)
+    for record in header["records"]:
+        if record["kind"] == "rzip":
+            print(f"{record['segment']:<24}rzip  code {len(record['code'])} run(s), data {len(record['data'])} run(s), "
+                  f"residual {len(record['residual'])} run(s), code end 0x{record['code_end']:X}, "
+                  f"data at 0x{record['data_start']:X}")
+        else:
+            print(f"{record['segment']:<24}raw   {len(record['runs'])} run(s), {sum(r[1] for r in record['runs'])} bytes")
+    print(f"{len(header['records'])} segment(s) differ, {len(blob)} bytes of patch data, {len(patch)} bytes compressed")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Create/apply segment-level patches between the baserom and a built ROM',
+                                     formatter_class=argparse.RawDescriptionHelpFormatter,
+                                     epilog="e.g. rompatch.py create build/conker.us.patch\n"
+                                            "     rompatch.py apply build/conker.us.patch conker.z64")
+    parser.add_argument('--version', type=str, default='us',
+                        help="ROM version, us/eu/debug/ects")
+    parser.add_argument('--baserom', type=str,
+                        help="default: baserom.<version>.z64")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    create_parser = subparsers.add_parser('create', help='diff a built ROM against the baserom')
+    create_parser.add_argument('patch', type=str)
+    create_parser.add_argument('--target', type=str,
+                               help="default: build/conker.<version>.z64")
+
+    apply_parser = subparsers.add_parser('apply', help='rebuild a ROM from the baserom and a patch')
+    apply_parser.add_argument('patch', type=str)
+    apply_parser.add_argument('output', type=str)
+
+    info_parser = subparsers.add_parser('info', help='list the segments a patch changes')
+    info_parser.add_argument('patch', type=str)
+    args = parser.parse_args()
+
+    baserom = args.baserom or f"baserom.{args.version}.z64"
+    start = time.perf_counter()
+    try:
+        if args.command == 'info':
+            with open(args.patch, "rb") as f:
+                describe(f.read())
+        elif args.command == 'create':
+            target = args.target or f"build/conker.{args.version}.z64"
+            patch = create(read_file(baserom), read_file(target), load_segments(args.version), rzip_layout(args.version))
+            with open(args.patch, "wb") as f:
+                f.write(patch)
+            print(f"Wrote {args.patch}, {len(patch)} bytes ({time.perf_counter() - start:.2f}s)")
+        else:
+            with open(args.patch, "rb") as f:
+                rom = apply(read_file(baserom), f.read(), rzip_layout(args.version))
+            with open(args.output, "wb") as f:
+                f.write(rom)
+            print(f"Wrote {args.output} ({time.perf_counter() - start:.2f}s)")
+    except (OSError, ValueError, lzma.LZMAError) as e:
+        print(e)
+        sys.exit(1)
@@ -0,0 +1,126 @@
+import argparse
+import os
+import struct
+import sys
+
+from concurrent.futures import ThreadPoolExecutor
+
+import profiling
+import rarezip as rz
+
+# Packs an uncompressed section into a complete rzip segment in one pass:
+#
+#   [total size][offset ^ key]...[end ^ key][0]... (num_offsets words)
+#   [rzip chunk][pad][rzip chunk][pad]...
+#
+# i.e. what `split -b 4096` + compress_dir.py --offsets-file + cat used to
+# produce, and what N64SegRzip.get_game_offsets parses.
+
+def align(value, alignment):
+    if alignment <= 1:
+        return value
+    return (value + alignment - 1) // alignment * alignment
+
+
+def chunk_data(data, chunk_size):
+    return [data[i:i + chunk_size] for i in range(0, len(data), chunk_size)]
+
+
+class PaddingBuffer:
+    # padding bytes are whatever was left in the (reused) output buffer by
+    # previous chunks, rather than zeroes, as per the original tooling
+    def __init__(self, offset=0, alignment=2, buffer_size=8192):
+        self.offset = offset
+        self.alignment = alignment
+        self.buffer = bytearray(buffer_size)
+
+    def pad(self, compressed):
+        # round the end offset up to alignment, as N64SegRzip does for 'pad'
+        end = align(self.offset + len(compressed), self.alignment)
+        length = end - self.offset
+        if length > len(self.buffer):
+            self.buffer.extend(bytes(length - len(self.buffer)))
+        self.buffer[:len(compressed)] = compressed
+        self.offset = end
+        return memoryview(self.buffer)[:length]
+
+
+def pack_offsets(offsets, num_offsets, total_size, xor_key):
+    offsets_dump = [total_size] + [offset ^ xor_key for offset in offsets]
+    offsets_dump += [0] * (num_offsets - len(offsets_dump))
+    return struct.pack(">" + num_offsets * "I", *offsets_dump)
+
+
+def pack_segment(data, out, chunk_size=4096, num_offsets=512, total_size=1335000,
+                 xor_key=0x8039CCCA, alignment=2, level=9, segment_size=None, jobs=None, known=None):
+    # known: optional {chunk: rzip bytes} of chunks whose compressed form is already at hand
+    known = known or {}
+    chunks = chunk_data(data, chunk_size)
+    # total size + one offset per chunk + end offset
+    if len(chunks) + 2 > num_offsets:
+        old_num_offsets = num_offsets
+        num_offsets = len(chunks) + 2
+        print("WARN: num_offsets (%i) too small for number of chunks, setting to %i" % (old_num_offsets, num_offsets), file=sys.stderr)
+
+    table_size = num_offsets * 4 # sizeof(s32)
+    out.write(bytes(table_size))
+
+    buffer = PaddingBuffer(table_size, alignment)
+    offsets = []
+    with ThreadPoolExecutor(max_workers=jobs or os.cpu_count()) as executor:
+        for compressed in executor.map(lambda chunk: known.get(chunk) or rz.compress(chunk, level=level), chunks):
+            if compressed is None:
+                raise RuntimeError("ERROR calling gzip")
+            offsets.append(buffer.offset)
+            out.write(buffer.pad(compressed))
+    offsets.append(buffer.offset)
+
+    if segment_size is not None:
+        if buffer.offset > segment_size:
+            raise ValueError("packed segment is 0x%X bytes, larger than segment size 0x%X" % (buffer.offset, segment_size))
+        out.write(bytes(segment_size - buffer.offset))
+
+    # go back and fill in the offsets table now the chunk sizes are known
+    out.seek(0)
+    out.write(pack_offsets(offsets, num_offsets, total_size, xor_key))
+    out.seek(0, os.SEEK_END)
+
+    return offsets
+
+
+def main(infile, outfile, chunk_size, num_offsets, total_size, xor_key, alignment, level, segment_size):
+    with open(infile, "rb") as f:
+        data = f.read()
+    with profiling.stage(f"pack:{os.path.basename(infile)}", "rzip_pack") as stage, open(outfile, "wb") as o:
+        offsets = pack_segment(data, o, chunk_size, num_offsets, total_size, xor_key, alignment, level, segment_size)
+        stage.bytes_in = len(data)
+        stage.bytes_out = o.tell()
+    print("Packed %i bytes into %i chunk(s), %i bytes" % (len(data), len(offsets) - 1, offsets[-1]))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compress a section into an rzip segment with an xor\'d offsets table',
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('infile', type=str,
+                        help="uncompressed section")
+    parser.add_argument('outfile', type=str,
+                        help="destination rzip segment")
+    parser.add_argument('--chunk-size', type=int, default=4096,
+                        help='uncompressed size of each chunk')
+    parser.add_argument('--num-offsets', type=int, default=512,
+                        help='offsets length')
+    parser.add_argument('--total-size', type=int, default=1335000,
+                        help='.text section length')
+    parser.add_argument('--alignment', type=int, default=2,
+                        help='pad each chunk so the next one starts on this boundary')
+    parser.add_argument('--level', type=int, default=9,
+                        help='gzip level (1-9)')
+    parser.add_argument('--xor-key', type=str, default='0x8039CCCA',
+                        help='key to xor offsets with')
+    parser.add_argument('--segment-size', type=lambda x: int(x, 0),
+                        help='zero-fill the segment up to this size')
+    args = parser.parse_args()
+
+    xor_key = int(args.xor_key, 16)
+
+    main(args.infile, args.outfile, args.chunk_size, args.num_offsets, args.total_size, xor_key, args.alignment, args.level, args.segment_size)
@@ -0,0 +1,217 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+import zlib
+
+from concurrent.futures import ProcessPoolExecutor
+
+import rareunzip as ru
+from rzipcodec import gzip_args
+from verify_rzip import find_entries
+
+# Searches for the compressor settings that reproduce each extracted rzip
+# entry byte for byte: gzip levels first (what the ROM was built with), then
+# zlib's level/strategy/window/memLevel combinations.
+#
+# Every candidate is streamed and compared against the original as output
+# appears, and abandoned at the first differing byte, so most wrong guesses
+# cost a fraction of a full compression.
+
+STRATEGIES = {
+    "default": zlib.Z_DEFAULT_STRATEGY,
+    "filtered": zlib.Z_FILTERED,
+    "huffman": zlib.Z_HUFFMAN_ONLY,
+    "rle": zlib.Z_RLE,
+    "fixed": zlib.Z_FIXED,
+}
+
+FEED_SIZE = 0x4000
+
+
+def candidates(levels, strategies, window_bits, mem_levels, use_zlib):
+    ret = [{"compressor": "gzip", "level": level} for level in levels]
+    if use_zlib:
+        for level in levels:
+            for strategy in strategies:
+                for wbits in window_bits:
+                    for mem_level in mem_levels:
+                        ret.append({"compressor": "zlib", "level": level, "strategy": strategy,
+                                    "wbits": wbits, "memlevel": mem_level})
+    return ret
+
+
+def describe(params):
+    if params["compressor"] == "gzip":
+        return f"gzip -{params['level']}"
+    return f"zlib level={params['level']} strategy={params['strategy']} wbits={params['wbits']} memlevel={params['memlevel']}"
+
+
+def match_gzip(data, expected, level):
+    # (length of the common prefix of gzip's deflate stream and expected,
+    #  whether the stream is exactly expected)
+    proc = subprocess.Popen(gzip_args(level), stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+
+    def feed():
+        try:
+            proc.stdin.write(data)
+            proc.stdin.close()
+        except BrokenPipeError:
+            pass
+    writer = threading.Thread(target=feed)
+    writer.start()
+
+    header = 10
+    matched = 0
+    pending = b""
+    fd = proc.stdout.fileno()
+    try:
+        while True:
+            block = os.read(fd, 0x10000)
+            if not block:
+                break
+            pending += block
+            if header:
+                if len(pending) < header:
+                    continue
+                pending, header = pending[header:], 0
+            # the last 8 bytes may be the gzip trailer, hold them back
+            if len(pending) <= 8:
+                continue
+            stream, pending = pending[:-8], pending[-8:]
+            length = min(len(stream), len(expected) - matched)
+            if stream[:length] != expected[matched:matched + length] or length < len(stream):
+                # differs, or goes on past the end of expected
+                return matched + common_prefix(stream[:length], expected[matched:matched + length]), False
+            matched += length
+    finally:
+        proc.kill()
+        proc.stdout.close()
+        proc.wait()
+        writer.join()
+    # all that is left must be the trailer
+    return matched, header == 0 and len(pending) == 8 and matched == len(expected)
+
+
+def match_zlib(data, expected, level, strategy, wbits, mem_level):
+    # as match_gzip, the final flush included
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -wbits, mem_level, STRATEGIES[strategy])
+    matched = 0
+    for i in range(0, len(data) + 1, FEED_SIZE):
+        if i + FEED_SIZE <= len(data):
+            stream = compressor.compress(data[i:i + FEED_SIZE])
+        else:
+            stream = compressor.compress(data[i:]) + compressor.flush()
+        length = min(len(stream), len(expected) - matched)
+        if stream[:length] != expected[matched:matched + length] or length < len(stream):
+            return matched + common_prefix(stream[:length], expected[matched:matched + length]), False
+        matched += length
+    return matched, matched == len(expected)
+
+
+def common_prefix(a, b):
+    for i, (x, y) in enumerate(zip(a, b)):
+        if x != y:
+            return i
+    return min(len(a), len(b))
+
+
+def search_entry(entry, candidate_list):
+    segment, name, gz_path, bin_path = entry
+    with open(gz_path, "rb") as f:
+        original = f.read()
+    with open(bin_path, "rb") as f:
+        data = f.read()
+    # drop the length header & any alignment padding
+    _, leftovers = ru.runzip_with_leftovers(original)
+    expected = original[4:len(original) - len(leftovers)]
+
+    best, best_matched = None, -1
+    for params in candidate_list:
+        if params["compressor"] == "gzip":
+            matched, exact = match_gzip(data, expected, params["level"])
+        else:
+            matched, exact = match_zlib(data, expected, params["level"], params["strategy"], params["wbits"], params["memlevel"])
+        if exact:
+            return {"segment": segment, "name": name, "params": params, "matched": matched, "length": len(expected)}
+        if matched > best_matched:
+            best, best_matched = params, matched
+    return {"segment": segment, "name": name, "params": None, "best": best, "matched": best_matched, "length": len(expected)}
+
+
+def main(indir, pattern, candidate_list, jobs, outfile, mismatches_only):
+    entries = find_entries(indir, pattern)
+    if len(entries) == 0:
+        print(f"No rzip entries found in {indir}, run 'make extract' first")
+        return 1
+
+    start = time.perf_counter()
+    with ProcessPoolExecutor(jobs) as executor:
+        results = list(executor.map(search_entry, entries, [candidate_list] * len(entries), chunksize=8))
+    elapsed = time.perf_counter() - start
+
+    counts = {}
+    table = {}
+    for result in results:
+        key = f"{result['segment']}/{result['name']}"
+        table[key] = result["params"]
+        if result["params"]:
+            counts[describe(result["params"])] = counts.get(describe(result["params"]), 0) + 1
+            if not mismatches_only:
+                print(f"{key}: {describe(result['params'])}")
+        else:
+            counts["no match"] = counts.get("no match", 0) + 1
+            print(f"{key}: NO MATCH, best {describe(result['best'])} "
+                  f"({result['matched']}/{result['length']} bytes)")
+
+    print("")
+    for params, count in sorted(counts.items(), key=lambda x: -x[1]):
+        print(f"{count:>6}  {params}")
+    print(f"{len(results)} entries, {len(candidate_list)} candidate(s) each, {elapsed:.2f}s")
+
+    if outfile:
+        with open(outfile, "w") as f:
+            json.dump(table, f, indent=1, sort_keys=True)
+
+    return 0 if all(result["params"] for result in results) else 1
+
+
+def int_list(value):
+    return [int(x) for x in value.split(",")]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Find the compression settings that reproduce each rzip entry',
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('indir', type=str, nargs='?', default='assets',
+                        help="directory containing extracted rzip entries")
+    parser.add_argument('--segment', type=str,
+                        help="only search segments matching this glob, e.g. 'rzip/assets0*'")
+    parser.add_argument('--levels', type=int_list, default=[9, 8, 7, 6, 5, 4, 3, 2, 1],
+                        help="comma separated levels, in the order to try them")
+    parser.add_argument('--no-zlib', action='store_true',
+                        help="only try the bundled gzip")
+    parser.add_argument('--strategies', type=lambda x: x.split(","), default=list(STRATEGIES.keys()),
+                        help=f"comma separated zlib strategies ({','.join(STRATEGIES.keys())})")
+    parser.add_argument('--wbits', type=int_list, default=[15, 14, 13, 12, 11, 10, 9],
+                        help="comma separated zlib window sizes")
+    parser.add_argument('--memlevels', type=int_list, default=[8, 9],
+                        help="comma separated zlib memLevels")
+    parser.add_argument('--jobs', type=int,
+                        help='number of processes (default: cpu count)')
+    parser.add_argument('--output', type=str,
+                        help="write the per-entry parameter table as json")
+    parser.add_argument('--mismatches-only', action='store_true',
+                        help="only list entries that no candidate reproduces")
+    args = parser.parse_args()
+
+    for strategy in args.strategies:
+        if strategy not in STRATEGIES:
+            print(f"Unknown strategy '{strategy}'")
+            sys.exit(2)
+
+    candidate_list = candidates(args.levels, args.strategies, args.wbits, args.memlevels, not args.no_zlib)
+    sys.exit(main(args.indir, args.segment, candidate_list, args.jobs, args.output, args.mismatches_only))
@@ -0,0 +1,236 @@
+import argparse
+import glob
+import importlib
+import os
+import struct
+import subprocess
+import sys
+import time
+import zlib
+
+# Backends for the raw deflate streams inside rzip entries (4 byte big-endian
+# uncompressed length followed by the deflate payload).
+#
+# Inflating gives the same bytes whichever library does it, so the fastest one
+# that is installed is used: ISA-L (pip install isal), zlib-ng (pip install
+# zlib-ng), else the stdlib zlib. Deflating has to reproduce the ROM byte for
+# byte, which only the gzip binary in tools/ is known to do, so that stays the
+# default; the stdlib zlib can be picked for quick non-matching builds.
+#
+# RZIP_INFLATE / RZIP_DEFLATE select a backend by name, and
+# `rzipcodec.py bench` compares all of them on the extracted rzip entries.
+
+# fastest first
+INFLATERS = ["isal", "zlib-ng", "zlib"]
+DEFLATERS = ["gzip", "zlib"]
+
+
+class ZlibInflater:
+    name = "zlib"
+
+    def __init__(self):
+        self.module = zlib
+        self.error = zlib.error
+
+    def inflate(self, data):
+        d = self.module.decompressobj(wbits=-15)
+        return d.decompress(data), d.unused_data
+
+
+class ZlibNgInflater(ZlibInflater):
+    name = "zlib-ng"
+
+    def __init__(self):
+        self.module = importlib.import_module("zlib_ng.zlib_ng")
+        self.error = self.module.error
+
+
+class IsalInflater:
+    name = "isal"
+
+    def __init__(self):
+        # isal_zlib.decompressobj() does not keep unused_data, IgzipDecompressor does
+        self.module = importlib.import_module("isal.igzip_lib")
+        self.error = self.module.IsalError
+
+    def inflate(self, data):
+        d = self.module.IgzipDecompressor(flag=self.module.DECOMP_DEFLATE, hist_bits=15)
+        res = d.decompress(data)
+        return res, d.unused_data
+
+
+def gzip_args(level):
+    # force use of the gzip that sits along this file
+    gzip = os.path.join(os.path.dirname(os.path.realpath(__file__)), "gzip")
+    return [gzip, f"-{level}", "--no-name", "-c"]
+
+
+def gzip_to_rzip(gzip_compressed):
+    # swap 10 byte gzip header & 8 byte trailer for a 4 byte length header
+    uncompressed_length = struct.unpack("<i", gzip_compressed[-4:])[0]
+    return struct.pack(">i", uncompressed_length) + gzip_compressed[10:-8]
+
+
+class GzipDeflater:
+    name = "gzip"
+
+    def deflate(self, data, level):
+        res = subprocess.run(gzip_args(level), input=data, capture_output=True)
+        if res.returncode != 0:
+            return None
+        return gzip_to_rzip(res.stdout)
+
+    def deflate_file(self, path, level):
+        # gzip reads the file itself
+        res = subprocess.run(gzip_args(level) + [path], capture_output=True)
+        if res.returncode != 0:
+            return None
+        return gzip_to_rzip(res.stdout)
+
+
+class ZlibDeflater:
+    name = "zlib"
+
+    def deflate(self, data, level):
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+        return struct.pack(">I", len(data)) + compressor.compress(data) + compressor.flush()
+
+    def deflate_file(self, path, level):
+        with open(path, "rb") as f:
+            return self.deflate(f.read(), level)
+
+
+BACKENDS = {
+    "inflate": {"isal": IsalInflater, "zlib-ng": ZlibNgInflater, "zlib": ZlibInflater},
+    "deflate": {"gzip": GzipDeflater, "zlib": ZlibDeflater},
+}
+
+_loaded = {}
+
+
+def available(kind):
+    # {name: backend} of the installed backends, in order of preference
+    ret = {}
+    for name in INFLATERS if kind == "inflate" else DEFLATERS:
+        key = (kind, name)
+        if key not in _loaded:
+            try:
+                _loaded[key] = BACKENDS[kind][name]()
+            except ImportError:
+                _loaded[key] = None
+        if _loaded[key] is not None:
+            ret[name] = _loaded[key]
+    return ret
+
+
+def backend(kind, name=None):
+    # the named backend, else $RZIP_INFLATE/$RZIP_DEFLATE, else the preferred one installed
+    name = name or os.environ.get(f"RZIP_{kind.upper()}")
+    backends = available(kind)
+    if name is None:
+        return next(iter(backends.values()))
+    if name not in backends:
+        known = "not installed" if name in BACKENDS[kind] else "unknown"
+        raise ValueError(f"{kind} backend '{name}' is {known}, available: {', '.join(backends)}")
+    return backends[name]
+
+
+def inflate(data, name=None):
+    # (uncompressed bytes, whatever follows the deflate stream) of an rzip entry
+    inflater = backend("inflate", name)
+    try:
+        return inflater.inflate(data[4:])  # drop 4 byte length header
+    except inflater.error as e:
+        # callers catch zlib.error, whichever backend failed
+        if isinstance(e, zlib.error):
+            raise
+        raise zlib.error(str(e)) from e
+
+
+def deflate(data, level=9, name=None):
+    return backend("deflate", name).deflate(data, level)
+
+
+def deflate_file(path, level=9, name=None):
+    return backend("deflate", name).deflate_file(path, level)
+
+
+def load_entries(indir, limit):
+    # [(path, raw entry)] of the extracted compressed rzip entries, largest first
+    paths = sorted(glob.glob(os.path.join(indir, "rzip", "*", "*.gz")), key=os.path.getsize, reverse=True)
+    ret = []
+    for path in paths[:limit]:
+        with open(path, "rb") as f:
+            ret.append((path, f.read()))
+    return ret
+
+
+def time_best(run, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = run()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def bench(indir, limit, deflate_limit, repeat):
+    entries = load_entries(indir, limit)
+    if not entries:
+        print(f"No rzip entries found in {indir}, run 'make extract' first")
+        return 1
+    reference = [ZlibInflater().inflate(data[4:]) for _, data in entries]
+    size = sum(len(res) for res, _ in reference)
+    print(f"{len(entries)} entries, {size / 1e6:.2f} MB uncompressed")
+
+    default = backend("inflate").name
+    print(f"\n{'inflate':<10}{'seconds':>9}{'MB/s':>9}  result")
+    for name, inflater in available("inflate").items():
+        elapsed, results = time_best(lambda: [inflater.inflate(data[4:]) for _, data in entries], repeat)
+        status = "OK" if results == reference else "MISMATCH"
+        print(f"{name:<10}{elapsed:>9.3f}{size / elapsed / 1e6:>9.1f}  {status}{' (default)' if name == default else ''}")
+    for name in INFLATERS:
+        if name not in available("inflate"):
+            print(f"{name:<10}{'-':>9}{'-':>9}  not installed")
+
+    # deflating is far slower, so only on a subset, checked against the ROM's own bytes
+    subset = list(zip(entries, reference))[-deflate_limit:]
+    originals = [data[:len(data) - len(leftovers)] for (_, data), (_, leftovers) in subset]
+    plain = [res for _, (res, _) in subset]
+    size = sum(len(res) for res in plain)
+    default = backend("deflate").name
+    print(f"\n{'deflate':<10}{'seconds':>9}{'MB/s':>9}  matching ({len(subset)} entries, {size / 1e6:.2f} MB)")
+    for name, deflater in available("deflate").items():
+        elapsed, results = time_best(lambda: [deflater.deflate(res, 9) for res in plain], repeat)
+        matched = sum(1 for a, b in zip(results, originals) if a == b)
+        print(f"{name:<10}{elapsed:>9.3f}{size / elapsed / 1e6:>9.1f}  {matched}/{len(subset)}"
+              f"{' (default)' if name == default else ''}")
+    return 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='List & benchmark the rzip inflate/deflate backends',
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('list', help='show the installed backends & which ones are used')
+    bench_parser = subparsers.add_parser('bench', help='time every backend on the extracted rzip entries')
+    bench_parser.add_argument('indir', type=str, nargs='?', default='assets',
+                              help="directory containing extracted rzip entries")
+    bench_parser.add_argument('--entries', type=int, default=2000,
+                              help="number of entries to inflate, largest first")
+    bench_parser.add_argument('--deflate-entries', type=int, default=200,
+                              help="number of those entries to deflate")
+    bench_parser.add_argument('--repeat', type=int, default=3,
+                              help="runs per backend, the best is reported")
+    args = parser.parse_args()
+
+    try:
+        if args.command == 'list':
+            for kind in BACKENDS:
+                print(f"{kind}: {backend(kind).name} (installed: {', '.join(available(kind))})")
+            sys.exit(0)
+        sys.exit(bench(args.indir, args.entries, args.deflate_entries, args.repeat))
+    except ValueError as e:
+        print(e)
+        sys.exit(1)
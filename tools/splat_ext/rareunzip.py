@@ -1 +0,0 @@
-../rareunzip.py
\ No newline at end of file
@@ -9,7 +9,11 @@ from src.splat.util.options import opts
 import sys
 if opts.extensions_path not in sys.path:
     sys.path.append('tools/splat_ext')
+if 'tools' not in sys.path:
+    sys.path.append('tools')
 import rareunzip
+import catalog
+import profiling
 
 # Rare zip format:
 # 4 byte uncompressed length followed by deflate level 9 raw payload
@@ -118,6 +122,11 @@ class N64SegRzip(Segment):
         return opts.asset_path / "rzip" / self.name
 
     def split(self, rom_bytes):
+        with profiling.stage(f"rzip:{self.name}", "splat") as stage:
+            stage.bytes_in = self.rom_end - self.rom_start
+            stage.bytes_out = self.split_files(rom_bytes)
+
+    def split_files(self, rom_bytes):
         if self.has_subsegments:
             self.subsegments = self.parse_subsegments()
         else:
@@ -131,11 +140,15 @@ class N64SegRzip(Segment):
             f.write(rom_bytes[self.rom_start:self.rom_end])
 
         total_processed_bytes = 0
+        total_output_bytes = 0
         if len(self.subsegments) > 0:
             # add header segment bytes if applicable
             header_length = self.subsegments[0]["start"] - self.rom_start
             total_processed_bytes += header_length
 
+        rows = []
+        # relative to the asset dir the catalog sits in, e.g. rzip/assets00
+        segment = os.path.relpath(out_dir, opts.asset_path)
         for i, split_file in enumerate(self.subsegments):
             result = padding = None
 
@@ -168,10 +181,17 @@ class N64SegRzip(Segment):
             if result:
                 with open(os.path.join(out_dir,  filename + "." + extension), "wb") as f:
                     f.write(result)
+                total_output_bytes += len(result)
+            compressed = len(data) - len(padding or b"")
+            rows.append(catalog.entry_row(segment, i, split_file["name"], split_file["start"], split_file["end"],
+                                          pad, split_file["subtype"], compressed, result))
+
+        catalog.write_segment(os.path.join(opts.asset_path, catalog.CATALOG), segment, rows)
 
         expected_length = self.rom_end - self.rom_start
         if total_processed_bytes != expected_length:
             print("Processed %i bytes but section is %i bytes!" % (total_processed_bytes, expected_length))
+        return total_output_bytes
 
     def get_ld_files(self):
         return [(f"rzip/{self.name}/", f"{self.name}.bin", ".data", self.rom_start)]
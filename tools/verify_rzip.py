@@ -0,0 +1,125 @@
+import argparse
+import fnmatch
+import os
+import sys
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+import rarezip as rz
+import rareunzip as ru
+
+# Checks that every rzip entry written out by N64SegRzip.split recompresses
+# to the exact bytes found in the ROM, without having to build & link.
+
+def find_entries(indir, pattern=None):
+    entries = []
+    for root, dirs, files in os.walk(indir):
+        dirs.sort()
+        segment = os.path.relpath(root, indir)
+        if pattern and not fnmatch.fnmatch(segment, pattern):
+            continue
+        for file in sorted(files):
+            if not file.endswith(".gz"):
+                continue
+            name = file[:-3]
+            bin_path = os.path.join(root, name + ".bin")
+            if os.path.isfile(bin_path):
+                entries.append((segment, name, os.path.join(root, file), bin_path))
+    return entries
+
+
+def verify_entry(entry, level):
+    segment, name, gz_path, bin_path = entry
+    with open(gz_path, "rb") as f:
+        original = f.read()
+    # the raw slice includes any alignment padding, only compare the deflate stream
+    _, leftovers = ru.runzip_with_leftovers(original)
+    compressed_length = len(original) - len(leftovers)
+
+    start = time.perf_counter()
+    recompressed = rz.compress_file(bin_path, level=level)
+    elapsed = time.perf_counter() - start
+
+    result = {
+        "segment": segment,
+        "name": name,
+        "original": compressed_length,
+        "uncompressed": os.path.getsize(bin_path),
+        "elapsed": elapsed,
+    }
+    if recompressed is None:
+        result.update({"recompressed": None, "delta": None, "match": False})
+    else:
+        result.update({
+            "recompressed": len(recompressed),
+            "delta": len(recompressed) - compressed_length,
+            "match": recompressed == original[:compressed_length],
+        })
+    return result
+
+
+def verify_entries(entries, level=9, jobs=None):
+    # gzip runs out of process so threads are enough to keep every core busy
+    with ThreadPoolExecutor(max_workers=jobs or os.cpu_count()) as executor:
+        return list(executor.map(lambda entry: verify_entry(entry, level), entries))
+
+
+def format_result(result):
+    status = "OK" if result["match"] else "MISMATCH"
+    if result["recompressed"] is None:
+        return f"{result['segment']}/{result['name']}: ERROR calling gzip"
+    return (f"{result['segment']}/{result['name']}: {status:<8} "
+            f"{result['original']:>8} -> {result['recompressed']:>8} ({result['delta']:+d}) "
+            f"{result['uncompressed'] / max(result['elapsed'], 1e-9) / 1e6:7.2f} MB/s")
+
+
+def summarise(results, elapsed):
+    segments = {}
+    for result in results:
+        matched, total = segments.get(result["segment"], (0, 0))
+        segments[result["segment"]] = (matched + result["match"], total + 1)
+    print("")
+    for segment, (matched, total) in segments.items():
+        print(f"{segment:<24} {matched:>6}/{total:<6} {'OK' if matched == total else 'MISMATCH'}")
+
+    matched = sum(result["match"] for result in results)
+    uncompressed = sum(result["uncompressed"] for result in results)
+    print(f"{matched}/{len(results)} entries match, "
+          f"{uncompressed / 1e6:.2f} MB in {elapsed:.2f}s ({uncompressed / max(elapsed, 1e-9) / 1e6:.2f} MB/s)")
+
+
+def main(indir, pattern, level, jobs, mismatches_only):
+    entries = find_entries(indir, pattern)
+    if len(entries) == 0:
+        print(f"No rzip entries found in {indir}, run 'make extract' first")
+        return 1
+
+    start = time.perf_counter()
+    results = verify_entries(entries, level, jobs)
+    elapsed = time.perf_counter() - start
+
+    for result in results:
+        if not mismatches_only or not result["match"]:
+            print(format_result(result))
+    summarise(results, elapsed)
+
+    return 0 if all(result["match"] for result in results) else 1
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Recompress extracted rzip entries and compare against the originals',
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('indir', type=str, nargs='?', default='assets',
+                        help="directory containing extracted rzip entries")
+    parser.add_argument('--segment', type=str,
+                        help="only check segments matching this glob, e.g. 'rzip/assets0*'")
+    parser.add_argument('--level', type=int, default=9,
+                        help='gzip level (1-9)')
+    parser.add_argument('--jobs', type=int,
+                        help='number of parallel gzip processes (default: cpu count)')
+    parser.add_argument('--mismatches-only', action='store_true',
+                        help='only list entries that do not match')
+    args = parser.parse_args()
+
+    sys.exit(main(args.indir, args.segment, args.level, args.jobs, args.mismatches_only))